@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from datetime import date, datetime
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_SPOOL_FILE = 'logs/activity_spool.jsonl'
+
+
+class ActivityReporter:
+    """
+    Reports send counts to the WBL API from a background thread.
+
+    Counts accumulate in memory and are cut into reports every
+    `flush_interval` seconds or `flush_threshold` sends. Each report gets an
+    idempotency key and is written to a local spool before it is posted, and
+    only removed from the spool once the API accepts it. Failed posts are
+    retried with exponential backoff, and anything left over is retried on the
+    next run.
+
+    `api_logger` is the WBL API client, or a zero-argument callable returning
+    it; the callable is only called when there is a report to post, on the
+    reporter thread.
+    """
+
+    def __init__(
+        self,
+        api_logger,
+        spool_file: str = ACTIVITY_SPOOL_FILE,
+        flush_interval: float = 300.0,
+        flush_threshold: int = 500,
+        notes_template: str = "Mass email campaign sent to {count} leads from CSV",
+        max_backoff: float = 600.0
+    ):
+        self._api_logger = api_logger
+        self.spool_file = spool_file
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.notes_template = notes_template
+        self.max_backoff = max_backoff
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._failures = 0
+        self._next_attempt = 0.0
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._closed_result = None
+
+    def start(self) -> None:
+        """Start the background thread; it first drains reports left over from earlier runs"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="activity-reporter", daemon=True)
+            self._thread.start()
+
+    @property
+    def api_logger(self):
+        if callable(self._api_logger):
+            self._api_logger = self._api_logger()
+        return self._api_logger
+
+    def add(self, count: int = 1) -> None:
+        with self._lock:
+            self._pending += count
+
+    def _loop(self) -> None:
+        self.drain()
+        while not self._stop.wait(1.0):
+            with self._lock:
+                due = self._pending and (
+                    self._pending >= self.flush_threshold
+                    or time.monotonic() - self._last_flush >= self.flush_interval
+                )
+            if due:
+                self.flush()
+            elif time.monotonic() >= self._next_attempt and os.path.exists(self.spool_file):
+                self.drain()
+
+    def flush(self) -> None:
+        """Cut a report from the accumulated count, spool it and try to post everything spooled"""
+        self._spool_pending()
+        self.drain()
+
+    def _spool_pending(self) -> None:
+        with self._lock:
+            count, self._pending = self._pending, 0
+            self._last_flush = time.monotonic()
+        if not count:
+            return
+        report = {
+            "id": str(uuid.uuid4()),
+            "count": count,
+            "notes": self.notes_template.format(count=count),
+            "activity_date": date.today().isoformat(),
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with self._spool_lock:
+            directory = os.path.dirname(self.spool_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.spool_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(report) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_spool(self) -> List[dict]:
+        if not os.path.exists(self.spool_file):
+            return []
+        reports = []
+        with open(self.spool_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    reports.append(json.loads(line))
+                except ValueError:
+                    # Torn last line from a crash
+                    continue
+        return reports
+
+    def _write_spool(self, reports: List[dict]) -> None:
+        if not reports:
+            if os.path.exists(self.spool_file):
+                os.remove(self.spool_file)
+            return
+        temp_file = self.spool_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for report in reports:
+                f.write(json.dumps(report) + "\n")
+        os.replace(temp_file, self.spool_file)
+
+    def drain(self, force: bool = False) -> bool:
+        """Post spooled reports in order. Returns True when the spool is empty."""
+        if not force and time.monotonic() < self._next_attempt:
+            return False
+        # The spool lock only covers file access, never a post, so spooling a
+        # report (close() included) never waits on a slow API
+        with self._spool_lock:
+            reports = self._read_spool()
+        delivered_ids = set()
+        for report in reports:
+            delivered = self.api_logger.log_activity(
+                report["count"],
+                report["notes"],
+                activity_date=report["activity_date"],
+                idempotency_key=report["id"]
+            )
+            if not delivered:
+                self._failures += 1
+                delay = min(self.max_backoff, 2 ** self._failures) * random.uniform(0.5, 1.0)
+                self._next_attempt = time.monotonic() + delay
+                logger.warning(f"Activity report {report['id']} not delivered, "
+                               f"{len(reports) - len(delivered_ids)} spooled, retrying in {delay:.0f}s")
+                break
+            self._failures = 0
+            delivered_ids.add(report["id"])
+        with self._spool_lock:
+            # Reports spooled while posting stay; one posted twice by concurrent drains is deduplicated by its key
+            remaining = [report for report in self._read_spool() if report["id"] not in delivered_ids]
+            if delivered_ids:
+                self._write_spool(remaining)
+            return not remaining
+
+    def close(self, timeout: float = 10.0) -> bool:
+        """
+        Stop the background thread, spool what is left and make one last
+        delivery attempt, all within `timeout` seconds. Returns True when
+        nothing is left in the spool; otherwise the next run retries it.
+        """
+        if self._closed_result is not None:
+            return self._closed_result
+        deadline = time.monotonic() + timeout
+        self._stop.set()
+        if self._thread is not None:
+            # A drain stuck on the API keeps running in the background; it holds no lock meanwhile
+            self._thread.join(timeout)
+            self._thread = None
+        self._spool_pending()
+
+        result = []
+        final = threading.Thread(target=lambda: result.append(self.drain(force=True)), daemon=True)
+        final.start()
+        final.join(max(0.0, deadline - time.monotonic()))
+        self._closed_result = bool(result and result[0])
+        return self._closed_result
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from recipient_domains import DomainThrottle, domain_of
+from send_failures import ACCOUNT, TRANSIENT, CircuitBreaker, RetryPolicy, classify_failure
+from run_metrics import NULL_METRICS, RunMetrics
+
+logger = logging.getLogger(__name__)
+
+# How often a running batch checks the caller's stop event
+STOP_POLL_SECONDS = 0.1
+
+
+class AccountRateLimiter:
+    """Spaces out sends from one account by a minimum interval"""
+
+    def __init__(self, interval_seconds: float):
+        self.interval = max(0.0, float(interval_seconds))
+        self._next_allowed = 0.0
+
+    async def wait(self) -> float:
+        """Wait until the account may send again; returns the seconds spent waiting"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        waited = 0.0
+        if now < self._next_allowed:
+            waited = self._next_allowed - now
+            await asyncio.sleep(waited)
+            now = loop.time()
+        self._next_allowed = now + self.interval
+        return waited
+
+
+class _Batch:
+    """Shared queue of (lead, attempts made) plus bookkeeping for when every lead is finished"""
+
+    def __init__(self, leads: Iterable[dict], worker_count: int, on_failed: Callable):
+        self.queue = asyncio.Queue()
+        self.outstanding = 0
+        for lead in leads:
+            self.queue.put_nowait((lead, 0))
+            self.outstanding += 1
+        self.active_workers = worker_count
+        self.done = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.on_failed = on_failed
+        self._retries = {}    # TimerHandle -> lead waiting for its next attempt
+        self._errors = {}     # id(lead) -> last transient error, for leads that were tried
+        if not self.outstanding:
+            self._finish_all()
+
+    def _finish_all(self) -> None:
+        self.done.set()
+        for _ in range(self.active_workers):
+            self.queue.put_nowait(None)
+
+    def finish(self) -> None:
+        """One lead is done for good (sent or failed)"""
+        self.outstanding -= 1
+        if self.outstanding == 0:
+            self._finish_all()
+
+    def retry_later(self, lead: dict, attempt: int, delay: float, error: Exception) -> None:
+        loop = asyncio.get_running_loop()
+        handle = None
+
+        def requeue():
+            self._retries.pop(handle, None)
+            self.queue.put_nowait((lead, attempt))
+
+        handle = loop.call_later(delay, requeue)
+        self._retries[handle] = lead
+        self._errors[id(lead)] = error
+
+    def stop(self) -> None:
+        """Stop sending: workers return at their next check and every unsent lead is left as it is"""
+        self.stopping.set()
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        self.done.set()
+        for _ in range(self.active_workers):
+            self.queue.put_nowait(None)
+
+    async def unless_stopped(self, awaitable):
+        """Await `awaitable`, abandoning it if the batch is stopped first; check `stopping` afterwards"""
+        task = asyncio.ensure_future(awaitable)
+        stopper = asyncio.ensure_future(self.stopping.wait())
+        await asyncio.wait((task, stopper), return_when=asyncio.FIRST_COMPLETED)
+        stopper.cancel()
+        if not task.done():
+            task.cancel()
+            return None
+        return task.result()
+
+    def retire_worker(self, reason: str) -> None:
+        """
+        A worker's account is out for the run. If it was the last one, the
+        batch ends: leads waiting for a retry are failed with their last error,
+        and leads that were never tried are left unsent for the next run.
+        """
+        self.active_workers -= 1
+        if self.active_workers > 0 or self.done.is_set():
+            return
+        leftover = list(self._retries.values())
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:
+                leftover.append(item[0])
+        tried = [lead for lead in leftover if id(lead) in self._errors]
+        logger.warning(f"{reason}, {len(leftover) - len(tried)} unsent leads left for the next run")
+        for lead in tried:
+            self.on_failed(lead, self._errors[id(lead)])
+        self.done.set()
+
+
+async def _account_worker(
+    batch: _Batch,
+    account: dict,
+    limiter: AccountRateLimiter,
+    send: Callable,
+    on_sent: Callable,
+    executor: ThreadPoolExecutor,
+    retry_policy: RetryPolicy,
+    breaker: CircuitBreaker,
+    has_quota: Optional[Callable[[dict], bool]],
+    metrics: RunMetrics,
+    throttle: Optional[DomainThrottle]
+) -> int:
+    """Pull leads from the shared queue and send them from a single account"""
+    loop = asyncio.get_running_loop()
+    user = account['EMAIL_USER']
+    sent = 0
+    while True:
+        if batch.stopping.is_set():
+            return sent
+        if has_quota is not None and not has_quota(account):
+            logger.info(f"Account {user} has used its sending quota")
+            batch.retire_worker("No account has sending quota left")
+            return sent
+        if breaker.is_retired(user):
+            logger.warning(f"Account {user} retired for this run")
+            batch.retire_worker("No sending accounts left in rotation")
+            return sent
+        if breaker.is_open(user):
+            # Cool down, but wake up early if the batch finishes or stops meanwhile, and
+            # every second to see whether has_quota changed
+            try:
+                await asyncio.wait_for(batch.done.wait(), timeout=min(breaker.remaining(user), 1.0))
+            except asyncio.TimeoutError:
+                pass
+            if batch.done.is_set():
+                return sent
+            continue
+
+        item = await batch.unless_stopped(batch.queue.get())
+        if item is None:
+            return sent
+        lead, attempt = item
+
+        # Every wait before the send gives way to a stop; the lead then stays unsent
+        waited = await batch.unless_stopped(limiter.wait())
+        if waited:
+            metrics.observe("delay_sleep", waited, account=user)
+        if throttle is not None and not batch.stopping.is_set():
+            held = throttle.reserve(domain_of(lead["email"]))
+            if held > 0:
+                await batch.unless_stopped(asyncio.sleep(held))
+                metrics.observe("domain_wait", held)
+        if batch.stopping.is_set() or (has_quota is not None and not has_quota(account)):
+            batch.queue.put_nowait((lead, attempt))
+            continue
+        try:
+            # SMTP is blocking, so the actual send runs on a worker thread
+            sender_email = await loop.run_in_executor(executor, send, lead, account)
+        except Exception as e:
+            kind = classify_failure(e)
+            if kind == ACCOUNT:
+                cooldown = breaker.trip(user)
+                logger.warning(f"Account {user} out of rotation for {cooldown:.0f}s: {e}")
+                # Not the lead's fault, let another account take it
+                batch.queue.put_nowait((lead, attempt))
+            elif kind == TRANSIENT and retry_policy.should_retry(attempt + 1):
+                delay = retry_policy.delay(attempt + 1)
+                logger.info(f"Transient failure, retrying in {delay:.0f}s: {e}")
+                batch.retry_later(lead, attempt + 1, delay, e)
+            else:
+                # Callbacks run on the event loop thread, so they never race each other
+                batch.on_failed(lead, e)
+                batch.finish()
+        else:
+            breaker.record_success(user)
+            on_sent(lead, sender_email)
+            sent += 1
+            batch.finish()
+
+
+async def _watch_stop(batch: _Batch, stop: threading.Event) -> None:
+    """Stop the batch once `stop` is set (it is set from a signal handler or another thread)"""
+    while not batch.done.is_set():
+        if stop.is_set():
+            logger.info("Stop requested, leaving unsent leads queued")
+            batch.stop()
+            return
+        try:
+            await asyncio.wait_for(batch.done.wait(), timeout=STOP_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def send_all(
+    leads: Iterable[dict],
+    accounts: List[dict],
+    send: Callable,
+    on_sent: Callable,
+    on_failed: Callable,
+    default_delay: float = 0.0,
+    retry_policy: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    has_quota: Optional[Callable[[dict], bool]] = None,
+    metrics: Optional[RunMetrics] = None,
+    throttle: Optional[DomainThrottle] = None,
+    stop: Optional[threading.Event] = None
+) -> int:
+    """
+    Send leads from every account in parallel.
+
+    Each account gets its own worker and rate limiter (DELAY_SECONDS in the
+    account entry, falling back to default_delay). Workers share one lead queue.
+    send(lead, account) is blocking and returns the sender address; on_sent and
+    on_failed are called on the event loop thread. Transient failures are
+    retried per retry_policy, and account-level failures trip the account's
+    circuit breaker and hand the lead to another account. A worker stops once
+    has_quota(account) returns False; when every worker has stopped, leads
+    that were never tried are left unsent. With a throttle, every send also waits
+    for its recipient domain's slot. Time spent pacing is recorded in metrics
+    as "delay_sleep" and "domain_wait". Once `stop` is set, no further send
+    starts: workers give up whatever they are waiting on, and the leads not
+    yet sent are left as they are. Returns the number of successful sends.
+    """
+    if not accounts:
+        return 0
+    retry_policy = retry_policy or RetryPolicy()
+    breaker = breaker or CircuitBreaker()
+
+    batch = _Batch(leads, len(accounts), on_failed)
+    with ThreadPoolExecutor(max_workers=len(accounts), thread_name_prefix="smtp") as executor:
+        workers = [
+            _account_worker(
+                batch,
+                account,
+                AccountRateLimiter(account.get("DELAY_SECONDS", default_delay)),
+                send,
+                on_sent,
+                executor,
+                retry_policy,
+                breaker,
+                has_quota,
+                metrics or NULL_METRICS,
+                throttle
+            )
+            for account in accounts
+        ]
+        watcher = asyncio.ensure_future(_watch_stop(batch, stop)) if stop is not None else None
+        results = await asyncio.gather(*workers)
+        if watcher is not None:
+            watcher.cancel()
+
+    logger.info(f"Async send finished: {sum(results)} sent across {len(accounts)} accounts")
+    return sum(results)
@@ -0,0 +1,207 @@
+"""
+Local stub of the WBL API endpoints the bot uses.
+
+    python benchmarks/api_stub.py --port 8765 --latency 0.05 --error-rate 0.1
+
+Serves POST /api/login, GET /api/job-types, POST /api/job_activity_logs,
+POST /api/vendor_contact and GET /api/leads_unsubscribe. Point WBL_API_URL at http://127.0.0.1:<port>/api.
+"""
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+JOB_UNIQUE_ID = "leads_mass_email_sender"
+
+
+def make_token(lifetime: float = 3600.0) -> str:
+    """Unsigned JWT-shaped token carrying an exp claim (the bot never verifies the signature)"""
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode({'sub': 'bench', 'exp': int(time.time() + lifetime)})}.c2lnbmF0dXJl"
+
+
+class APIStub:
+    """
+    Threaded HTTP stub. Every request waits `latency` seconds; `error_rate`
+    of the non-login requests fail with 503. Request counts per path are kept
+    in `counts`, and activity logs are deduplicated by Idempotency-Key.
+    vendor_contact takes a list of contacts (per-record errors for contacts
+    without an email) unless bulk_contacts is False, in which case it only
+    takes one contact per request, like older servers.
+    Addresses passed to add_unsubscribes() are served from leads_unsubscribe
+    in pages, with the list length as cursor and ETag.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        token_lifetime: float = 3600.0,
+        seed: Optional[int] = None,
+        bulk_contacts: bool = True
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.token_lifetime = token_lifetime
+        self.counts: Dict[str, int] = {}
+        self.activity_logs = {}
+        self.vendor_contacts = []
+        self.bulk_contacts = bulk_contacts
+        self._contact_keys = set()
+        self.unsubscribes = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def add_unsubscribes(self, emails) -> None:
+        with self._lock:
+            self.unsubscribes.extend(emails)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return self.rfile.read(length) if length else b""
+
+            def _unsubscribes(self, query: dict) -> None:
+                with stub._lock:
+                    emails = list(stub.unsubscribes)
+                etag = f'"{len(emails)}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start = int(query.get("since", ["0"])[0])
+                if start > len(emails):
+                    return self._send(410, {"detail": "cursor expired"})
+                end = start + int(query.get("limit", ["1000"])[0])
+                body = {"emails": emails[start:end], "next_cursor": str(min(end, len(emails))), "has_more": end < len(emails)}
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _vendor_contact(self, payload) -> None:
+                if isinstance(payload, list) and not stub.bulk_contacts:
+                    return self._send(422, {"detail": "expected a single contact"})
+                contacts = payload if isinstance(payload, list) else [payload]
+                errors = [{"index": i, "detail": "email is required"} for i, c in enumerate(contacts) if not c.get("email")]
+                if errors and not isinstance(payload, list):
+                    return self._send(422, {"detail": "email is required"})
+                accepted = [c for c in contacts if c.get("email")]
+                key = self.headers.get("Idempotency-Key")
+                with stub._lock:
+                    if not key or key not in stub._contact_keys:
+                        stub.vendor_contacts.extend(accepted)
+                    if key:
+                        stub._contact_keys.add(key)
+                return self._send(207 if errors else 201, {"created": len(accepted), "errors": errors})
+
+            def _route(self, method: str) -> None:
+                path, _, query = self.path.partition("?")
+                path = path.rstrip("/")
+                body = self._body()
+                with stub._lock:
+                    stub.counts[f"{method} {path}"] = stub.counts.get(f"{method} {path}", 0) + 1
+                    fail = path != "/api/login" and stub._random.random() < stub.error_rate
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if fail:
+                    return self._send(503, {"detail": "injected failure"})
+
+                if method == "POST" and path == "/api/login":
+                    return self._send(200, {"access_token": make_token(stub.token_lifetime), "token_type": "bearer"})
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    return self._send(401, {"detail": "Not authenticated"})
+
+                if method == "GET" and path == "/api/job-types":
+                    return self._send(200, [{"id": 1, "unique_id": "other_job"}, {"id": 42, "unique_id": JOB_UNIQUE_ID}])
+                if method == "POST" and path == "/api/job_activity_logs":
+                    key = self.headers.get("Idempotency-Key") or f"anonymous-{len(stub.activity_logs)}"
+                    with stub._lock:
+                        if key not in stub.activity_logs:
+                            stub.activity_logs[key] = json.loads(body or b"{}")
+                        activity_id = list(stub.activity_logs).index(key) + 1
+                    return self._send(200, {"id": activity_id})
+                if method == "POST" and path == "/api/vendor_contact":
+                    return self._vendor_contact(json.loads(body or b"{}"))
+                if method == "GET" and path == "/api/leads_unsubscribe":
+                    return self._unsubscribes(parse_qs(query))
+                return self._send(404, {"detail": "Not Found"})
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+        return Handler
+
+    def start(self) -> int:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="api-stub", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Local WBL API stub for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-lifetime", type=float, default=3600.0)
+    parser.add_argument("--single-contacts", action="store_true", help="reject bulk vendor_contact uploads")
+    args = parser.parse_args(argv)
+
+    stub = APIStub(args.host, args.port, args.latency, args.error_rate, args.token_lifetime, bulk_contacts=not args.single_contacts)
+    stub.start()
+    print(f"WBL API stub at {stub.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
+        print(json.dumps(stub.counts, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,73 @@
+"""
+Runs one campaign in the current directory and writes timing results as JSON.
+Started by run_benchmarks.py in a fresh process per scenario; not meant to be run by hand.
+
+    python bench_driver.py <result.json>
+"""
+import sys
+import json
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes() -> int:
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def main(argv):
+    result_path = argv[0]
+    started = time.perf_counter()
+    import main as bot
+    import_seconds = time.perf_counter() - started
+
+    latencies = []
+    select_seconds = []
+    original_send = bot.send_email
+    original_select = bot.select_leads
+
+    def timed_send(*args, **kwargs):
+        begin = time.perf_counter()
+        try:
+            return original_send(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - begin)
+
+    def timed_select(*args, **kwargs):
+        begin = time.perf_counter()
+        try:
+            return original_select(*args, **kwargs)
+        finally:
+            select_seconds.append(time.perf_counter() - begin)
+
+    bot.send_email = timed_send
+    bot.select_leads = timed_select
+
+    run_started = time.perf_counter()
+    bot.run()
+    run_seconds = time.perf_counter() - run_started
+
+    with open(bot.LOG_FILE, 'r', encoding='utf-8') as f:
+        sent = max(0, sum(1 for _ in f) - 1)
+
+    with open(result_path, 'w') as f:
+        json.dump({
+            "import_seconds": import_seconds,
+            "select_seconds": sum(select_seconds),
+            "run_seconds": run_seconds,
+            "sent": sent,
+            "latencies": latencies,
+            "peak_rss_bytes": peak_rss_bytes()
+        }, f)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,117 @@
+"""
+Regression check: leads whose address needed cleaning are mailed once, not on every run.
+
+    python benchmarks/check_resend.py --modes serial,async --runs 3
+
+Runs main.run() repeatedly in one working directory against the local SMTP
+sink and WBL API stub, with lead addresses like "<Foo@Gmail.COM>" and
+"mailto:bar@example.org". Fails if any address is delivered more than once
+or a sent row is not flagged in the CSV afterwards.
+"""
+import os
+import csv
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from api_stub import APIStub
+from run_benchmarks import self_signed_cert
+from smtp_sink import SMTPSink
+
+# (address as it appears in the lead file, address it is delivered to)
+LEADS = [
+    ("<Foo@Gmail.COM>", "Foo@gmail.com"),
+    ("mailto:bar@example.org", "bar@example.org"),
+    ("baz@example.org.", "baz@example.org"),
+    ("  Qux@Example.ORG ", "Qux@example.org"),
+    ("user@bücher.example", "user@xn--bcher-kva.example"),
+    ("plain@example.com", "plain@example.com"),
+]
+
+
+def run_mode(mode: str, runs: int, smtp_port: int, api_url: str, sink: SMTPSink) -> bool:
+    workdir = tempfile.mkdtemp(prefix=f"wbl_resend_{mode}_")
+    try:
+        leads_path = os.path.join(workdir, "leads_emails.csv")
+        with open(leads_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["full_name", "email", "massemail_unsubscribe", "massemail_email_sent"])
+            for i, (raw, _) in enumerate(LEADS):
+                writer.writerow([f"Lead {i}", raw, "0", "0"])
+        with open(os.path.join(workdir, "email_accounts.json"), 'w') as f:
+            json.dump([{"EMAIL_USER": "check@example.com", "EMAIL_PASS": "check"}], f)
+
+        env = dict(os.environ)
+        env.update({
+            "PYTHONPATH": REPO_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+            "EMAIL_ACCOUNTS_FILE": "email_accounts.json",
+            "SMTP_SERVER": "127.0.0.1",
+            "SMTP_PORT": str(smtp_port),
+            "EMAIL_DELAY_SECONDS": "0",
+            "SEND_MODE": mode,
+            "CAMPAIGN_FILE": os.path.join(REPO_DIR, "templates", "campaign.json"),
+            "WBL_API_URL": api_url,
+            "WBL_API_TOKEN": "",
+            "WBL_EMAIL": "check@example.com",
+            "WBL_PASSWORD": "check",
+            "DOMAIN_RATE_PER_MINUTE": "0",
+            "UNSUBSCRIBE_SYNC": "false",
+            # Fold the journal into the CSV after every run, so the CSV flags are checked too
+            "JOURNAL_COMPACT_THRESHOLD": "1",
+        })
+
+        sink.stats.recipients.clear()
+        for run in range(runs):
+            completed = subprocess.run(
+                [sys.executable, "-c", "import main; main.run()"],
+                cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+            )
+            if completed.returncode != 0:
+                print(f"{mode}: run {run + 1} failed:\n{completed.stderr[-2000:]}")
+                return False
+
+        ok = True
+        for raw, delivered in LEADS:
+            count = sink.stats.recipients[delivered]
+            if count != 1:
+                print(f"{mode}: {raw!r} was delivered {count} times in {runs} runs")
+                ok = False
+        with open(leads_path, 'r', newline='', encoding='utf-8') as f:
+            unflagged = [row["email"] for row in csv.DictReader(f) if row["massemail_email_sent"] != "1"]
+        if unflagged:
+            print(f"{mode}: not flagged as sent in the CSV: {unflagged}")
+            ok = False
+        print(f"{mode}: {'ok' if ok else 'FAILED'} ({sum(sink.stats.recipients.values())} messages in {runs} runs)")
+        return ok
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check that cleaned lead addresses are not mailed again")
+    parser.add_argument("--modes", default="serial,async", help="comma separated SEND_MODE values")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    cert, key = self_signed_cert()
+    sink = SMTPSink(tls_cert=cert, tls_key=key)
+    stub = APIStub()
+    smtp_port = sink.start()
+    stub.start()
+    try:
+        results = [run_mode(mode, args.runs, smtp_port, stub.url, sink) for mode in args.modes.split(",")]
+    finally:
+        sink.stop()
+        stub.stop()
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
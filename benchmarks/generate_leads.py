@@ -0,0 +1,67 @@
+"""
+Generate a synthetic leads_emails.csv shaped like the real export.
+
+    python benchmarks/generate_leads.py 1000000 -o /tmp/leads_1m.csv
+"""
+import sys
+import csv
+import random
+import argparse
+from datetime import date, timedelta
+
+COLUMNS = [
+    "id", "full_name", "email", "phone", "linkedin_id", "company_name", "location",
+    "status", "Entry Date", "Closed Date", "notes", "massemail_unsubscribe", "massemail_email_sent"
+]
+
+DOMAINS = ["gmail.com"] * 40 + ["yahoo.com"] * 15 + ["outlook.com"] * 10 + ["hotmail.com"] * 5 + [
+    "icloud.com", "aol.com", "protonmail.com", "example.org", "acme-corp.com", "techstart.io",
+    "datalabs.ai", "university.edu", "consulting.co", "mail.ru"
+] * 3
+
+
+def generate_leads(path: str, rows: int, sent_rate: float = 0.3, unsubscribe_rate: float = 0.02, seed: int = 7) -> None:
+    """Write `rows` leads; roughly sent_rate already sent and unsubscribe_rate unsubscribed, a few invalid addresses"""
+    rng = random.Random(seed)
+    start = date(2023, 1, 1)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for i in range(rows):
+            first = f"first{i % 5000}"
+            last = f"last{i // 5000}"
+            email = f"{first}.{last}.{i}@{rng.choice(DOMAINS)}"
+            if rng.random() < 0.005:
+                email = f"{first}.{last}.{i}"  # no @, skipped by the bot
+            entry = start + timedelta(days=rng.randrange(1000))
+            writer.writerow([
+                i,
+                f"{first.title()} {last.title()}",
+                email,
+                f"+1-555-{i % 10000:04d}",
+                f"linkedin.com/in/{first}-{last}",
+                f"Company {i % 997}",
+                rng.choice(["Dublin, CA", "San Jose, CA", "Austin, TX", "New York, NY", "Remote"]),
+                rng.choice(["open", "contacted", "closed"]),
+                entry.isoformat(),
+                "",
+                "synthetic lead for benchmarks",
+                "1" if rng.random() < unsubscribe_rate else "0",
+                "1" if rng.random() < sent_rate else "0",
+            ])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Generate synthetic lead CSVs")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("-o", "--output", default="leads_emails.csv")
+    parser.add_argument("--sent-rate", type=float, default=0.3)
+    parser.add_argument("--unsubscribe-rate", type=float, default=0.02)
+    args = parser.parse_args(argv)
+    generate_leads(args.output, args.rows, args.sent_rate, args.unsubscribe_rate)
+    print(f"Wrote {args.rows} leads to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""
+Memory held per selected lead: full csv.DictReader rows against Lead records.
+
+    python benchmarks/lead_memory.py --rows 1000000 --limit 500000
+
+Selects `limit` eligible leads from a synthetic lead file both ways and
+reports the traced memory the batch holds and the peak during selection.
+"""
+import os
+import sys
+import argparse
+import tracemalloc
+from itertools import islice
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from lead_store import iter_eligible_leads, select_leads
+from lead_priority import priority_key
+from run_benchmarks import cached_leads
+
+
+def measure(select) -> dict:
+    """Memory still held by the selected batch, and the peak while selecting it"""
+    tracemalloc.start()
+    try:
+        batch = select()
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"leads": len(batch), "held": held, "peak": peak}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Memory per selected lead, dict rows vs Lead records")
+    parser.add_argument("--rows", type=int, default=200000, help="size of the synthetic lead file")
+    parser.add_argument("--limit", type=int, default=100000, help="leads selected")
+    parser.add_argument("--priority", default="never_contacted,recent", help="LEAD_PRIORITY for the ranked run")
+    args = parser.parse_args(argv)
+
+    path = cached_leads(args.rows)
+    scenarios = [
+        ("dict rows, file order", lambda: list(islice(iter_eligible_leads(path), args.limit))),
+        ("Lead records, file order", lambda: select_leads(path, args.limit)),
+        (f"Lead records, {args.priority}", lambda: select_leads(path, args.limit, key=priority_key(args.priority))),
+    ]
+
+    header = f"{'scenario':<40} {'leads':>9} {'held MB':>9} {'peak MB':>9} {'bytes/lead':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, select in scenarios:
+        result = measure(select)
+        per_lead = result["held"] / result["leads"] if result["leads"] else 0
+        print(f"{name:<40} {result['leads']:>9} {result['held'] / 2 ** 20:>9.1f} "
+              f"{result['peak'] / 2 ** 20:>9.1f} {per_lead:>11.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,249 @@
+"""
+Offline benchmarks: runs main.run() against a local SMTP sink and WBL API stub.
+
+    python benchmarks/run_benchmarks.py --rows 1000,100000,1000000 --modes serial,async
+    python benchmarks/run_benchmarks.py --save before
+    python benchmarks/run_benchmarks.py --compare benchmarks/baselines/before.json
+    python benchmarks/run_benchmarks.py --rows 1000 --startup-budget 0.5
+
+Reports messages/second, p50/p99 per-send latency, peak RSS and startup time
+(import of main plus lead selection) per scenario.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+sys.path.insert(0, BENCH_DIR)
+
+from api_stub import APIStub
+from generate_leads import generate_leads
+from smtp_sink import SMTPSink
+
+# metric -> True when higher is better
+METRICS = {
+    "messages_per_second": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "startup_seconds": False,
+    "peak_rss_mb": False,
+}
+
+
+def percentile(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def cached_leads(rows: int) -> str:
+    """Generated lead files are reused between runs, they take a while at millions of rows"""
+    path = os.path.join(tempfile.gettempdir(), f"wbl_bench_leads_{rows}.csv")
+    if not os.path.exists(path):
+        print(f"Generating {rows} leads...")
+        generate_leads(path, rows)
+    return path
+
+
+def self_signed_cert():
+    """The bot always issues STARTTLS, so the sink needs a certificate; one is made with openssl and reused"""
+    cert = os.path.join(tempfile.gettempdir(), "wbl_bench_cert.pem")
+    key = os.path.join(tempfile.gettempdir(), "wbl_bench_key.pem")
+    if not (os.path.exists(cert) and os.path.exists(key)):
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "365",
+             "-subj", "/CN=127.0.0.1", "-keyout", key, "-out", cert],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    return cert, key
+
+
+def run_scenario(rows: int, mode: str, accounts: int, smtp_port: int, api_url: str, extra_env: dict) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"wbl_bench_{mode}_{rows}_")
+    try:
+        shutil.copyfile(cached_leads(rows), os.path.join(workdir, "leads_emails.csv"))
+        with open(os.path.join(workdir, "email_accounts.json"), 'w') as f:
+            json.dump([{"EMAIL_USER": f"bench{i}@example.com", "EMAIL_PASS": "bench"} for i in range(accounts)], f)
+
+        env = dict(os.environ)
+        env.update({
+            "PYTHONPATH": REPO_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+            "EMAIL_ACCOUNTS_FILE": "email_accounts.json",
+            "SMTP_SERVER": "127.0.0.1",
+            "SMTP_PORT": str(smtp_port),
+            "REPLY_TO_EMAIL": "reply@example.com",
+            "EMAIL_DELAY_SECONDS": "0",
+            "SEND_MODE": mode,
+            "CAMPAIGN_FILE": os.path.join(REPO_DIR, "templates", "campaign.json"),
+            "WBL_API_URL": api_url,
+            "WBL_API_TOKEN": "",
+            "WBL_EMAIL": "bench@example.com",
+            "WBL_PASSWORD": "bench",
+            "DEFAULT_DAILY_LIMIT": "1000000",
+            "DEFAULT_HOURLY_LIMIT": "1000000",
+            "RETRY_BASE_DELAY": "0.05",
+            # The sink has no provider limits; measure throttling with --env DOMAIN_RATE_PER_MINUTE=...
+            "DOMAIN_RATE_PER_MINUTE": "0",
+        })
+        env.update(extra_env)
+
+        result_path = os.path.join(workdir, "result.json")
+        completed = subprocess.run(
+            [sys.executable, os.path.join(BENCH_DIR, "bench_driver.py"), result_path],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"{mode}/{rows} failed:\n{completed.stderr[-2000:]}")
+        with open(result_path) as f:
+            raw = json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Sharded sends happen in child processes, so only serial and async record latencies
+    latencies_ms = [value * 1000 for value in raw["latencies"]]
+    p50, p99 = percentile(latencies_ms, 0.50), percentile(latencies_ms, 0.99)
+    return {
+        "rows": rows,
+        "mode": mode,
+        "sent": raw["sent"],
+        "run_seconds": round(raw["run_seconds"], 4),
+        "messages_per_second": round(raw["sent"] / raw["run_seconds"], 2) if raw["run_seconds"] else 0.0,
+        "p50_ms": round(p50, 3) if p50 is not None else None,
+        "p99_ms": round(p99, 3) if p99 is not None else None,
+        "startup_seconds": round(raw["import_seconds"] + raw["select_seconds"], 4),
+        "import_seconds": round(raw["import_seconds"], 4),
+        "select_seconds": round(raw["select_seconds"], 4),
+        "peak_rss_mb": round(raw["peak_rss_bytes"] / (1024 * 1024), 1),
+    }
+
+
+def _ms(value) -> str:
+    return f"{value:>10.2f}" if value is not None else f"{'-':>10}"
+
+
+def print_results(results) -> None:
+    header = f"{'scenario':<22}{'sent':>6}{'msg/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'startup s':>11}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['mode'] + '/' + str(r['rows']):<22}{r['sent']:>6}{r['messages_per_second']:>10.1f}"
+            f"{_ms(r['p50_ms'])}{_ms(r['p99_ms'])}{r['startup_seconds']:>11.3f}{r['peak_rss_mb']:>9.1f}"
+        )
+
+
+def compare(results, baseline_path: str, tolerance: float) -> bool:
+    """Print changes against a saved baseline; returns False if any metric regressed beyond tolerance"""
+    with open(baseline_path) as f:
+        baseline = {f"{r['mode']}/{r['rows']}": r for r in json.load(f)["results"]}
+
+    ok = True
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%}):")
+    for r in results:
+        key = f"{r['mode']}/{r['rows']}"
+        before = baseline.get(key)
+        if before is None:
+            print(f"  {key}: no baseline")
+            continue
+        changes = []
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), r.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            ok = ok and not regressed
+            changes.append(f"{metric} {old:g} -> {new:g} ({change:+.1%}){' REGRESSION' if regressed else ''}")
+        print(f"  {key}: " + "; ".join(changes))
+    return ok
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the leads email sender")
+    parser.add_argument("--rows", default="1000,100000", help="comma separated lead file sizes")
+    parser.add_argument("--modes", default="serial,async", help="comma separated SEND_MODE values")
+    parser.add_argument("--accounts", type=int, default=4)
+    parser.add_argument("--smtp-latency", type=float, default=0.005, help="seconds per message in the sink")
+    parser.add_argument("--transient-rate", type=float, default=0.0)
+    parser.add_argument("--permanent-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--api-error-rate", type=float, default=0.0)
+    parser.add_argument("--tls-cert", help="certificate for the sink's STARTTLS (default: generated with openssl)")
+    parser.add_argument("--tls-key")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the bot")
+    parser.add_argument("--save", metavar="NAME", help="save results to benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="FILE", help="compare with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--startup-budget", type=float, metavar="SECONDS", help="fail if any scenario starts slower")
+    args = parser.parse_args(argv)
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    if not (args.tls_cert and args.tls_key):
+        args.tls_cert, args.tls_key = self_signed_cert()
+    sink = SMTPSink(
+        latency=args.smtp_latency,
+        transient_rate=args.transient_rate,
+        permanent_rate=args.permanent_rate,
+        disconnect_rate=args.disconnect_rate,
+        tls_cert=args.tls_cert,
+        tls_key=args.tls_key,
+        seed=1
+    )
+    stub = APIStub(latency=args.api_latency, error_rate=args.api_error_rate, seed=1)
+    smtp_port = sink.start()
+    stub.start()
+
+    results = []
+    try:
+        for rows in [int(value) for value in args.rows.split(",")]:
+            for mode in args.modes.split(","):
+                print(f"Running {mode} with {rows} leads...")
+                results.append(run_scenario(rows, mode, args.accounts, smtp_port, stub.url, extra_env))
+    finally:
+        sink.stop()
+        stub.stop()
+
+    print()
+    print_results(results)
+    print(f"\nSMTP sink: {sink.stats.messages} messages, {sink.stats.connections} connections, {sink.stats.logins} logins")
+    print(f"API stub: {json.dumps(stub.counts)}")
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, 'w') as f:
+            json.dump({
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "settings": vars(args),
+                "results": results
+            }, f, indent=2)
+        print(f"Saved baseline to {path}")
+
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        return 1
+    if args.startup_budget is not None:
+        over = [r for r in results if r["startup_seconds"] > args.startup_budget]
+        for r in over:
+            print(f"Startup over budget: {r['mode']} with {r['rows']} leads took {r['startup_seconds']:.3f}s "
+                  f"(budget {args.startup_budget:.3f}s)")
+        if over:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,205 @@
+"""
+Local SMTP sink for benchmarks: accepts any login, discards messages.
+
+    python benchmarks/smtp_sink.py --port 2525 --latency 0.01 --transient-rate 0.02
+
+STARTTLS is offered only when --tls-cert/--tls-key are given.
+"""
+import ssl
+import sys
+import asyncio
+import random
+import argparse
+import threading
+from collections import Counter
+from typing import Optional
+
+
+class SinkStats:
+
+    def __init__(self):
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+        self.bytes = 0
+        self.rejected = 0
+        self.recipients = Counter()    # address -> messages delivered to it
+
+
+class SMTPSink:
+    """
+    Minimal ESMTP server (EHLO, STARTTLS, AUTH, MAIL, RCPT, DATA, RSET, NOOP, QUIT).
+
+    `latency` seconds are added before the reply to every message, and errors
+    are injected at the given rates: transient 451 on DATA, permanent 550 on
+    RCPT, and 421 + disconnect on MAIL.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        transient_rate: float = 0.0,
+        permanent_rate: float = 0.0,
+        disconnect_rate: float = 0.0,
+        tls_cert: Optional[str] = None,
+        tls_key: Optional[str] = None,
+        seed: Optional[int] = None
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.transient_rate = transient_rate
+        self.permanent_rate = permanent_rate
+        self.disconnect_rate = disconnect_rate
+        self.stats = SinkStats()
+        self._random = random.Random(seed)
+        self._tls = None
+        if tls_cert and tls_key:
+            self._tls = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self._tls.load_cert_chain(tls_cert, tls_key)
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def _capabilities(self, secure: bool):
+        caps = ["sink", "PIPELINING", "8BITMIME", "SIZE 52428800", "AUTH PLAIN LOGIN"]
+        if self._tls and not secure:
+            caps.insert(1, "STARTTLS")
+        return caps
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats.connections += 1
+        secure = False
+        envelope = []
+
+        async def reply(line: str) -> None:
+            writer.write((line + "\r\n").encode())
+            await writer.drain()
+
+        try:
+            await reply("220 sink ESMTP ready")
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                line = raw.decode("utf-8", "replace").rstrip("\r\n")
+                verb = line.split(" ", 1)[0].upper()
+
+                if verb in ("EHLO", "HELO"):
+                    caps = self._capabilities(secure)
+                    lines = [f"250-{cap}" for cap in caps[:-1]] + [f"250 {caps[-1]}"]
+                    writer.write(("\r\n".join(lines) + "\r\n").encode())
+                    await writer.drain()
+                elif verb == "STARTTLS" and self._tls and not secure:
+                    await reply("220 ready to start TLS")
+                    await writer.start_tls(self._tls)
+                    secure = True
+                elif verb == "AUTH":
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[1].upper() == "LOGIN":
+                        # Username and password prompts (base64 "Username:" / "Password:")
+                        if len(parts) < 3:
+                            await reply("334 VXNlcm5hbWU6")
+                            await reader.readline()
+                        await reply("334 UGFzc3dvcmQ6")
+                        await reader.readline()
+                    elif len(parts) < 3:
+                        await reply("334 ")
+                        await reader.readline()
+                    self.stats.logins += 1
+                    await reply("235 2.7.0 Authentication successful")
+                elif verb == "MAIL":
+                    if self._random.random() < self.disconnect_rate:
+                        await reply("421 4.3.2 Service shutting down")
+                        break
+                    envelope = []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    if self._random.random() < self.permanent_rate:
+                        self.stats.rejected += 1
+                        await reply("550 5.1.1 No such user")
+                    else:
+                        envelope.append(line.split(":", 1)[-1].strip().strip("<>"))
+                        await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    size = 0
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk == b".\r\n":
+                            break
+                        size += len(chunk)
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    if self._random.random() < self.transient_rate:
+                        self.stats.rejected += 1
+                        await reply("451 4.3.0 Temporary failure, try again")
+                    else:
+                        self.stats.messages += 1
+                        self.stats.bytes += size
+                        self.stats.recipients.update(envelope)
+                        await reply("250 OK queued")
+                elif verb in ("RSET", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self) -> int:
+        """Serve on a background thread; returns the bound port"""
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            self._ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name="smtp-sink", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self.port
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Local SMTP sink for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added before each DATA reply")
+    parser.add_argument("--transient-rate", type=float, default=0.0)
+    parser.add_argument("--permanent-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--tls-cert")
+    parser.add_argument("--tls-key")
+    args = parser.parse_args(argv)
+
+    sink = SMTPSink(
+        args.host, args.port, args.latency, args.transient_rate, args.permanent_rate,
+        args.disconnect_rate, args.tls_cert, args.tls_key
+    )
+    print(f"SMTP sink listening on {args.host}:{sink.start()}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        sink.stop()
+        print(f"Messages: {sink.stats.messages}, rejected: {sink.stats.rejected}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
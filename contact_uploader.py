@@ -0,0 +1,230 @@
+import os
+import csv
+import sys
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from typing import List, Tuple
+from dotenv import load_dotenv
+
+from lead_store import Lead, normalize_email
+from sent_log_archive import archive_for, sent_log_records
+
+logger = logging.getLogger(__name__)
+
+VENDOR_QUEUE_FILE = 'logs/vendor_contact_queue.jsonl'
+VENDOR_FAILED_FILE = 'logs/vendor_contact_failed.jsonl'
+UPLOAD_CHUNK_SIZE = 200
+
+# Lead columns sent to the vendor_contact endpoint (lead_store.LEAD_COLUMNS keeps them on each Lead)
+CONTACT_FIELDS = ("full_name", "email", "phone", "linkedin_id", "company_name", "location")
+
+# Uploaded records at the front of the queue are dropped once they take up this much
+COMPACT_AFTER_BYTES = 1024 * 1024
+
+
+class ContactUploader:
+    """
+    Queues emailed leads as vendor contacts and uploads them to the WBL API in chunks.
+
+    Contacts are appended to a JSONL queue as they are sent. upload() posts
+    the queue one chunk at a time and records, after each chunk, the byte
+    offset it got to, so an upload that is interrupted resumes with the first
+    unfinished chunk on the next run. Records the server refuses are moved to
+    the failed file with the reason; records that hit a temporary error are
+    queued again for the next upload.
+    """
+
+    def __init__(
+        self,
+        api_logger,
+        queue_file: str = VENDOR_QUEUE_FILE,
+        failed_file: str = VENDOR_FAILED_FILE,
+        chunk_size: int = UPLOAD_CHUNK_SIZE
+    ):
+        self.api_logger = api_logger
+        self.queue_file = queue_file
+        self.offset_file = queue_file + ".offset"
+        self.failed_file = failed_file
+        self.chunk_size = max(1, chunk_size)
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _append(self, records: List[dict]) -> None:
+        if self._file is None:
+            directory = os.path.dirname(self.queue_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.queue_file, 'a', encoding='utf-8')
+        for record in records:
+            self._file.write(json.dumps(record) + "\n")
+        # Queued contacts survive a crash of the run; upload() resumes from the saved offset
+        self._file.flush()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add(self, lead: dict, source_email: str) -> None:
+        """Queue a lead that was emailed from source_email"""
+        contact = {field: lead.get(field) for field in CONTACT_FIELDS}
+        contact["source_email"] = source_email
+        with self._lock:
+            self._append([{"id": str(uuid.uuid4()), "contact": contact}])
+
+    def _read_offset(self) -> int:
+        try:
+            with open(self.offset_file, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, offset: int) -> None:
+        temp_file = self.offset_file + ".tmp"
+        with open(temp_file, 'w') as f:
+            f.write(str(offset))
+        os.replace(temp_file, self.offset_file)
+
+    def _read_chunk(self, f, end: int) -> List[dict]:
+        records = []
+        while len(records) < self.chunk_size and f.tell() < end:
+            line = f.readline()
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Torn last line from a crash
+                continue
+        return records
+
+    def _record_failures(self, records: List[Tuple[dict, str]]) -> None:
+        directory = os.path.dirname(self.failed_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.failed_file, 'a', encoding='utf-8') as f:
+            for record, error in records:
+                f.write(json.dumps(dict(record, error=error)) + "\n")
+
+    def _compact(self, offset: int) -> None:
+        """Drop uploaded records from the front of the queue, or the whole queue once it is done"""
+        size = os.path.getsize(self.queue_file)
+        if offset >= size:
+            os.remove(self.queue_file)
+            if os.path.exists(self.offset_file):
+                os.remove(self.offset_file)
+            return
+        if offset < COMPACT_AFTER_BYTES:
+            return
+        temp_file = self.queue_file + ".tmp"
+        with open(self.queue_file, 'rb') as src, open(temp_file, 'wb') as dst:
+            src.seek(offset)
+            dst.write(src.read())
+        os.replace(temp_file, self.queue_file)
+        self._write_offset(0)
+
+    def pending(self) -> int:
+        """Number of queued contacts not uploaded yet"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            if not os.path.exists(self.queue_file):
+                return 0
+            with open(self.queue_file, 'rb') as f:
+                f.seek(self._read_offset())
+                return sum(1 for line in f if line.strip())
+
+    def upload(self) -> Tuple[int, int, int]:
+        """
+        Upload everything queued so far, including chunks left over from
+        earlier runs. Stops at the first chunk that fails as a whole (the API
+        is down) and leaves it for next time. Returns (saved, refused, left).
+        """
+        with self._lock:
+            self._close_file()
+            if not os.path.exists(self.queue_file):
+                return 0, 0, 0
+
+            saved = refused_total = 0
+            end = os.path.getsize(self.queue_file)
+            offset = self._read_offset()
+            with open(self.queue_file, 'rb') as f:
+                f.seek(offset)
+                while f.tell() < end:
+                    records = self._read_chunk(f, end)
+                    if not records:
+                        offset = f.tell()
+                        continue
+                    ids = [record["id"] for record in records]
+                    retry, refused = self.api_logger.save_vendor_contacts(
+                        [record["contact"] for record in records],
+                        idempotency_key="vc-" + hashlib.sha1("|".join(ids).encode('utf-8')).hexdigest(),
+                        record_keys=ids
+                    )
+                    if len(retry) == len(records):
+                        logger.warning(f"Vendor contact upload stopped, {len(records)} contacts left for the next run")
+                        break
+                    if refused:
+                        self._record_failures([(records[index], error) for index, error in refused.items()])
+                    # Retried records go to the end of the queue, past `end`, so this pass does not see them again
+                    self._append([records[index] for index in retry])
+                    self._close_file()
+                    saved += len(records) - len(retry) - len(refused)
+                    refused_total += len(refused)
+                    offset = f.tell()
+                    self._write_offset(offset)
+
+            left = 0
+            with open(self.queue_file, 'rb') as f:
+                f.seek(offset)
+                left = sum(1 for line in f if line.strip())
+            self._compact(offset)
+            if refused_total:
+                logger.warning(f"{refused_total} vendor contacts refused by the API, see {self.failed_file}")
+            logger.info(f"Vendor contacts uploaded: {saved} saved, {refused_total} refused, {left} queued")
+            return saved, refused_total, left
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_file()
+
+
+def main(argv):
+    """python contact_uploader.py upload | status | import-sent logs/sent_emails.csv [leads.csv]"""
+    if not argv or argv[0] not in ("upload", "status", "import-sent") or (argv[0] == "import-sent" and len(argv) < 2):
+        print("Usage: python contact_uploader.py upload | status | import-sent <sent_log.csv> [leads.csv]")
+        return 1
+
+    load_dotenv()
+    from job_activity_logger import JobActivityLogger
+    api_logger = JobActivityLogger()
+    uploader = ContactUploader(api_logger, chunk_size=int(os.getenv("VENDOR_UPLOAD_CHUNK_SIZE", UPLOAD_CHUNK_SIZE)))
+    try:
+        if argv[0] == "import-sent":
+            # Lead details (phone, company, ...) come from the lead file when given
+            details = {}
+            if len(argv) > 2:
+                with open(argv[2], 'r', newline='', encoding='utf-8') as f:
+                    details = {normalize_email(row.get("email", "")): Lead.from_row(row) for row in csv.DictReader(f)}
+            queued = 0
+            # Rows already rotated out of the bot's sent log are read from the archive
+            for row in sent_log_records(argv[1], archive_for(argv[1])):
+                email = row.get("Recipient Email", "")
+                lead = details.get(normalize_email(email)) or {"email": email, "full_name": row.get("Name", "")}
+                uploader.add(lead, row.get("Sender Email", ""))
+                queued += 1
+            print(f"{queued} contacts queued")
+        if argv[0] in ("upload", "import-sent"):
+            saved, refused, left = uploader.upload()
+            print(f"{saved} saved, {refused} refused, {left} still queued")
+        else:
+            print(f"{uploader.pending()} contacts queued")
+    finally:
+        uploader.close()
+        api_logger.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,104 @@
+import os
+import re
+import json
+import hashlib
+import bisect
+from typing import Dict, List
+
+# Placeholders look like {{ name }} or {{email}}
+SLOT_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+class CompiledTemplate:
+    """A template split once into static segments and substitution slots"""
+
+    def __init__(self, source: str):
+        self.segments: List[str] = []
+        self.slots: List[str] = []
+        position = 0
+        for match in SLOT_PATTERN.finditer(source):
+            self.segments.append(source[position:match.start()])
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.segments.append(source[position:])
+
+        # Static segments at even positions, slot values go in the odd ones, so
+        # rendering only fills the slots instead of re-scanning the document
+        self._parts: List[str] = [self.segments[0]]
+        for segment in self.segments[1:]:
+            self._parts.append("")
+            self._parts.append(segment)
+
+    def render(self, values: Dict[str, str]) -> str:
+        parts = self._parts.copy()
+        parts[1::2] = [values.get(slot, "") for slot in self.slots]
+        return "".join(parts)
+
+
+_compiled_cache: Dict[tuple, CompiledTemplate] = {}
+
+
+def load_template(path: str) -> CompiledTemplate:
+    """Compile a template file, reusing the cached result until the file changes"""
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    template = _compiled_cache.get(key)
+    if template is None:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            template = CompiledTemplate(f.read())
+        _compiled_cache[key] = template
+    return template
+
+
+class TemplateVariant:
+
+    def __init__(self, name: str, weight: float, subject: CompiledTemplate, html: CompiledTemplate):
+        self.name = name
+        self.weight = weight
+        self.subject = subject
+        self.html = html
+
+
+class Campaign:
+    """
+    Campaign templates loaded from a JSON manifest.
+
+    Each variant has a name, a weight, a subject (inline or subject_file) and an
+    html_file. Recipients are assigned to variants by a stable hash of their
+    address, so a recipient always gets the same variant within a campaign and
+    the split follows the configured weights.
+    """
+
+    def __init__(self, manifest_path: str):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+        self.name = manifest.get('name', os.path.splitext(os.path.basename(manifest_path))[0])
+        self.variants: List[TemplateVariant] = []
+
+        for entry in manifest.get('variants', []):
+            if 'subject_file' in entry:
+                subject = load_template(os.path.join(base_dir, entry['subject_file']))
+            else:
+                subject = CompiledTemplate(entry.get('subject', ''))
+            html = load_template(os.path.join(base_dir, entry['html_file']))
+            weight = float(entry.get('weight', 1))
+            if weight > 0:
+                self.variants.append(TemplateVariant(entry.get('name', entry['html_file']), weight, subject, html))
+
+        if not self.variants:
+            raise ValueError(f"No usable template variants in {manifest_path}")
+
+        self._cumulative_weights = []
+        total = 0.0
+        for variant in self.variants:
+            total += variant.weight
+            self._cumulative_weights.append(total)
+        self._total_weight = total
+
+    def choose_variant(self, recipient: str) -> TemplateVariant:
+        if len(self.variants) == 1:
+            return self.variants[0]
+        digest = hashlib.md5(f"{self.name}:{recipient.lower()}".encode('utf-8')).digest()
+        point = int.from_bytes(digest[:8], 'big') / 2 ** 64 * self._total_weight
+        return self.variants[bisect.bisect_right(self._cumulative_weights, point)]
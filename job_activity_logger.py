@@ -1,87 +1,242 @@
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 import os
+import json
 import logging
 import time
-import jwt
 from dotenv import load_dotenv
+from token_manager import TOKEN_CACHE_FILE, TokenManager
+from run_metrics import NULL_METRICS, RunMetrics
 
-load_dotenv()
-
-# Set up logging
-os.makedirs('logs', exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/activity_logger.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+JOB_TYPE_CACHE_FILE = 'logs/job_type_cache.json'
+
+# Replies to a bulk POST meaning the server only takes one contact per request
+_BULK_UNSUPPORTED = (404, 405, 415, 422)
+
+
+class _TimedSession(requests.Session):
+    """Session that records the duration and outcome of every API call, by endpoint"""
+
+    def __init__(self, metrics: RunMetrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def request(self, method, url, *args, **kwargs):
+        endpoint = urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1] or '/'
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.metrics.count("api_errors", endpoint=endpoint, error=type(e).__name__)
+            raise
+        finally:
+            self.metrics.observe("api_request", time.perf_counter() - started, endpoint=endpoint)
+        self.metrics.count("api_responses", endpoint=endpoint, status=response.status_code)
+        return response
+
 
 class JobActivityLogger:
 
-    def __init__(self):
+    def __init__(self, metrics: Optional[RunMetrics] = None):
         self.api_url = os.getenv('WBL_API_URL', '')
-        self.api_token = os.getenv('WBL_API_TOKEN', '')
         self.wbl_email = os.getenv('WBL_EMAIL', '')
         self.wbl_password = os.getenv('WBL_PASSWORD', '')
         self.job_unique_id = os.getenv('JOB_UNIQUE_ID', 'leads_mass_email_sender')
         self.employee_id = int(os.getenv('EMPLOYEE_ID', '411'))
         self.selected_candidate_id = int(os.getenv('SELECTED_CANDIDATE_ID', '570'))
-
-        # Auto-login if token is missing or expired
-        if not self.api_token or self._is_token_expired():
-            if self.wbl_email and self.wbl_password:
-                self._auto_login()
-            else:
-                logger.warning("WBL_API_TOKEN not set/expired and WBL_EMAIL/WBL_PASSWORD not configured. Activity logging will fail.")
-
-        self.headers = {
+        # (connect, read) timeouts for every API call
+        self.timeout = (
+            float(os.getenv('WBL_API_CONNECT_TIMEOUT', '5')),
+            float(os.getenv('WBL_API_READ_TIMEOUT', '30'))
+        )
+        self.job_type_cache_ttl = int(os.getenv('JOB_TYPE_CACHE_TTL', '86400'))
+        self.unsubscribe_path = os.getenv('WBL_UNSUBSCRIBE_PATH', 'leads_unsubscribe')
+        self.unsubscribe_page_size = int(os.getenv('WBL_UNSUBSCRIBE_PAGE_SIZE', '5000'))
+        # Threads for single-record vendor contact POSTs when bulk upload is not supported
+        self.upload_workers = max(1, int(os.getenv('VENDOR_UPLOAD_WORKERS', '4')))
+        self._bulk_supported = None    # unknown until the first bulk upload
+        self._job_type_id = None
+
+        # One pooled keep-alive session for all API calls, timed per endpoint when metrics are on
+        self.metrics = metrics or NULL_METRICS
+        self.session = _TimedSession(self.metrics) if self.metrics.enabled else requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Tokens are refreshed lazily, ahead of expiry, on first use
+        self.tokens = TokenManager(
+            login=self._auto_login,
+            initial_token=os.getenv('WBL_API_TOKEN', ''),
+            cache_file=os.getenv('WBL_TOKEN_CACHE_FILE', TOKEN_CACHE_FILE),
+            refresh_margin=float(os.getenv('WBL_TOKEN_REFRESH_MARGIN', '300'))
+        )
+        if self.tokens.is_expired() and not (self.wbl_email and self.wbl_password):
+            logger.warning("WBL_API_TOKEN not set/expired and WBL_EMAIL/WBL_PASSWORD not configured. Activity logging will fail.")
+
+    @property
+    def api_token(self) -> str:
+        """Valid API token, logging in first if it is missing or about to expire"""
+        return self.tokens.get_token()
+
+    @property
+    def headers(self) -> dict:
+        return {
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json"
         }
 
-    def save_vendor_contact(self, data: dict) -> bool:
-        """Save vendor contact to API (if needed for email recipients)"""
+    def warm_up(self) -> bool:
+        """Log in and look up the job type ahead of the first report. False if no token could be had."""
         if not self.api_token:
             return False
+        return self._get_cached_job_type_id() is not None
 
+    def close(self) -> None:
+        """Release pooled API connections"""
+        self.session.close()
+
+    def _vendor_contact_endpoint(self) -> str:
         base_url = self.api_url.rstrip('/')
         if not self.api_url.endswith('/api'):
             base_url = f"{self.api_url}/api"
 
-        endpoint = f"{base_url}/vendor_contact"
+        return f"{base_url}/vendor_contact"
 
-        payload = {
+    @staticmethod
+    def _vendor_contact_payload(data: dict, source_email: Optional[str] = None) -> dict:
+        return {
             "full_name": data.get('full_name') or 'Unknown',
             "email": data.get('email'),
             "phone": data.get('phone'),
             "linkedin_id": data.get('linkedin_id'),
             "company_name": data.get('company_name'),
             "location": data.get('location'),
-            "source_email": os.getenv('EMAIL_USER')  # From email account used
+            # The account that emailed this contact; EMAIL_USER only for old single-account setups
+            "source_email": source_email or data.get('source_email') or os.getenv('EMAIL_USER')
         }
 
+    def save_vendor_contact(self, data: dict, source_email: Optional[str] = None) -> bool:
+        """Save vendor contact to API (if needed for email recipients)"""
+        if not self.api_token:
+            return False
+
         try:
-            response = requests.post(endpoint, json=payload, headers=self.headers)
+            response = self.session.post(
+                self._vendor_contact_endpoint(),
+                json=self._vendor_contact_payload(data, source_email),
+                headers=self.headers,
+                timeout=self.timeout
+            )
             response.raise_for_status()
             return True
         except Exception as e:
             logger.error(f"Failed to save vendor contact: {e}")
             return False
 
+    def _post_vendor_contact(self, payload: dict, idempotency_key: Optional[str]) -> Tuple[str, str]:
+        """One single-record POST: ("saved" | "retry" | "failed", detail)"""
+        extra_headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+        try:
+            response = self.session.post(
+                self._vendor_contact_endpoint(),
+                json=payload,
+                headers={**self.headers, **extra_headers},
+                timeout=self.timeout
+            )
+        except requests.exceptions.RequestException as e:
+            return "retry", str(e)
+        if response.status_code < 300:
+            return "saved", ""
+        if response.status_code in (401, 408, 429) or response.status_code >= 500:
+            return "retry", f"HTTP {response.status_code}"
+        return "failed", f"HTTP {response.status_code}: {response.text[:200]}"
+
+    def save_vendor_contacts(
+        self,
+        records: List[dict],
+        idempotency_key: Optional[str] = None,
+        record_keys: Optional[List[str]] = None
+    ) -> Tuple[List[int], Dict[int, str]]:
+        """
+        Upload a chunk of contacts (dicts as for save_vendor_contact, with
+        "source_email" set per record) in one bulk POST. Servers that reject
+        lists get single-record POSTs from a bounded thread pool instead.
+        Returns (indexes to retry later, {index: error} for records the
+        server refused).
+        """
+        everything = list(range(len(records)))
+        if not records:
+            return [], {}
+        if not self.api_token:
+            logger.error("Cannot upload vendor contacts: No API token configured")
+            return everything, {}
+
+        payloads = [self._vendor_contact_payload(record) for record in records]
+        if self._bulk_supported is not False:
+            extra_headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+            try:
+                response = self.session.post(
+                    self._vendor_contact_endpoint(),
+                    json=payloads,
+                    headers={**self.headers, **extra_headers},
+                    timeout=self.timeout
+                )
+                if response.status_code == 401 and self._refresh_token(requests.exceptions.HTTPError(response=response, request=response.request)):
+                    response = self.session.post(
+                        self._vendor_contact_endpoint(),
+                        json=payloads,
+                        headers={**self.headers, **extra_headers},
+                        timeout=self.timeout
+                    )
+                body = response.json() if response.content else {}
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.error(f"Vendor contact upload failed: {e}")
+                return everything, {}
+
+            # Per-record errors only mean a partial success on 2xx (207 included); a 4xx
+            # with an errors list is a refused request and is handled by status below
+            errors = body.get("errors") if isinstance(body, dict) else None
+            if 200 <= response.status_code < 300:
+                self._bulk_supported = True
+                refused = {}
+                for error in errors if isinstance(errors, list) else []:
+                    index = error.get("index") if isinstance(error, dict) else None
+                    if isinstance(index, int) and 0 <= index < len(records):
+                        refused[index] = str(error.get("detail", "rejected"))
+                return [], refused
+            if response.status_code not in _BULK_UNSUPPORTED:
+                logger.error(f"Vendor contact upload failed: HTTP {response.status_code}")
+                return everything, {}
+            logger.info("Bulk vendor contact upload not supported, posting contacts one at a time")
+            self._bulk_supported = False
+
+        keys = record_keys or [None] * len(records)
+        retry, refused = [], {}
+        with ThreadPoolExecutor(max_workers=min(self.upload_workers, len(records)), thread_name_prefix="vendor-upload") as executor:
+            outcomes = executor.map(self._post_vendor_contact, payloads, keys)
+            for index, (status, detail) in enumerate(outcomes):
+                if status == "retry":
+                    retry.append(index)
+                elif status == "failed":
+                    refused[index] = detail
+        return retry, refused
+
     def log_activity(
         self,
         activity_count: int,
         notes: str = "",
         candidate_id: int = 0,
-        activity_date: Optional[str] = None
+        activity_date: Optional[str] = None,
+        idempotency_key: Optional[str] = None
     ) -> bool:
-        """Log activity to job activity table"""
+        """Log activity to job activity table. Retries carrying the same idempotency_key are not double-counted."""
         if not self.api_token:
             logger.error("Cannot log activity: No API token configured")
             return False
@@ -92,7 +247,7 @@ class JobActivityLogger:
         if candidate_id == 0 and self.selected_candidate_id != 0:
             candidate_id = self.selected_candidate_id
 
-        job_type_id = self._get_job_type_id()
+        job_type_id = self._get_cached_job_type_id()
         if job_type_id is None:
             logger.error("Cannot log activity: Job type not found")
             return False
@@ -111,9 +266,10 @@ class JobActivityLogger:
             base_url = f"{self.api_url}/api"
 
         endpoint = f"{base_url}/job_activity_logs"
+        extra_headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
 
         try:
-            response = requests.post(endpoint, json=payload, headers=self.headers)
+            response = self.session.post(endpoint, json=payload, headers={**self.headers, **extra_headers}, timeout=self.timeout)
             response.raise_for_status()
             result = response.json()
             logger.info(f"Activity logged: {activity_count} emails sent (Activity ID: {result.get('id', 'N/A')})")
@@ -121,10 +277,10 @@ class JobActivityLogger:
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 401:
                 logger.warning("Token expired during activity logging, attempting refresh...")
-                if self._refresh_token():
+                if self._refresh_token(e):
                     # Retry once with new token
                     try:
-                        response = requests.post(endpoint, json=payload, headers=self.headers)
+                        response = self.session.post(endpoint, json=payload, headers={**self.headers, **extra_headers}, timeout=self.timeout)
                         response.raise_for_status()
                         result = response.json()
                         logger.info(f"Activity logged: {activity_count} emails sent (Activity ID: {result.get('id', 'N/A')})")
@@ -137,6 +293,9 @@ class JobActivityLogger:
                     return False
             else:
                 logger.error(f"Failed to log activity: {e}")
+                if e.response.status_code in (400, 404, 422):
+                    # The cached job type id may be stale, look it up again next time
+                    self._invalidate_job_type_cache()
                 if hasattr(e, 'response') and e.response is not None:
                     try:
                         error_detail = e.response.json()
@@ -154,90 +313,169 @@ class JobActivityLogger:
                     logger.error(f"Response: {e.response.text}")
             return False
 
-    def _auto_login(self) -> None:
-        """Automatically login and get token using stored credentials"""
+    def sync_unsubscribes(self, cache) -> Optional[int]:
+        """
+        Pull unsubscribes added since the cache's cursor into the cache (an
+        UnsubscribeCache). The endpoint answers GET ?since=<cursor>&limit=<n>
+        with {"emails": [...], "next_cursor": ..., "has_more": bool}, 304 when
+        the If-None-Match ETag is current, and 410 when the cursor has expired,
+        which triggers a full resync. Returns the number of new addresses, or
+        None if the sync failed.
+        """
+        if not self.api_token:
+            logger.error("Cannot sync unsubscribes: No API token configured")
+            return None
+
+        base_url = self.api_url.rstrip('/')
+        if not self.api_url.endswith('/api'):
+            base_url = f"{self.api_url}/api"
+
+        endpoint = f"{base_url}/{self.unsubscribe_path}"
+        added = 0
+        resynced = refreshed = False
+        cursor, etag = cache.cursor, cache.etag
+
+        while True:
+            params = {"limit": self.unsubscribe_page_size}
+            if cursor:
+                params["since"] = cursor
+            # The ETag stands for the whole list, so it is only worth sending before the first page
+            extra_headers = {"If-None-Match": etag} if etag and cursor == cache.cursor else {}
+            try:
+                response = self.session.get(endpoint, params=params, headers={**self.headers, **extra_headers}, timeout=self.timeout)
+                if response.status_code == 304:
+                    cache.save_state(cursor, etag)
+                    return added
+                if response.status_code == 410 and not resynced:
+                    logger.warning("Unsubscribe cursor expired, resyncing from scratch")
+                    cache.reset()
+                    cursor = etag = None
+                    resynced = True
+                    continue
+                if response.status_code == 401 and not refreshed:
+                    refreshed = True
+                    if self._refresh_token(requests.exceptions.HTTPError(response=response, request=response.request)):
+                        continue
+                response.raise_for_status()
+                page = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # Whatever earlier pages brought in is kept, along with the cursor that got them
+                logger.error(f"Failed to sync unsubscribes: {e}")
+                if added:
+                    cache.save_state(cursor, None)
+                return None
+
+            added += cache.add(page.get("emails", []))
+            cursor = page.get("next_cursor", cursor)
+            etag = response.headers.get("ETag")
+            if not page.get("has_more"):
+                break
+
+        cache.save_state(cursor, etag)
+        logger.info(f"Synced unsubscribes: {added} new, {len(cache)} total")
+        return added
+
+    def _auto_login(self) -> Optional[str]:
+        """Login with stored credentials and return the new token (the TokenManager stores it)"""
+        if not self.wbl_email or not self.wbl_password:
+            logger.error("Cannot login: credentials not configured")
+            return None
+
         logger.info("Auto-logging in to WBL API...")
         login_url = f"{self.api_url}/login"
         if "localhost" in self.api_url and not self.api_url.endswith("/api"):
             login_url = f"{self.api_url}/api/login"
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 login_url,
                 data={
                     "username": self.wbl_email,
                     "password": self.wbl_password
                 },
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=self.timeout
             )
             response.raise_for_status()
             data = response.json()
             token = data.get("access_token")
 
             if token:
-                # Update .env file
-                self._update_env_token(token)
-                self.api_token = token
                 logger.info(f"Token obtained and saved: {token[:20]}...")
-            else:
-                logger.error("No access_token in login response")
+                return token
+            logger.error("No access_token in login response")
 
         except Exception as e:
             logger.error(f"Auto-login failed: {e}")
-
-    def _update_env_token(self, token: str) -> None:
-        """Update the WBL_API_TOKEN in .env file"""
-        env_file = ".env"
-        try:
-            with open(env_file, 'r') as f:
-                content = f.read()
-
-            # Replace or add the token
-            if "WBL_API_TOKEN=" in content:
-                content = content.replace(f"WBL_API_TOKEN={os.getenv('WBL_API_TOKEN', '')}", f"WBL_API_TOKEN={token}")
-            else:
-                content += f"\nWBL_API_TOKEN={token}\n"
-
-            with open(env_file, 'w') as f:
-                f.write(content)
-        except Exception as e:
-            logger.error(f"Failed to update .env with token: {e}")
+        return None
 
     def _is_token_expired(self) -> bool:
         """Check if the JWT token is expired"""
-        if not self.api_token:
-            return True
-
-        try:
-            # Decode token without verification to check expiry
-            payload = jwt.decode(self.api_token, options={"verify_signature": False})
-            exp = payload.get('exp')
-            if exp:
-                return time.time() > exp
-            return False
-        except Exception as e:
-            logger.warning(f"Could not decode token to check expiry: {e}")
-            return True  # Assume expired if we can't decode
+        return self.tokens.is_expired()
 
-    def _refresh_token(self) -> bool:
-        """Refresh the API token by logging in again"""
+    def _refresh_token(self, error: Optional[Exception] = None) -> bool:
+        """Refresh the API token after a 401, sharing the refresh with other callers"""
         if not self.wbl_email or not self.wbl_password:
             logger.error("Cannot refresh token: credentials not configured")
             return False
 
+        # The token the rejected request carried; if it was already replaced there is nothing to do
+        stale_token = None
+        request = getattr(error, 'request', None)
+        if request is not None:
+            stale_token = request.headers.get("Authorization", "").replace("Bearer ", "", 1)
+
         logger.info("Refreshing expired token...")
         try:
-            self._auto_login()
-            # Update headers with new token
-            self.headers = {
-                "Authorization": f"Bearer {self.api_token}",
-                "Content-Type": "application/json"
-            }
-            return bool(self.api_token and not self._is_token_expired())
+            return self.tokens.refresh(stale_token=stale_token if stale_token is not None else self.tokens.token)
         except Exception as e:
             logger.error(f"Token refresh failed: {e}")
             return False
 
+    def _job_type_cache_key(self) -> str:
+        return f"{self.api_url.rstrip('/')}|{self.job_unique_id}"
+
+    def _load_job_type_cache(self) -> dict:
+        try:
+            with open(JOB_TYPE_CACHE_FILE, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_job_type_cache(self, cache: dict) -> None:
+        temp_file = JOB_TYPE_CACHE_FILE + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(JOB_TYPE_CACHE_FILE), exist_ok=True)
+            with open(temp_file, 'w') as f:
+                json.dump(cache, f)
+            os.replace(temp_file, JOB_TYPE_CACHE_FILE)
+        except OSError as e:
+            logger.warning(f"Could not save job type cache: {e}")
+
+    def _get_cached_job_type_id(self) -> Optional[int]:
+        """Job type id from memory or the on-disk cache, fetched from the API when missing or older than the TTL"""
+        if self._job_type_id is not None:
+            return self._job_type_id
+
+        cache = self._load_job_type_cache()
+        entry = cache.get(self._job_type_cache_key())
+        if entry and time.time() - entry.get('fetched_at', 0) < self.job_type_cache_ttl:
+            self._job_type_id = entry.get('id')
+            return self._job_type_id
+
+        job_type_id = self._get_job_type_id()
+        if job_type_id is not None:
+            self._job_type_id = job_type_id
+            cache[self._job_type_cache_key()] = {"id": job_type_id, "fetched_at": time.time()}
+            self._save_job_type_cache(cache)
+        return job_type_id
+
+    def _invalidate_job_type_cache(self) -> None:
+        self._job_type_id = None
+        cache = self._load_job_type_cache()
+        if cache.pop(self._job_type_cache_key(), None) is not None:
+            self._save_job_type_cache(cache)
+
     def _get_job_type_id(self) -> Optional[int]:
         try:
             base_url = self.api_url.rstrip('/')
@@ -246,7 +484,7 @@ class JobActivityLogger:
 
             endpoint = f"{base_url}/job-types"
 
-            response = requests.get(endpoint, headers=self.headers)
+            response = self.session.get(endpoint, headers=self.headers, timeout=self.timeout)
             response.raise_for_status()
             job_types = response.json()
 
@@ -260,10 +498,10 @@ class JobActivityLogger:
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 401:
                 logger.warning("Token expired during job type fetch, attempting refresh...")
-                if self._refresh_token():
+                if self._refresh_token(e):
                     # Retry once with new token
                     try:
-                        response = requests.get(endpoint, headers=self.headers)
+                        response = self.session.get(endpoint, headers=self.headers, timeout=self.timeout)
                         response.raise_for_status()
                         job_types = response.json()
 
@@ -289,5 +527,6 @@ class JobActivityLogger:
 
 # Convenience function for simple usage
 def log_job_activity(count: int, notes: str = "") -> bool:
+    load_dotenv()
     logger = JobActivityLogger()
     return logger.log_activity(count, notes)
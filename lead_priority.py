@@ -0,0 +1,89 @@
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from recipient_domains import domain_of
+
+ENTRY_DATE_COLUMN = "Entry Date"
+STATUS_COLUMN = "status"
+CLOSED_DATE_COLUMN = "Closed Date"
+
+# Lead statuses that mean someone already reached out outside the mass mailing
+CONTACTED_STATUSES = {"contacted", "closed"}
+
+# Formats seen in lead exports besides ISO dates
+_DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%d-%b-%Y", "%b %d, %Y")
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# A ranking key maps a CSV row to a sortable value; larger values are sent first
+RankKey = Callable[[dict], object]
+
+
+def entry_date(row: dict) -> str:
+    """The lead's Entry Date as YYYY-MM-DD, or "" when it is missing or unreadable (ranks last)"""
+    value = (row.get(ENTRY_DATE_COLUMN) or "").strip()
+    if _ISO_DATE.match(value):
+        return value[:10]
+    # Drop a time part ("03/14/2024 10:22")
+    value = value.split(" ")[0] if "/" in value else value
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return ""
+
+
+def _recent() -> RankKey:
+    return entry_date
+
+
+def _never_contacted() -> RankKey:
+    def key(row):
+        status = (row.get(STATUS_COLUMN) or "").strip().lower()
+        return 0 if status in CONTACTED_STATUSES or (row.get(CLOSED_DATE_COLUMN) or "").strip() else 1
+    return key
+
+
+def _domain_diversity() -> RankKey:
+    # The n-th lead of a domain in the file ranks below the first lead of every other domain;
+    # rows without an address would each count as a domain of their own, so they rank last
+    seen = defaultdict(int)
+
+    def key(row):
+        email = (row.get("email") or "").strip()
+        if '@' not in email:
+            return float('-inf')
+        domain = domain_of(email)
+        seen[domain] += 1
+        return -seen[domain]
+    return key
+
+
+# name -> factory for a fresh key (keys may keep state over one pass through the file).
+# Add entries here to make new orderings available to LEAD_PRIORITY.
+PRIORITIES: Dict[str, Callable[[], RankKey]] = {
+    "recent": _recent,
+    "never_contacted": _never_contacted,
+    "domain_diversity": _domain_diversity,
+}
+
+
+def priority_key(spec: str) -> Optional[RankKey]:
+    """
+    Build the ranking key for a LEAD_PRIORITY value: comma-separated names
+    from PRIORITIES, most important first ("never_contacted,recent").
+    "file" or an empty value means file order and returns None.
+    """
+    names = [name.strip().lower() for name in (spec or "").split(",") if name.strip()]
+    if not names or names == ["file"]:
+        return None
+    unknown = [name for name in names if name not in PRIORITIES]
+    if unknown:
+        raise ValueError(f"Unknown lead priority {', '.join(unknown)} (choose from file, {', '.join(PRIORITIES)})")
+    keys = [PRIORITIES[name]() for name in names]
+    if len(keys) == 1:
+        return keys[0]
+    # Every key sees every row, so stateful keys count the whole file
+    return lambda row: tuple(key(row) for key in keys)
@@ -0,0 +1,228 @@
+import os
+import csv
+import sys
+import heapq
+import shutil
+from itertools import islice
+from typing import AbstractSet, Callable, Container, Iterator, List, Optional, Tuple
+
+from recipient_domains import clean_address
+
+SENT_COLUMN = "massemail_email_sent"
+UNSUBSCRIBE_COLUMN = "massemail_unsubscribe"
+
+# Status flags of a Lead, one bit each
+STATUS_SENT = 1
+STATUS_UNSUBSCRIBED = 2
+_STATUS_BITS = {SENT_COLUMN: STATUS_SENT, UNSUBSCRIBE_COLUMN: STATUS_UNSUBSCRIBED}
+
+# Columns a Lead keeps besides the address and the status flags: what the messages and the
+# vendor contacts (contact_uploader.CONTACT_FIELDS) use. Everything else stays in the file.
+LEAD_COLUMNS = ("full_name", "phone", "linkedin_id", "company_name", "location")
+# Values shared by many leads, kept once through sys.intern
+_INTERNED_COLUMNS = ("company_name", "location")
+_FIELDS = frozenset(("email", "send_error") + LEAD_COLUMNS)
+
+
+def normalize_email(email: str) -> str:
+    """
+    The key an address is tracked under (exclusion, journal, suppression,
+    write-back): the cleaned address, lowercased, so a row's "<Foo@Gmail.COM>"
+    matches the "Foo@gmail.com" that was sent to
+    """
+    return clean_address(email).lower()
+
+
+def is_eligible(row: dict) -> bool:
+    """massemail_unsubscribe != 1 AND massemail_email_sent != 1 (CSV values are strings "1"/"0")"""
+    return row.get(UNSUBSCRIBE_COLUMN, "0") != "1" and row.get(SENT_COLUMN, "0") != "1"
+
+
+class Lead:
+    """
+    The parts of a lead row the send pipeline uses, in under half the memory
+    of the DictReader row: LEAD_COLUMNS in slots, the address split into its
+    local part and an interned domain, and the sent/unsubscribed columns as
+    bits of `flags`. It is read and updated like the row for those keys
+    (lead["email"], lead.get("full_name", ""), lead[SENT_COLUMN] = "1"), so
+    the send loops take a Lead or a plain dict alike.
+    """
+
+    __slots__ = ("_local", "_domain", "flags", "send_error") + LEAD_COLUMNS
+
+    def __init__(self, email: Optional[str], flags: int = 0, **columns: Optional[str]):
+        self.email = email
+        self.flags = flags
+        self.send_error = None
+        for column in LEAD_COLUMNS:
+            setattr(self, column, columns.get(column))
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Lead":
+        flags = 0
+        for column, bit in _STATUS_BITS.items():
+            if row.get(column) == "1":
+                flags |= bit
+        columns = {column: row.get(column) for column in LEAD_COLUMNS}
+        for column in _INTERNED_COLUMNS:
+            if columns[column]:
+                columns[column] = sys.intern(columns[column])
+        return cls(row.get("email"), flags, **columns)
+
+    @property
+    def email(self) -> Optional[str]:
+        if self._domain is None:
+            return self._local
+        return f"{self._local}@{self._domain}"
+
+    @email.setter
+    def email(self, value: Optional[str]) -> None:
+        local, at, domain = (value or "").rpartition('@')
+        if at:
+            self._local, self._domain = local, sys.intern(domain)
+        else:
+            self._local, self._domain = value, None
+
+    @property
+    def domain(self) -> Optional[str]:
+        return self._domain
+
+    def __getitem__(self, key: str):
+        bit = _STATUS_BITS.get(key)
+        if bit is not None:
+            return "1" if self.flags & bit else "0"
+        value = getattr(self, key) if key in _FIELDS else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value) -> None:
+        bit = _STATUS_BITS.get(key)
+        if bit is not None:
+            self.flags = self.flags | bit if value == "1" else self.flags & ~bit
+        elif key in _FIELDS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(f"Lead has no column {key!r}")
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"Lead({self.email!r}, flags={self.flags})"
+
+
+class AnyOf:
+    """Container that holds an address when any of the given containers does, checked in order"""
+
+    def __init__(self, *containers: Container[str]):
+        self.containers = containers
+
+    def __contains__(self, email: str) -> bool:
+        return any(email in container for container in self.containers)
+
+
+def _iter_unsent_rows(path: str, exclude: Container[str]) -> Iterator[Tuple[int, str, dict]]:
+    """(row_index, normalized_email, row) for eligible rows whose address is not in `exclude`"""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            if not is_eligible(row):
+                continue
+            email = normalize_email(row.get("email", ""))
+            if email in exclude:
+                continue
+            yield index, email, row
+
+
+def iter_eligible_leads(path: str, exclude: Container[str] = frozenset()) -> Iterator[Tuple[int, dict]]:
+    """
+    Stream (row_index, row) pairs for leads that can still be emailed.
+
+    Rows whose normalized address is in `exclude` (a set, or a persistent
+    index supporting `in`) are skipped, as are repeats of an address already
+    yielded from this file.
+    """
+    seen = set()
+    for index, email, row in _iter_unsent_rows(path, exclude):
+        if email in seen:
+            continue
+        seen.add(email)
+        yield index, row
+
+
+def select_leads(
+    path: str,
+    limit: int,
+    exclude: Container[str] = frozenset(),
+    key: Optional[Callable[[dict], object]] = None
+) -> List[Tuple[int, Lead]]:
+    """
+    Take the `limit` eligible leads ranked highest by `key` (larger first,
+    earlier rows first among equals) in one pass, holding only `limit` Lead
+    records; `key` is given the full row. Without a key, take the first
+    `limit` in file order and stop the scan as soon as the batch is full.
+
+    With a key, an address is only checked against the leads currently in
+    the batch: of two rows with the same address the earlier one is kept,
+    unless it was already pushed out by better leads.
+    """
+    if key is None:
+        return [(index, Lead.from_row(row)) for index, row in islice(iter_eligible_leads(path, exclude), limit)]
+    if limit <= 0:
+        return []
+    # Min-heap of the best `limit` so far; its root is the lead the next better one replaces.
+    # Row indexes are unique, so tuples never get as far as comparing addresses or rows.
+    heap = []
+    batch = set()
+    for index, email, row in _iter_unsent_rows(path, exclude):
+        if email in batch:
+            continue
+        rank = (key(row), -index)
+        if len(heap) < limit:
+            heapq.heappush(heap, rank + (email, Lead.from_row(row)))
+        elif rank > heap[0][:2]:
+            batch.discard(heapq.heapreplace(heap, rank + (email, Lead.from_row(row)))[2])
+        else:
+            continue
+        batch.add(email)
+    heap.sort(reverse=True)
+    return [(-negative_index, lead) for _, negative_index, _, lead in heap]
+
+
+def write_back_sent(path: str, sent_emails: AbstractSet[str]) -> None:
+    """
+    Mark rows whose (normalized) email is in sent_emails as sent by streaming
+    the file into a temp copy and replacing the original. Only one row is held
+    in memory at a time; every other column is copied from the file as it is.
+    """
+    temp_file = path + ".tmp"
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as src, \
+                open(temp_file, 'w', newline='', encoding='utf-8') as dst:
+            reader = csv.DictReader(src)
+            fieldnames = list(reader.fieldnames or [])
+            if SENT_COLUMN not in fieldnames:
+                fieldnames.append(SENT_COLUMN)
+            writer = csv.DictWriter(dst, fieldnames=fieldnames)
+            writer.writeheader()
+            for row in reader:
+                if normalize_email(row.get("email", "")) in sent_emails:
+                    row[SENT_COLUMN] = "1"
+                writer.writerow(row)
+
+        # Replace original
+        shutil.move(temp_file, path)
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
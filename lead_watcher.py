@@ -0,0 +1,125 @@
+import os
+import csv
+import glob
+import logging
+from typing import Container, Dict, Iterator, List, Optional
+
+from lead_store import Lead, is_eligible, normalize_email
+
+logger = logging.getLogger(__name__)
+
+# Extra lead files dropped here (same columns as leads_emails.csv) are picked up too
+LEADS_DROP_DIR = "leads.d"
+
+
+class _Cursor:
+    """How far one lead file has been read: the file's identity and the byte offset after the last whole row"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+        self.fieldnames: Optional[List[str]] = None
+
+    def reset(self, inode) -> None:
+        self.inode = inode
+        self.offset = 0
+        self.fieldnames = None
+
+
+class LeadWatcher:
+    """
+    Hands out eligible leads from a set of CSV files as rows are added to them.
+
+    Each file has a cursor at the end of the last row taken, so take() only
+    parses rows it has not seen and stops as soon as it has enough; when
+    every cursor is at the end of its file, a call costs one stat() per
+    file. A file that was replaced or truncated (the send journal rewrites
+    leads_emails.csv when it compacts) is read again from the top; rows that
+    were already sent are in `exclude` by then. Only whole lines are
+    consumed, so a row that is still being written is picked up next time.
+    """
+
+    def __init__(self, paths: List[str], drop_dir: Optional[str] = None):
+        self.paths = paths
+        self.drop_dir = drop_dir
+        self._cursors: Dict[str, _Cursor] = {}
+
+    def _files(self) -> List[str]:
+        files = list(self.paths)
+        if self.drop_dir:
+            files.extend(sorted(glob.glob(os.path.join(self.drop_dir, "*.csv"))))
+        return files
+
+    def _changed(self, cursor: _Cursor) -> bool:
+        """True if the file may have rows past the cursor; resets the cursor if the file was replaced"""
+        try:
+            stat = os.stat(cursor.path)
+        except FileNotFoundError:
+            return False
+        if stat.st_ino != cursor.inode or stat.st_size < cursor.offset:
+            if cursor.inode is not None:
+                logger.info(f"{cursor.path} was replaced, reading it again from the top")
+            cursor.reset(stat.st_ino)
+        return stat.st_size > cursor.offset
+
+    def _rows(self, cursor: _Cursor) -> Iterator[dict]:
+        """Rows past the cursor, moving it forward after each one"""
+        with open(cursor.path, 'rb') as f:
+            f.seek(cursor.offset)
+            position = cursor.offset
+            exhausted = False
+
+            def lines():
+                nonlocal position, exhausted
+                while True:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        exhausted = True
+                        return
+                    position += len(line)
+                    yield line.decode('utf-8-sig' if position == len(line) else 'utf-8')
+
+            # The reader only asks for another line inside a quoted field, so running out of
+            # lines while it is building a row means the row is not complete yet
+            reader = csv.reader(lines())
+            if cursor.fieldnames is None:
+                header = next(reader, None)
+                if header is None or exhausted:
+                    return
+                cursor.fieldnames = header
+                cursor.offset = position
+            for values in reader:
+                if exhausted:
+                    return
+                cursor.offset = position
+                if values:
+                    yield dict(zip(cursor.fieldnames, values))
+
+    def take(self, limit: int, exclude: Container[str] = frozenset(), skip: Container[str] = frozenset()) -> List[Lead]:
+        """
+        Up to `limit` new eligible leads, in file order. Addresses in `exclude`
+        (already sent or unsubscribed) or `skip` (already queued) are passed over.
+        """
+        files = self._files()
+        for path in list(self._cursors):
+            if path not in files:
+                del self._cursors[path]
+
+        leads = []
+        taken = set()
+        for path in files:
+            cursor = self._cursors.setdefault(path, _Cursor(path))
+            if not self._changed(cursor):
+                continue
+            for row in self._rows(cursor):
+                if not is_eligible(row):
+                    continue
+                email = normalize_email(row.get("email", ""))
+                if email in taken or email in skip or email in exclude:
+                    continue
+                taken.add(email)
+                leads.append(Lead.from_row(row))
+                if len(leads) >= limit:
+                    return leads
+        return leads
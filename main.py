@@ -1,256 +1,1032 @@
 # ------------Leads Email Automation------------
 
 
+import sys
 import json
-import smtplib
+import asyncio
+import argparse
+import logging
 import os
-import csv
+import signal
+import smtplib
+import threading
 import time
-import shutil
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from dotenv import load_dotenv
+from collections import deque
 from datetime import datetime
-from job_activity_logger import JobActivityLogger
+from typing import Optional
+from dotenv import load_dotenv
+from run_metrics import RunMetrics
+from smtp_pool import SMTPConnectionPool
+from send_failures import ACCOUNT, TRANSIENT, CircuitBreaker, RetryPolicy, RetryQueue, classify_failure, is_rejection
+from quota_ledger import AccountScheduler, QuotaLedger
+from async_sender import send_all
+from email_templates import Campaign
+from message_builder import MessageFactory
+from message_spool import MessageSpool, render_to_spool
+from lead_store import SENT_COLUMN, AnyOf, normalize_email, select_leads
+from lead_priority import priority_key
+from lead_watcher import LEADS_DROP_DIR, LeadWatcher
+from recipient_domains import DomainThrottle, clean_leads, domain_of, interleave_by_domain, parse_domain_limits
+from send_journal import SendJournal
+from sent_log import SentLogWriter
+from sent_log_archive import SENT_ARCHIVE_DIR, SentLogArchive
+from suppression_index import SuppressionIndex
+from unsubscribe_cache import UNSUBSCRIBE_CACHE_FILE, UnsubscribeCache
+from activity_reporter import ActivityReporter
+from contact_uploader import UPLOAD_CHUNK_SIZE, ContactUploader
+from sharded_runner import SHARD_LOG_DIR, clear_shard_logs, read_shard_logs, run_sharded
 
-# Load environment variables
-load_dotenv()
+# Database/File Configuration
+CSV_FILE = "leads_emails.csv"
+LOG_FILE = "logs/sent_emails.csv"
+MAX_LEADS_PER_RUN = 800
+ACTIVITY_LOG_FILE = "logs/activity_logger.log"
+# Seconds close() waits for a warm-up connection that is still being opened
+WARM_UP_JOIN_TIMEOUT = 10
 
-# Initialize API logger
-api_logger = JobActivityLogger()
+# Successful sends are journaled right away and folded into the CSV once the
+# journal grows past JOURNAL_COMPACT_THRESHOLD entries
+JOURNAL_FILE = CSV_FILE + ".journal"
 
-# Load email accounts from JSON file
-with open(os.getenv("EMAIL_ACCOUNTS_FILE"), 'r') as f:
-    email_accounts = json.load(f)
 
-current_account_index = 0
-emails_sent_with_current_account = 0
-MAX_EMAILS_PER_ACCOUNT = 100
+def _flag(name, default="false"):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
 
-# Other configurations
-SMTP_HOST = os.getenv("SMTP_SERVER")
-SMTP_PORT = int(os.getenv("SMTP_PORT"))
-REPLY_TO_EMAIL = os.getenv("REPLY_TO_EMAIL")
-EMAIL_DELAY_SECONDS = int(os.getenv("EMAIL_DELAY_SECONDS", 2))
 
-# Database/File Configuration
-CSV_FILE = "leads_emails.csv"
-LOG_FILE = "logs/sent_emails.csv"
-os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+class Settings:
+    """Configuration from the environment. Reading it opens no files and makes no network calls."""
 
-def get_next_email_account():
-    global current_account_index, emails_sent_with_current_account
-
-    if emails_sent_with_current_account >= MAX_EMAILS_PER_ACCOUNT:
-        current_account_index = (current_account_index + 1) % len(email_accounts)
-        emails_sent_with_current_account = 0
-        print(f"\nSwitching to email account: {email_accounts[current_account_index]['EMAIL_USER']}\n")
-
-    account = email_accounts[current_account_index]
-    emails_sent_with_current_account += 1
-    return account
-
-def log_sent(email, name, sender_email):
-    with open(LOG_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        if f.tell() == 0:
-            writer.writerow(["Sender Email", "Recipient Email", "Name", "Timestamp"])
-        writer.writerow([sender_email, email, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
-
-def send_email(to_email, to_name):
-    account = get_next_email_account()
-
-    subject = "New Batch Alert! Join our AI & ML Training Program!"
-
-    html_body = f"""
-      <html>
-        <body style="font-family: Arial, sans-serif; font-size: 15px; color: #333; line-height: 1.6; margin: 0; padding: 0; background-color: #f6f8fa;">
-            <div style="max-width: 600px; margin: auto; padding: 20px; background-color: #ffffff; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
-            <div style="text-align: center; margin-bottom: 20px;">
-                <img src="https://www.whitebox-learning.com/_next/static/media/wbl-dark.364b4e0a.png"
-                    alt="Whitebox Learning Logo"
-                    style="height: 50px; display: block; margin: auto;">
-                <h2 style="margin: 10px 0 0 0; color: #1b1f23;">Whitebox Learning</h2>
-            </div>
-
-            <p>Hi {to_name or 'there'},</p>
-            <p>Sorry for spamming  — just wanted to make sure you don’t miss this last chance to join Whitebox Learning.</p>
-
-            <p><strong> Last Batch Of The Year 2025</strong> Don’t miss your chance to join Whitebox Learning’s <strong>AI & ML Training Program</strong>. This is your opportunity to explore your career path in the <strong>AI/ML. Join our orientation for more for free </strong>
-
-            <!-- 🔥 NEW CONTENT ADDED HERE -->
-            <p style="font-weight:bold; text-align:center;">
-                <p><strong>October Month Highlights:</strong></p>
-                    <ul>
-                        <li><strong>67+ Interviews Scheduled</strong></li>
-                        <li><strong>Out of 10 Marketing Candidates 4 Got Placed </strong></li>
-                        <li><strong>Currently 50+ Candidates In Preparation and Training</strong></li>
-                        <li><strong>20+ Interviews Happening This Week</strong></li>
-                    </ul>
-                 Join now and explore your future in the AIML way
-                (Don’t let this chance slip — treat this as your last reminder!)
-              </p>
-
-            <!-- 🔥 END NEW CONTENT -->
-
-            <p><strong>Orientation Date:</strong> January 10th, 2026 </p>
-            <p><strong>Time:</strong> 10:00 AM to 12:00 PM PST</p>
-            <p><strong>Register Online at:</strong> <a href="https://attendee.gotowebinar.com/register/5522842960170307676">Register Here</a></p>
-            <p><strong>Batch Starts:</strong> January 10th, 2026 </p>
-
-            <p><strong>Topics Covered:</strong></p>
-              <li>Data Analysis</li>
-               <li>Machine Learning</li>
-               <li>Deep Learning</li>
-               <li>Gen AI</li>
-               <li>RAG</li>
-               <li>Agentic AI</li>
-               <li>MLOps</li>
-           </ul>
-
-            <p><strong>Join WhatsApp Group for announcements:</strong> <a href="https://chat.whatsapp.com/CKn3I9NbPSRKfFLJndcld9">Join Here</a></p>
-            <p><strong>In-person orientation:</strong> 6500 Dublin Blvd., Ste. 218, Dublin, CA 94568</p>
-            <p>If you know someone who’s still deciding, remind them too — this is the <strong>last call</strong> for this batch!</p>
-            <p><strong>Earn up to $50 Amazon gift card</strong> as a referral bonus for each successful enrollment (T&C apply).</p>
-
-            <p><strong>📞 Contact:</strong> +1 925-557-1053</p>
-            <p><a href="tel:+919966566721">Gautam</a> or <a href="tel:+917993041323">Jafar</a> for details.</p>
-
-            <div style="text-align: center; margin-top: 30px;">
-                <a href="https://www.facebook.com/WBLAIML" target="_blank" style="background-color:#3b5998; color:#fff; padding:8px 16px; text-decoration:none; border-radius:5px; display:inline-block; margin:5px;">
-                <img src="https://cdn-icons-png.flaticon.com/24/145/145802.png" alt="Facebook" style="height: 18px; vertical-align: middle; margin-right: 6px;"> Facebook
-                </a>
-                <a href="https://www.linkedin.com/company/107532599/admin/dashboard/" target="_blank" style="background-color:#0077b5; color:#fff; padding:8px 16px; text-decoration:none; border-radius:5px; display:inline-block; margin:5px;">
-                <img src="https://cdn-icons-png.flaticon.com/24/145/145807.png" alt="LinkedIn" style="height: 18px; vertical-align: middle; margin-right: 6px;"> LinkedIn
-                </a>
-            </div>
-
-            <p style="margin-top:20px; text-align:center; font-weight:bold; color:#d9534f;">
-                Don’t wait. Join now and explore your future in the AIML, See you in class!
-            </p>
-
-            <hr style="margin-top: 30px; border: none; border-top: 1px solid #ddd;">
-            <p style="font-size: 12px; color: #888; text-align: center;">
-                Don’t want to hear from us again?
-                <a href="https://www.whitebox-learning.com/leads_unsubscribe?email={to_email}" style="color:#888;">Unsubscribe</a>
-            </p>
-            </div>
-        </body>
-    </html>
+    def __init__(self):
+        self.email_accounts_file = os.getenv("EMAIL_ACCOUNTS_FILE")
+        self.smtp_host = os.getenv("SMTP_SERVER")
+        self.smtp_port = int(os.getenv("SMTP_PORT", 587))
+        self.reply_to = os.getenv("REPLY_TO_EMAIL")
+        self.email_delay = int(os.getenv("EMAIL_DELAY_SECONDS", 2))
+        self.smtp_keepalive = float(os.getenv("SMTP_KEEPALIVE_SECONDS", 30))
+        # "serial" sends from one account at a time, "async" sends from all accounts in parallel,
+        # "sharded" splits leads and accounts across SHARD_WORKERS processes
+        self.send_mode = os.getenv("SEND_MODE", "serial").lower()
+        self.shard_workers = int(os.getenv("SHARD_WORKERS", os.cpu_count() or 1))
+        self.max_leads_per_run = MAX_LEADS_PER_RUN
+        # Which eligible leads make the batch: "file" (first in the CSV) or a ranking from
+        # lead_priority.PRIORITIES, e.g. "never_contacted,recent"
+        self.lead_priority = os.getenv("LEAD_PRIORITY", "file")
+
+        # Transient failures are retried with backoff; throttled or locked accounts cool down
+        self.retry_max_attempts = int(os.getenv("RETRY_MAX_ATTEMPTS", 3))
+        self.retry_base_delay = float(os.getenv("RETRY_BASE_DELAY", 30))
+        self.account_cooldown = float(os.getenv("ACCOUNT_COOLDOWN_SECONDS", 900))
+
+        # Sends per account over the last hour/day survive across runs; accounts can
+        # override the defaults with DAILY_LIMIT / HOURLY_LIMIT in email_accounts.json
+        self.quota_ledger_db = os.getenv("QUOTA_LEDGER_DB", "logs/quota_ledger.db")
+        self.default_daily_limit = int(os.getenv("DEFAULT_DAILY_LIMIT", 500))
+        self.default_hourly_limit = int(os.getenv("DEFAULT_HOURLY_LIMIT", 100))
+
+        # Sends to one recipient domain (gmail.com, outlook.com, ...) across all accounts are capped
+        # at DOMAIN_RATE_PER_MINUTE with bursts of DOMAIN_BURST; DOMAIN_RATE_LIMITS overrides single
+        # domains ("gmail.com=120,yahoo.com=30"). 0 turns the cap off.
+        self.domain_rate = float(os.getenv("DOMAIN_RATE_PER_MINUTE", 60))
+        self.domain_burst = int(os.getenv("DOMAIN_BURST", 5))
+        self.domain_limits = parse_domain_limits(os.getenv("DOMAIN_RATE_LIMITS", ""))
+
+        # Email copy lives in templates/, compiled once per run
+        self.campaign_file = os.getenv("CAMPAIGN_FILE", "templates/campaign.json")
+
+        # Optional two-stage pipeline: messages are rendered into SPOOL_DIR first (by a run that finds
+        # the spool empty, or ahead of time with "python message_spool.py render") and runs only send
+        # the prepared bytes
+        self.send_from_spool = _flag("SEND_FROM_SPOOL")
+        self.spool_dir = os.getenv("SPOOL_DIR", "spool")
+        self.spool_render_workers = int(os.getenv("SPOOL_RENDER_WORKERS", os.cpu_count() or 1))
+
+        self.journal_fsync_every = int(os.getenv("JOURNAL_FSYNC_EVERY", 1))
+        self.journal_compact_threshold = int(os.getenv("JOURNAL_COMPACT_THRESHOLD", 5000))
+
+        # Addresses already emailed or unsubscribed, across runs and lead files
+        self.suppression_db = os.getenv("SUPPRESSION_DB", "logs/suppression.db")
+
+        # Unsubscribes from the WBL site are pulled (only what changed since the last sync) while
+        # leads are selected; sending waits up to UNSUBSCRIBE_SYNC_TIMEOUT seconds for the sync
+        self.unsubscribe_sync = _flag("UNSUBSCRIBE_SYNC", "true")
+        self.unsubscribe_cache_file = os.getenv("UNSUBSCRIBE_CACHE_FILE", UNSUBSCRIBE_CACHE_FILE)
+        self.unsubscribe_sync_timeout = float(os.getenv("UNSUBSCRIBE_SYNC_TIMEOUT", 30))
+
+        # Sent log stays open for the whole run and is flushed in batches
+        self.sent_log_flush_rows = int(os.getenv("SENT_LOG_FLUSH_ROWS", 50))
+        self.sent_log_flush_seconds = float(os.getenv("SENT_LOG_FLUSH_SECONDS", 5))
+        self.sent_log_durability = os.getenv("SENT_LOG_DURABILITY", "buffered")
+        # Rows of past months ("day" for past days) move into compressed, indexed segments
+        # in SENT_LOG_ARCHIVE_DIR; "off" keeps everything in the CSV
+        self.sent_log_rotate = os.getenv("SENT_LOG_ROTATE", "month").lower()
+        self.sent_log_archive_dir = os.getenv("SENT_LOG_ARCHIVE_DIR", SENT_ARCHIVE_DIR)
+
+        # Send counts are reported in the background and spooled if the API is down
+        self.activity_flush_seconds = float(os.getenv("ACTIVITY_FLUSH_SECONDS", 300))
+        self.activity_flush_count = int(os.getenv("ACTIVITY_FLUSH_COUNT", 500))
+        self.activity_flush_timeout = float(os.getenv("ACTIVITY_FLUSH_TIMEOUT", 10))
+
+        # Emailed leads are uploaded as vendor contacts (with the account that emailed them) at the
+        # end of each run, in chunks of VENDOR_UPLOAD_CHUNK_SIZE; unfinished uploads resume next run
+        self.vendor_contact_sync = _flag("VENDOR_CONTACT_SYNC")
+        self.vendor_upload_chunk_size = int(os.getenv("VENDOR_UPLOAD_CHUNK_SIZE", UPLOAD_CHUNK_SIZE))
 
+        # Per-phase timings and counters, written out after every run when METRICS_ENABLED is set
+        self.metrics_enabled = _flag("METRICS_ENABLED")
+        self.metrics_json_file = os.getenv("METRICS_JSON_FILE", "logs/run_metrics.json")
+        self.metrics_prom_file = os.getenv("METRICS_PROM_FILE", "logs/run_metrics.prom")
 
+        # WBL API login and SMTP sessions are opened in the background while leads are selected
+        self.warm_up = _flag("WARM_UP_CONNECTIONS", "true")
+        # Seconds from run() to the first send (local state and lead selection; network is not waited on)
+        self.startup_budget = float(os.getenv("STARTUP_BUDGET_SECONDS", 2))
 
+        # Daemon mode (--daemon): lead files are checked for new rows every DAEMON_POLL_SECONDS and
+        # sent in batches of up to DAEMON_BATCH_SIZE; unsubscribes, the API token, vendor contacts
+        # and metrics are refreshed every DAEMON_SYNC_SECONDS
+        self.daemon_poll_seconds = float(os.getenv("DAEMON_POLL_SECONDS", 30))
+        self.daemon_batch_size = int(os.getenv("DAEMON_BATCH_SIZE", 50))
+        self.daemon_sync_seconds = float(os.getenv("DAEMON_SYNC_SECONDS", 300))
+        self.leads_drop_dir = os.getenv("LEADS_DROP_DIR", LEADS_DROP_DIR)
+
+
+def _resource(factory):
+    """Runtime property created on first access, once even when several threads ask at the same time"""
+    name = factory.__name__
+
+    def get(self):
+        try:
+            return self._resources[name]
+        except KeyError:
+            with self._lock:
+                if name not in self._resources:
+                    self._resources[name] = factory(self)
+                return self._resources[name]
+
+    return property(get, doc=factory.__doc__)
+
+
+class Runtime:
+    """
+    Settings plus everything a run opens: the WBL API client, sender accounts,
+    SMTP pool, journal, logs and indexes. Each is created the first time it is
+    used, so importing main has no side effects and a dry run never touches
+    SMTP or the WBL API. close() releases whatever was created.
     """
 
-    msg = MIMEMultipart("related")
-    msg["Subject"] = subject
-    msg["From"] = f"Whitebox Learning <{account['EMAIL_USER']}>"
-    msg["To"] = to_email
-    msg["Reply-To"] = REPLY_TO_EMAIL
-    msg_alternative = MIMEMultipart("alternative")
-    msg.attach(msg_alternative)
-    msg_alternative.attach(MIMEText(html_body, "html", "utf-8"))
+    # close() order for the resources that were created
+    CLOSE_ORDER = (
+        "smtp_pool", "activity_reporter", "contact_uploader", "journal", "sent_log", "suppression", "quota_ledger", "api_logger"
+    )
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-        server.starttls()
-        server.login(account['EMAIL_USER'], account['EMAIL_PASS'])
-        server.send_message(msg)
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._resources = {}
+        self._lock = threading.RLock()
+        self.background = []    # warm-up threads, waited for briefly on close()
+        # Set to stop sending after the current message (daemon shutdown)
+        self.stopping = threading.Event()
 
-    return account['EMAIL_USER']
+    @_resource
+    def metrics(self):
+        return RunMetrics(enabled=self.settings.metrics_enabled)
 
-def run():
-    print(f"Reading from {CSV_FILE}...")
-    
-    # Read all rows
-    all_rows = []
-    fieldnames = []
+    @_resource
+    def api_logger(self):
+        # requests is the slowest import by far; runs that never reach the API skip it
+        from job_activity_logger import JobActivityLogger
+        return JobActivityLogger(metrics=self.metrics)
+
+    @_resource
+    def activity_reporter(self):
+        # The API client (and requests with it) is built on the reporter thread, when it first posts
+        return ActivityReporter(
+            lambda: self.api_logger,
+            flush_interval=self.settings.activity_flush_seconds,
+            flush_threshold=self.settings.activity_flush_count
+        )
+
+    @_resource
+    def contact_uploader(self):
+        """Vendor contact upload queue, or None when VENDOR_CONTACT_SYNC is off"""
+        if not self.settings.vendor_contact_sync:
+            return None
+        return ContactUploader(self.api_logger, chunk_size=self.settings.vendor_upload_chunk_size)
+
+    @_resource
+    def email_accounts(self):
+        """Sender accounts from EMAIL_ACCOUNTS_FILE"""
+        if not self.settings.email_accounts_file:
+            raise RuntimeError("EMAIL_ACCOUNTS_FILE is not set")
+        with open(self.settings.email_accounts_file, 'r') as f:
+            return json.load(f)
+
+    def reload_email_accounts(self):
+        """Read EMAIL_ACCOUNTS_FILE again; SMTP sessions of accounts that were removed or changed are closed"""
+        with open(self.settings.email_accounts_file, 'r') as f:
+            accounts = json.load(f)
+        if not isinstance(accounts, list) or not all(isinstance(entry, dict) and 'EMAIL_USER' in entry for entry in accounts):
+            raise ValueError("expected a list of accounts with EMAIL_USER")
+        with self._lock:
+            previous = {entry['EMAIL_USER']: entry for entry in self._resources.get("email_accounts") or []}
+            self._resources["email_accounts"] = accounts
+            # Rebuilt on next use over the same quota ledger and circuit breaker
+            self._resources.pop("account_scheduler", None)
+            pool = self._resources.get("smtp_pool")
+            breaker = self._resources.get("circuit_breaker")
+        current = {entry['EMAIL_USER']: entry for entry in accounts}
+        for user, entry in previous.items():
+            if current.get(user) != entry:
+                if pool is not None:
+                    pool.close(user)
+                # New credentials or limits get a fresh start even if the account was retired
+                if breaker is not None:
+                    breaker.reset(user)
+        return accounts
+
+    @_resource
+    def retry_policy(self):
+        return RetryPolicy(max_attempts=self.settings.retry_max_attempts, base_delay=self.settings.retry_base_delay)
+
+    @_resource
+    def circuit_breaker(self):
+        return CircuitBreaker(cooldown=self.settings.account_cooldown)
+
+    @_resource
+    def quota_ledger(self):
+        return QuotaLedger(self.settings.quota_ledger_db)
+
+    @_resource
+    def account_scheduler(self):
+        return AccountScheduler(
+            self.email_accounts,
+            self.quota_ledger,
+            self.circuit_breaker,
+            default_daily_limit=self.settings.default_daily_limit,
+            default_hourly_limit=self.settings.default_hourly_limit
+        )
+
+    @_resource
+    def smtp_pool(self):
+        """One authenticated SMTP session per sender account, reused across sends"""
+        return SMTPConnectionPool(
+            self.settings.smtp_host,
+            self.settings.smtp_port,
+            keepalive_interval=self.settings.smtp_keepalive,
+            metrics=self.metrics
+        )
+
+    @_resource
+    def domain_throttle(self):
+        """Per-recipient-domain token buckets, or None when no domain is capped"""
+        if not self.settings.domain_rate and not self.settings.domain_limits:
+            return None
+        return DomainThrottle(self.settings.domain_rate, self.settings.domain_burst, self.settings.domain_limits)
+
+    @_resource
+    def campaign(self):
+        return Campaign(self.settings.campaign_file)
+
+    @_resource
+    def message_factory(self):
+        return MessageFactory(self.campaign, self.settings.reply_to)
+
+    @_resource
+    def spool(self):
+        """The campaign's message spool, or None when sending straight from the CSV"""
+        if not self.settings.send_from_spool:
+            return None
+        return MessageSpool(self.settings.spool_dir, self.campaign.name)
+
+    @_resource
+    def journal(self):
+        return SendJournal(JOURNAL_FILE, fsync_every=self.settings.journal_fsync_every)
+
+    @_resource
+    def suppression(self):
+        return SuppressionIndex(self.settings.suppression_db)
+
+    @_resource
+    def unsubscribes(self):
+        return UnsubscribeCache(self.settings.unsubscribe_cache_file)
+
+    @_resource
+    def exclude(self):
+        """Addresses no run may email: synced unsubscribes first (a set lookup), then the suppression index"""
+        return AnyOf(self.unsubscribes, self.suppression)
+
+    @_resource
+    def sent_log(self):
+        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        archive = None
+        if self.settings.sent_log_rotate != "off":
+            archive = SentLogArchive(self.settings.sent_log_archive_dir, self.settings.sent_log_rotate)
+        return SentLogWriter(
+            LOG_FILE,
+            flush_rows=self.settings.sent_log_flush_rows,
+            flush_interval=self.settings.sent_log_flush_seconds,
+            durability=self.settings.sent_log_durability,
+            archive=archive
+        )
+
+    def close(self):
+        for thread in self.background:
+            thread.join(WARM_UP_JOIN_TIMEOUT)
+        self.background = []
+        with self._lock:
+            for name in self.CLOSE_ORDER:
+                resource = self._resources.pop(name, None)
+                if resource is None:
+                    continue
+                if name == "activity_reporter":
+                    resource.close(self.settings.activity_flush_timeout)
+                else:
+                    resource.close()
+
+
+_runtime: Optional[Runtime] = None
+_runtime_lock = threading.Lock()
+
+def runtime():
+    """This process's Runtime; .env is loaded and the settings read on the first call"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            load_dotenv()
+            _runtime = Runtime(Settings())
+        return _runtime
+
+def close_runtime():
+    """Close everything the current Runtime opened; the next runtime() call starts fresh"""
+    global _runtime
+    with _runtime_lock:
+        rt, _runtime = _runtime, None
+    if rt is not None:
+        rt.close()
+
+def configure_logging():
+    """Log to logs/activity_logger.log and the console"""
+    os.makedirs(os.path.dirname(ACTIVITY_LOG_FILE), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(ACTIVITY_LOG_FILE),
+            logging.StreamHandler()
+        ]
+    )
+
+def get_next_email_account():
+    """Least-loaded account with quota left that is not cooling down. None if there is none."""
+    return runtime().account_scheduler.next_account()
+
+def log_sent(email, name, sender_email, timestamp=None):
+    rt = runtime()
+    with rt.metrics.phase("sent_log_write"):
+        rt.sent_log.write(sender_email, email, name, timestamp)
+
+def send_email(to_email, to_name, account=None):
+    rt = runtime()
+    if account is None:
+        account = get_next_email_account()
+        if account is None:
+            raise RuntimeError("No email account available")
+
+    sender_email = account['EMAIL_USER']
+    with rt.metrics.phase("render"):
+        raw = rt.message_factory.build(sender_email, to_email, to_name)
     try:
-        with open(CSV_FILE, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames
-            all_rows = list(reader)
-    except FileNotFoundError:
-        print(f"Error: {CSV_FILE} not found.")
-        return
+        rt.smtp_pool.sendmail(account, sender_email, [to_email], raw)
+    except Exception as e:
+        rt.metrics.count("send_errors", account=sender_email, error=classify_failure(e))
+        raise
 
-    # Identify candidates
-    leads_to_email = []
-    for row in all_rows:
-        # Check conditions: massemail_unsubscribe != 1 (True) AND massemail_email_sent != 1 (True)
-        # CSV values are strings "1"/"0"
-        is_unsubscribed = row.get("massemail_unsubscribe", "0") == "1"
-        is_sent = row.get("massemail_email_sent", "0") == "1"
-        
-        if not is_unsubscribed and not is_sent:
-            leads_to_email.append(row)
-    
-    # Limit to 800
-    leads_to_process = leads_to_email[:800]
-    
-    if not leads_to_process:
-        print("No emails to send.")
-        return
+    return sender_email
+
+def send_spooled(message, account):
+    """Send a message prepared by the render stage; only the sender address is filled in"""
+    rt = runtime()
+    sender_email = account['EMAIL_USER']
+    try:
+        rt.smtp_pool.sendmail(account, sender_email, [message.email], message.for_sender(sender_email))
+    except Exception as e:
+        rt.metrics.count("send_errors", account=sender_email, error=classify_failure(e))
+        raise
+    return sender_email
+
+def _send_lead(lead, account):
+    message = lead.get("spool_message")
+    if message is not None:
+        return send_spooled(message, account)
+    return send_email(*_lead_address(lead), account=account)
+
+def _lead_address(lead):
+    """Return (email, name) for a lead that went through _intake()"""
+    return lead["email"], lead.get("full_name", "").strip()
+
+def _intake(leads):
+    """
+    Drop leads whose address cannot be sent to, clean up the rest in place
+    and spread recipient domains evenly over the batch
+    """
+    rt = runtime()
+
+    def skip(lead):
+        print(f"Skipping invalid email: {lead.get('email', '').strip()}")
+        rt.metrics.count("invalid_addresses")
 
-    print(f"Found {len(leads_to_process)} leads to email (Limit: 800). Starting batch...")
+    with rt.metrics.phase("intake"):
+        return clean_leads(leads, on_invalid=skip)
 
+def _record_sent(lead, sender_email):
+    rt = runtime()
+    email, name = lead["email"].strip(), lead.get("full_name", "").strip()
+
+    # Update status in memory
+    lead[SENT_COLUMN] = "1"
+    with rt.metrics.phase("journal_write"):
+        rt.journal.record(email)
+    with rt.metrics.phase("suppression_write"):
+        rt.suppression.mark_sent(email, sender_email)
+    rt.account_scheduler.record_send(sender_email)
+    rt.activity_reporter.add()
+    rt.metrics.count("emails_sent", account=sender_email)
+    if rt.contact_uploader is not None:
+        rt.contact_uploader.add(lead, sender_email)
+    if "spool_message" in lead:
+        rt.spool.complete(lead["spool_message"].path)
+    # Note: "last_modified" column logic from SQL is skipped as it doesn't appear to be in CSV headers
+    # (only "Entry Date", "Closed Date" etc are present). We only verify Sent flag.
+
+    log_sent(email, name, sender_email)
+    print(f"Sent to {email} using {sender_email}")
+
+def _record_failed(lead, error):
+    rt = runtime()
+    kind = classify_failure(error)
+    lead["send_error"] = error
+    rt.metrics.count("emails_failed", error=kind)
+    # Addresses the server refused are parked in failed/; anything else goes back to the spool at the end of the run
+    if is_rejection(error) and "spool_message" in lead:
+        rt.spool.fail(lead["spool_message"].path)
+    print(f"Failed to send to {lead['email'].strip()}: {error}")
+
+def send_batch_serial(leads):
+    rt = runtime()
+    metrics, circuit_breaker, retry_policy = rt.metrics, rt.circuit_breaker, rt.retry_policy
     successful_sends = 0
+    throttle = rt.domain_throttle
+    pending = deque(leads)
+    retries = RetryQueue()
+    last_errors = {}    # id(lead) -> last transient error, for leads waiting for a retry
+
+    def put_back(lead, attempt):
+        # Not the lead's fault; it goes first in line for the next account
+        if attempt == 0:
+            pending.appendleft(lead)
+        else:
+            retries.push(lead, attempt, 0)
+
+    while pending or retries:
+        if rt.stopping.is_set():
+            print("Stopping, unsent leads stay queued")
+            break
+        ready = retries.pop_ready()
+        if ready is not None:
+            lead, attempt = ready
+        elif pending:
+            # Skip ahead to a lead whose domain is not being held back
+            lead, attempt = (throttle.take_next(pending) if throttle is not None else pending.popleft()), 0
+        else:
+            rt.stopping.wait(retries.seconds_until_ready())
+            continue
+
+        account = get_next_email_account()
+        if account is None:
+            if rt.account_scheduler.quota_exhausted():
+                # Unsent leads stay eligible for the next run
+                print("All email accounts have used their sending quota, stopping batch")
+                break
+            users = [entry['EMAIL_USER'] for entry in rt.email_accounts if rt.account_scheduler.has_quota(entry)]
+            if all(circuit_breaker.is_retired(user) for user in users):
+                print("All email accounts are out of rotation, stopping batch")
+                # Leads that were tried fail with their last error; the rest stay eligible for the next run
+                for lead in [lead] + list(pending) + [lead for lead, _ in retries.drain()]:
+                    if id(lead) in last_errors:
+                        _record_failed(lead, last_errors[id(lead)])
+                break
+            wait = min(circuit_breaker.remaining(user) for user in users if not circuit_breaker.is_retired(user))
+            print(f"All email accounts are cooling down, waiting {wait:.0f} seconds...")
+            with metrics.phase("cooldown_wait"):
+                rt.stopping.wait(wait)
+            put_back(lead, attempt)
+            continue
 
-    for lead in leads_to_process:
-        email = lead.get("email", "").strip()
-        name = lead.get("full_name", "").strip()
+        if throttle is not None:
+            held = throttle.reserve(domain_of(lead["email"]))
+            if held > 0:
+                with metrics.phase("domain_wait"):
+                    stopped = rt.stopping.wait(held)
+                if stopped:
+                    put_back(lead, attempt)
+                    continue
 
-        if not email or '@' not in email:
-            print(f"Skipping invalid email: {email}")
+        try:
+            sender_email = _send_lead(lead, account)
+        except Exception as e:
+            kind = classify_failure(e)
+            if kind == ACCOUNT:
+                cooldown = circuit_breaker.trip(account['EMAIL_USER'])
+                metrics.count("account_cooldowns", account=account['EMAIL_USER'])
+                print(f"Account {account['EMAIL_USER']} out of rotation for {cooldown:.0f} seconds: {e}")
+                put_back(lead, attempt)
+            elif kind == TRANSIENT and retry_policy.should_retry(attempt + 1):
+                delay = retry_policy.delay(attempt + 1)
+                metrics.count("send_retries", error=kind)
+                print(f"Temporary failure for {lead['email'].strip()}, retrying in {delay:.0f} seconds: {e}")
+                retries.push(lead, attempt + 1, delay)
+                last_errors[id(lead)] = e
+            else:
+                _record_failed(lead, e)
+            # Nothing was delivered, so there is nothing to pace
             continue
 
+        circuit_breaker.record_success(account['EMAIL_USER'])
+        _record_sent(lead, sender_email)
+        successful_sends += 1
+
+        # Add delay between sends
+        if rt.settings.email_delay > 0:
+            print(f"Waiting {rt.settings.email_delay} seconds before next email...")
+            with metrics.phase("delay_sleep", account=account['EMAIL_USER']):
+                rt.stopping.wait(rt.settings.email_delay)
+
+    return successful_sends
+
+def send_batch_async(leads):
+    """Send from every account in parallel, each paced by its own delay"""
+    rt = runtime()
+    print(f"Sending concurrently from {len(rt.email_accounts)} accounts...")
+
+    return asyncio.run(send_all(
+        leads,
+        rt.email_accounts,
+        _send_lead,
+        on_sent=_record_sent,
+        on_failed=_record_failed,
+        default_delay=rt.settings.email_delay,
+        retry_policy=rt.retry_policy,
+        breaker=rt.circuit_breaker,
+        has_quota=rt.account_scheduler.has_quota,
+        metrics=rt.metrics,
+        throttle=rt.domain_throttle,
+        # A daemon shutting down stops the batch before the next send
+        stop=rt.stopping
+    ))
+
+def send_batch_sharded(leads):
+    """Send from several worker processes, then merge their results into the CSV journal and sent log"""
+    rt = runtime()
+    shard_leads = [{"email": email, "full_name": name} for email, name in map(_lead_address, leads)]
+
+    shard_settings = {
+        "smtp_host": rt.settings.smtp_host,
+        "smtp_port": rt.settings.smtp_port,
+        "smtp_keepalive": rt.settings.smtp_keepalive,
+        "campaign_file": rt.settings.campaign_file,
+        "reply_to": rt.settings.reply_to,
+        "delay": rt.settings.email_delay,
+        "retry_max_attempts": rt.settings.retry_max_attempts,
+        "retry_base_delay": rt.settings.retry_base_delay,
+        "account_cooldown": rt.settings.account_cooldown,
+        "quota_remaining": {account['EMAIL_USER']: rt.account_scheduler.remaining(account) for account in rt.email_accounts},
+        "shard_log_dir": SHARD_LOG_DIR,
+        "domain_rate": rt.settings.domain_rate,
+        "domain_burst": rt.settings.domain_burst,
+        "domain_limits": rt.settings.domain_limits
+    }
+    run_sharded(shard_leads, rt.email_accounts, shard_settings, rt.settings.shard_workers, metrics=rt.metrics)
+    with rt.metrics.phase("shard_merge"):
+        return merge_shard_results(leads)
+
+def merge_shard_results(leads):
+    """Fold per-shard sent logs into the journal, suppression index and logs/sent_emails.csv"""
+    rt = runtime()
+    leads_by_email = {normalize_email(lead.get("email", "")): lead for lead in leads}
+    merged = 0
+
+    for sender_email, email, name, timestamp in read_shard_logs(SHARD_LOG_DIR):
+        lead = leads_by_email.get(normalize_email(email))
+        if lead is not None:
+            lead[SENT_COLUMN] = "1"
+        if rt.contact_uploader is not None:
+            rt.contact_uploader.add(lead or {"email": email, "full_name": name}, sender_email)
+        rt.journal.record(email)
+        rt.suppression.mark_sent(email, sender_email, timestamp)
+        rt.account_scheduler.record_send(sender_email, datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").timestamp())
+        log_sent(email, name, sender_email, timestamp)
+        rt.activity_reporter.add()
+        merged += 1
+
+    rt.sent_log.flush()
+    rt.journal.sync()
+    clear_shard_logs(SHARD_LOG_DIR)
+    return merged
+
+def run():
+    rt = runtime()
+    started = time.perf_counter()
+    rt.activity_reporter.start()
+    try:
+        _run_campaign(rt, started)
+        # Also picks up contacts a previous run could not upload, even when nothing was sent now
+        if rt.contact_uploader is not None:
+            with rt.metrics.phase("vendor_upload"):
+                saved, refused, left = rt.contact_uploader.upload()
+            print(f"Vendor contacts: {saved} uploaded, {refused} refused, {left} queued for the next run")
+    finally:
+        metrics = rt.metrics
+        close_runtime()
+        metrics.observe("run", time.perf_counter() - started)
+        try:
+            metrics.write_reports(rt.settings.metrics_json_file, rt.settings.metrics_prom_file)
+        except OSError as e:
+            print(f"Could not write run metrics: {e}")
+
+def _start_warm_up(rt):
+    """Log in to the WBL API and open SMTP sessions in the background while leads are selected"""
+    def warm_api():
         try:
-            sender_email = send_email(email, name)
-            
-            # Update status in memory
-            lead["massemail_email_sent"] = "1"
-            # Note: "last_modified" column logic from SQL is skipped as it doesn't appear to be in CSV headers 
-            # (only "Entry Date", "Closed Date" etc are present). We only verify Sent flag.
-
-            log_sent(email, name, sender_email)
-            print(f"Sent to {email} using {sender_email}")
-            successful_sends += 1
+            rt.api_logger.warm_up()
         except Exception as e:
-            print(f"Failed to send to {email}: {e}")
+            print(f"WBL API warm-up failed: {e}")
 
-        # Add delay between email attempts
-        if EMAIL_DELAY_SECONDS > 0:
-            print(f"Waiting {EMAIL_DELAY_SECONDS} seconds before next email...")
-            time.sleep(EMAIL_DELAY_SECONDS)
+    def warm_smtp():
+        if rt.settings.send_mode == "sharded" and rt.spool is None:
+            return    # shard workers open their own sessions
+        if rt.settings.send_mode == "serial":
+            first = rt.account_scheduler.next_account()
+            accounts = [first] if first is not None else []
+        else:
+            accounts = [account for account in rt.email_accounts if rt.account_scheduler.has_quota(account)]
+        for account in accounts:
+            try:
+                rt.smtp_pool.warm(account)
+            except Exception as e:
+                # The first real send reconnects and handles the error
+                print(f"SMTP warm-up for {account['EMAIL_USER']} failed: {e}")
 
-    # Save changes back to CSV if any emails sent
-    if successful_sends > 0:
-        print("Saving updates to CSV...")
-        # Create a temp file first to be safe
-        temp_file = CSV_FILE + ".tmp"
+    for target, name in ((warm_api, "warm-up-api"), (warm_smtp, "warm-up-smtp")):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        rt.background.append(thread)
+
+def _start_unsubscribe_sync(rt):
+    """Pull new unsubscribes in the background; returns the thread to wait for before sending"""
+    def sync():
         try:
-            with open(temp_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(all_rows)
-            
-            # Replace original
-            shutil.move(temp_file, CSV_FILE)
+            with rt.metrics.phase("unsubscribe_sync"):
+                added = rt.api_logger.sync_unsubscribes(rt.unsubscribes)
+        except Exception as e:
+            print(f"Unsubscribe sync failed: {e}")
+            return
+        if added:
+            rt.metrics.count("unsubscribes_synced", amount=added)
+            print(f"Synced {added} new unsubscribes")
+
+    thread = threading.Thread(target=sync, name="unsubscribe-sync", daemon=True)
+    thread.start()
+    rt.background.append(thread)
+    return thread
+
+def _drop_unsubscribed(rt, leads, sync_thread):
+    """Wait for the unsubscribe sync, then drop leads that opted out since they were selected"""
+    if sync_thread is not None:
+        sync_thread.join(rt.settings.unsubscribe_sync_timeout)
+        if sync_thread.is_alive():
+            print("Unsubscribe sync is still running, sending with the previous list")
+    unsubscribes = rt.unsubscribes
+    kept = []
+    for lead in leads:
+        if lead["email"] in unsubscribes:
+            if "spool_message" in lead:
+                rt.spool.complete(lead["spool_message"].path)
+            continue
+        kept.append(lead)
+    if len(kept) < len(leads):
+        print(f"Skipping {len(leads) - len(kept)} leads that unsubscribed")
+    return kept
+
+def _check_startup_budget(rt, started):
+    startup = time.perf_counter() - started
+    rt.metrics.observe("startup", startup)
+    if startup > rt.settings.startup_budget:
+        print(f"Warning: startup took {startup:.2f}s, over the {rt.settings.startup_budget:.2f}s budget")
+
+def _select_leads(rt):
+    with rt.metrics.phase("csv_select"):
+        return select_leads(
+            CSV_FILE,
+            rt.settings.max_leads_per_run,
+            exclude=rt.exclude,
+            key=priority_key(rt.settings.lead_priority)
+        )
+
+def _claim_spooled_leads(rt):
+    """Claim prepared messages from the spool, rendering the next batch from the CSV first if it is empty"""
+    spool = rt.spool
+    spool.recover(lambda email: email in rt.exclude)
+    if spool.pending_count() == 0:
+        addresses = [_lead_address(lead) for lead in _intake([lead for _, lead in _select_leads(rt)])]
+        if addresses:
+            print(f"Rendering {len(addresses)} messages into {spool.root}...")
+            with rt.metrics.phase("spool_render"):
+                render_to_spool(
+                    addresses,
+                    rt.settings.campaign_file,
+                    rt.settings.reply_to,
+                    rt.settings.spool_dir,
+                    rt.settings.spool_render_workers
+                )
+    claimed = spool.claim(rt.settings.max_leads_per_run, exclude=rt.exclude)
+    # Addresses were checked before rendering
+    return interleave_by_domain([message.as_lead() for message in claimed])
+
+def _compact_journal(rt):
+    """Sent flags are already durable in the journal; fold them into the CSV now and then"""
+    journal = rt.journal
+    journal.sync()
+    if journal.entries and journal.entries >= rt.settings.journal_compact_threshold:
+        print("Compacting send journal into CSV...")
+        try:
+            with rt.metrics.phase("csv_compact"):
+                journal.compact(CSV_FILE)
             print("CSV updated successfully.")
         except Exception as e:
             print(f"Error saving CSV: {e}")
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
 
-    # Log activity to WBL API
+def _run_campaign(rt, started):
+    print(f"Reading from {CSV_FILE}...")
+
+    sync_thread = _start_unsubscribe_sync(rt) if rt.settings.unsubscribe_sync else None
+    if rt.settings.warm_up:
+        _start_warm_up(rt)
+
+    # Replay sends that were journaled but not yet folded into the CSV
+    with rt.metrics.phase("journal_replay"):
+        rt.suppression.mark_sent_many((email, None, None) for email in rt.journal.replay())
+
+    # Stream the file and stop as soon as the batch is full
+    spool = rt.spool
+    try:
+        if spool is not None:
+            leads_to_process = _claim_spooled_leads(rt)
+        else:
+            leads_to_process = _intake([lead for _, lead in _select_leads(rt)])
+    except FileNotFoundError:
+        print(f"Error: {CSV_FILE} not found.")
+        return
+
+    leads_to_process = _drop_unsubscribed(rt, leads_to_process, sync_thread)
+    if not leads_to_process:
+        print("No emails to send.")
+        return
+
+    _check_startup_budget(rt, started)
+    print(f"Found {len(leads_to_process)} leads to email (Limit: {rt.settings.max_leads_per_run}). Starting batch...")
+
+    send_mode = rt.settings.send_mode
+    try:
+        if send_mode == "async" or (send_mode == "sharded" and rt.spool is not None):
+            # Spooled messages are already rendered, so there is no CPU work to shard
+            successful_sends = send_batch_async(leads_to_process)
+        elif send_mode == "sharded":
+            successful_sends = send_batch_sharded(leads_to_process)
+        else:
+            successful_sends = send_batch_serial(leads_to_process)
+    finally:
+        if rt.spool is not None:
+            # Whatever was not sent or dropped stays queued for the next run
+            rt.spool.release()
+
+    _compact_journal(rt)
+
+    # Report the remaining count to the WBL API (anything undelivered stays spooled for the next run)
+    with rt.metrics.phase("activity_flush"):
+        logging_success = rt.activity_reporter.close(rt.settings.activity_flush_timeout)
     if successful_sends > 0:
-        notes = f"Mass email campaign sent to {successful_sends} leads from CSV"
-        logging_success = api_logger.log_activity(successful_sends, notes)
         if logging_success:
             print(f"\nCampaign complete: {successful_sends} emails sent successfully")
         else:
-            print(f"\nCampaign complete: {successful_sends} emails sent successfully, but activity logging failed")
+            print(f"\nCampaign complete: {successful_sends} emails sent successfully, activity report spooled for retry")
     else:
         print("\nNo emails were sent successfully")
 
-if __name__ == "__main__":
+def dry_run():
+    """Show what the next run would send, without touching SMTP or the WBL API"""
+    rt = runtime()
+    try:
+        try:
+            selected = _select_leads(rt)
+        except FileNotFoundError:
+            print(f"Error: {CSV_FILE} not found.")
+            return 1
+        addresses = [_lead_address(lead) for lead in _intake([lead for _, lead in selected])]
+        quota_left = sum(rt.account_scheduler.remaining(account) for account in rt.email_accounts)
+        print(f"Dry run: {len(addresses)} leads would be emailed from {len(rt.email_accounts)} accounts "
+              f"({rt.settings.send_mode} mode, {quota_left} sends left in today's quota)")
+        for email, name in addresses[:10]:
+            print(f"  {email} ({name or 'no name'})")
+        if len(addresses) > 10:
+            print(f"  ... and {len(addresses) - 10} more")
+        return 0
+    finally:
+        close_runtime()
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+def _keep_sessions_warm(rt):
+    """NOOP idle SMTP sessions (reconnecting dropped ones) of accounts that can still send; close the rest"""
+    pool = rt.smtp_pool
+    open_users = set(pool.open_users())
+    for account in rt.email_accounts:
+        user = account['EMAIL_USER']
+        if user not in open_users:
+            continue
+        if not rt.account_scheduler.has_quota(account):
+            pool.close(user)
+            continue
+        try:
+            pool.warm(account)
+        except Exception as e:
+            print(f"SMTP keepalive for {user} failed: {e}")
+
+def _daemon_sync(rt):
+    """Periodic daemon upkeep: unsubscribes, API token, vendor contacts and the metrics files"""
+    rt.background = [thread for thread in rt.background if thread.is_alive()]
+    if rt.settings.unsubscribe_sync:
+        _start_unsubscribe_sync(rt)
+    try:
+        # Refreshes the token ahead of expiry, so activity reports never wait on a login
+        rt.api_logger.warm_up()
+    except Exception as e:
+        print(f"WBL API token refresh failed: {e}")
+    if rt.contact_uploader is not None and rt.contact_uploader.pending():
+        with rt.metrics.phase("vendor_upload"):
+            rt.contact_uploader.upload()
+    try:
+        rt.metrics.write_reports(rt.settings.metrics_json_file, rt.settings.metrics_prom_file)
+    except OSError as e:
+        print(f"Could not write run metrics: {e}")
+
+def _send_batch(rt, leads):
+    if rt.settings.send_mode == "async":
+        return send_batch_async(leads)
+    return send_batch_serial(leads)
+
+def _attempted(lead):
+    """True if the lead reached an SMTP server and failed there (not just left over when a batch stopped)"""
+    return isinstance(lead.get("send_error"), (smtplib.SMTPException, OSError))
+
+def serve():
+    """
+    Daemon mode: keep the runtime open and send leads as they are added to
+    the lead files, until SIGTERM or Ctrl-C. SMTP sessions and the API token
+    stay warm between batches and EMAIL_ACCOUNTS_FILE is reloaded when it
+    changes. Leads that fail at the SMTP server are left for the next start.
+    """
+    rt = runtime()
+    settings = rt.settings
+    if settings.send_mode == "sharded":
+        print("Daemon mode keeps its SMTP sessions in this process, sending in async mode instead of sharded")
+        settings.send_mode = "async"
+    if settings.send_from_spool:
+        print("Daemon mode sends straight from the lead files, SEND_FROM_SPOOL is ignored")
+        settings.send_from_spool = False
+
+    def request_stop(signum, frame):
+        print(f"Received {signal.Signals(signum).name}, stopping after the current send...")
+        rt.stopping.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    watcher = LeadWatcher([CSV_FILE], settings.leads_drop_dir)
+    queued = deque()    # leads taken from the files and not sent yet
+    accounts_mtime = _mtime(settings.email_accounts_file)
+    next_sync = 0.0
+    quota_note = False
+
+    rt.activity_reporter.start()
+    with rt.metrics.phase("journal_replay"):
+        rt.suppression.mark_sent_many((email, None, None) for email in rt.journal.replay())
+    print(f"Daemon started: watching {CSV_FILE} and {settings.leads_drop_dir}/*.csv every {settings.daemon_poll_seconds:.0f}s")
+    try:
+        while not rt.stopping.is_set():
+            mtime = _mtime(settings.email_accounts_file)
+            if mtime != accounts_mtime:
+                accounts_mtime = mtime
+                try:
+                    accounts = rt.reload_email_accounts()
+                    print(f"Reloaded {settings.email_accounts_file}: {len(accounts)} accounts")
+                except (OSError, ValueError) as e:
+                    print(f"Could not reload {settings.email_accounts_file}, keeping the current accounts: {e}")
+
+            if time.monotonic() >= next_sync:
+                next_sync = time.monotonic() + settings.daemon_sync_seconds
+                _daemon_sync(rt)
+            _keep_sessions_warm(rt)
+
+            if rt.account_scheduler.quota_exhausted():
+                if not quota_note:
+                    print("All email accounts have used their sending quota, waiting for it to free up")
+                    quota_note = True
+                rt.stopping.wait(settings.daemon_poll_seconds)
+                continue
+            quota_note = False
+
+            room = settings.daemon_batch_size - len(queued)
+            if room > 0:
+                with rt.metrics.phase("csv_select"):
+                    new_leads = watcher.take(
+                        room,
+                        exclude=rt.exclude,
+                        skip={normalize_email(lead["email"]) for lead in queued}
+                    )
+                queued.extend(_intake(new_leads))
+
+            batch = [queued.popleft() for _ in range(min(len(queued), settings.daemon_batch_size))]
+            batch = _drop_unsubscribed(rt, batch, None)
+            if not batch:
+                rt.stopping.wait(settings.daemon_poll_seconds)
+                continue
+
+            print(f"Sending {len(batch)} new leads...")
+            sent = _send_batch(rt, batch)
+            _compact_journal(rt)
+            if sent:
+                # The daemon may sit idle for a long time; do not keep the batch's rows buffered meanwhile
+                rt.sent_log.flush()
+            # Leads the batch never got to (quota ran out, shutting down) go first next time
+            queued.extendleft(reversed([
+                lead for lead in batch if lead.get(SENT_COLUMN) != "1" and not _attempted(lead)
+            ]))
+            print(f"Batch done: {sent} sent, {len(queued)} leads waiting")
+            if not sent:
+                # Nothing went out (accounts cooling down or retired); do not spin on the same leads
+                rt.stopping.wait(settings.daemon_poll_seconds)
+    finally:
+        print("Daemon stopping...")
+        metrics = rt.metrics
+        close_runtime()
+        try:
+            metrics.write_reports(settings.metrics_json_file, settings.metrics_prom_file)
+        except OSError as e:
+            print(f"Could not write run metrics: {e}")
+
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive whole number, got {value!r}")
+    return number
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Send the next batch of lead emails")
+    parser.add_argument("--dry-run", action="store_true", help="show what would be sent; no SMTP or WBL API calls")
+    parser.add_argument("--daemon", action="store_true", help="keep running and send new leads as they are added")
+    parser.add_argument("--mode", choices=("serial", "async", "sharded"), help="override SEND_MODE")
+    parser.add_argument("--limit", type=_positive_int, help=f"leads per run (default {MAX_LEADS_PER_RUN})")
+    parser.add_argument("--priority", help="override LEAD_PRIORITY, e.g. recent or never_contacted,recent")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    rt = runtime()
+    if args.mode:
+        rt.settings.send_mode = args.mode
+    if args.limit is not None:
+        rt.settings.max_leads_per_run = args.limit
+    if args.priority:
+        rt.settings.lead_priority = args.priority
+    try:
+        priority_key(rt.settings.lead_priority)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.dry_run:
+        return dry_run()
+    if args.daemon:
+        serve()
+        return 0
     run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,148 @@
+import io
+import sys
+import base64
+import random
+from email import policy
+from email.generator import BytesGenerator
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from typing import Dict, Optional, Tuple
+
+from email_templates import Campaign, TemplateVariant
+
+SENDER_NAME = "Whitebox Learning"
+
+# Same policy and boundary format the generator uses when smtplib flattens a message
+_POLICY = policy.compat32.clone(linesep="\r\n")
+_BOUNDARY_FORMAT = "%%0%dd" % len(repr(sys.maxsize - 1))
+# base64 body lines hold 57 input bytes (76 characters)
+_BASE64_LINE_BYTES = 57
+_BASE64_LINE_CHARS = 76
+
+
+def _assemble(subject: str, sender_email: str, to_email: str, reply_to: str, html_body: str) -> MIMEMultipart:
+    msg = MIMEMultipart("related")
+    msg["Subject"] = subject
+    msg["From"] = f"{SENDER_NAME} <{sender_email}>"
+    msg["To"] = to_email
+    msg["Reply-To"] = reply_to
+    msg_alternative = MIMEMultipart("alternative")
+    msg.attach(msg_alternative)
+    msg_alternative.attach(MIMEText(html_body, "html", "utf-8"))
+    return msg
+
+
+def _render(variant: TemplateVariant, to_email: str, to_name: str) -> Tuple[str, str]:
+    values = {"name": to_name or 'there', "email": to_email}
+    return variant.subject.render(values), variant.html.render(values)
+
+
+def build_message(campaign: Campaign, sender_email: str, to_email: str, to_name: str, reply_to: str) -> MIMEMultipart:
+    """Render the recipient's campaign variant into a MIME message"""
+    variant = campaign.choose_variant(to_email)
+    subject, html_body = _render(variant, to_email, to_name)
+    return _assemble(subject, sender_email, to_email, reply_to, html_body)
+
+
+def serialize_message(msg) -> bytes:
+    """Flatten a message to the exact bytes smtplib's send_message would put on the wire"""
+    with io.BytesIO() as buffer:
+        BytesGenerator(buffer).flatten(msg, linesep="\r\n")
+        return buffer.getvalue()
+
+
+def _base64_lines(data: bytes) -> bytes:
+    encoded = base64.b64encode(data)
+    return b"".join(
+        encoded[i:i + _BASE64_LINE_CHARS] + b"\r\n" for i in range(0, len(encoded), _BASE64_LINE_CHARS)
+    )
+
+
+class _Skeleton:
+    """One variant's message bytes with the per-message parts cut out"""
+
+    # Stand-ins as long as a real boundary, so header folding comes out the same
+    OUTER = "=" * 15 + "O" * len(_BOUNDARY_FORMAT % 0) + "=="
+    INNER = "=" * 15 + "I" * len(_BOUNDARY_FORMAT % 0) + "=="
+    MARKERS = {"Subject": "S", "From": "F", "To": "T"}
+
+    def __init__(self, variant: TemplateVariant, reply_to: str):
+        # Flatten a message with known boundaries and one-letter header values, then cut it up
+        msg = _assemble(self.MARKERS["Subject"], "f", self.MARKERS["To"], reply_to, "")
+        msg.replace_header("From", self.MARKERS["From"])
+        msg.set_boundary(self.OUTER)
+        msg.get_payload(0).set_boundary(self.INNER)
+        reference = serialize_message(msg)
+
+        cuts = [reference.index(f"\r\n{name}: {value}\r\n".encode('ascii')) + 2 for name, value in self.MARKERS.items()]
+        ends = [cut + len(f"{name}: {value}\r\n") for cut, (name, value) in zip(cuts, self.MARKERS.items())]
+        body_at = reference.rindex(f"\r\n--{self.INNER}--".encode('ascii'))
+        if not (cuts[0] < cuts[1] < cuts[2] and ends[0] == cuts[1] and ends[1] == cuts[2]):
+            raise ValueError("Unexpected header layout")
+        self.head = reference[:cuts[0]]
+        self.middle = reference[ends[2]:body_at]
+        self.tail = reference[body_at:]
+
+        # Body lines before the first placeholder are the same for everyone, up to a whole base64 line
+        prefix = variant.html.segments[0].encode('utf-8')
+        self.body_prefix_bytes = len(prefix) - len(prefix) % _BASE64_LINE_BYTES
+        self.body_prefix = _base64_lines(prefix[:self.body_prefix_bytes])
+
+    def join(self, outer: str, inner: str, headers: bytes, body: bytes) -> bytes:
+        outer_bytes, inner_bytes = outer.encode('ascii'), inner.encode('ascii')
+        head = self.head.replace(self.OUTER.encode('ascii'), outer_bytes)
+        middle = self.middle.replace(self.OUTER.encode('ascii'), outer_bytes).replace(self.INNER.encode('ascii'), inner_bytes)
+        tail = self.tail.replace(self.OUTER.encode('ascii'), outer_bytes).replace(self.INNER.encode('ascii'), inner_bytes)
+        return b"".join((head, headers, middle, body, tail))
+
+
+class MessageFactory:
+    """
+    Builds the serialized message for a lead without going through the email
+    package: each variant's MIME skeleton (headers that never change, part
+    headers, boundaries' positions and the static start of the base64 body) is
+    prepared once, and per message only Subject/From/To are folded, the HTML
+    tail is base64 encoded and the pieces are joined.
+
+    build() returns exactly serialize_message(build_message(...)), the bytes
+    smtplib.send_message sends for ASCII addresses, including drawing the
+    boundaries from `random` in the same order.
+    """
+
+    def __init__(self, campaign: Campaign, reply_to: Optional[str]):
+        self.campaign = campaign
+        self.reply_to = reply_to
+        self._skeletons: Dict[str, _Skeleton] = {}
+        self._from_headers: Dict[str, bytes] = {}
+
+    def _skeleton(self, variant: TemplateVariant) -> _Skeleton:
+        skeleton = self._skeletons.get(variant.name)
+        if skeleton is None:
+            skeleton = self._skeletons[variant.name] = _Skeleton(variant, self.reply_to)
+        return skeleton
+
+    def _from_header(self, sender_email: str) -> bytes:
+        header = self._from_headers.get(sender_email)
+        if header is None:
+            header = self._from_headers[sender_email] = _POLICY.fold_binary("From", f"{SENDER_NAME} <{sender_email}>")
+        return header
+
+    def build(self, sender_email: str, to_email: str, to_name: str) -> bytes:
+        # The generator picks the inner boundary first, then the outer one. Its
+        # collision check never fires here: base64 and these headers cannot hold
+        # a "--=" line, and with CRLF line endings it does not see the inner
+        # part's boundary lines either, so equal draws are kept as they are.
+        inner = "=" * 15 + _BOUNDARY_FORMAT % random.randrange(sys.maxsize) + "=="
+        outer = "=" * 15 + _BOUNDARY_FORMAT % random.randrange(sys.maxsize) + "=="
+
+        variant = self.campaign.choose_variant(to_email)
+        skeleton = self._skeleton(variant)
+        subject, html_body = _render(variant, to_email, to_name)
+        headers = b"".join((
+            _POLICY.fold_binary("Subject", subject),
+            self._from_header(sender_email),
+            _POLICY.fold_binary("To", to_email)
+        ))
+        html_bytes = html_body.encode('utf-8')
+        body = skeleton.body_prefix + _base64_lines(html_bytes[skeleton.body_prefix_bytes:])
+        return skeleton.join(outer, inner, headers, body)
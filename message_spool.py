@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Container, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from email_templates import Campaign
+from lead_store import AnyOf, normalize_email, select_leads
+from lead_priority import priority_key
+from message_builder import MessageFactory
+from recipient_domains import clean_leads
+from suppression_index import SuppressionIndex
+from unsubscribe_cache import UNSUBSCRIBE_CACHE_FILE, UnsubscribeCache
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = "spool"
+
+# Rendered messages carry this in place of the sender address, filled in when
+# the drainer knows which account sends them
+SENDER_PLACEHOLDER = "{{sender}}"
+_SENDER_BYTES = SENDER_PLACEHOLDER.encode('ascii')
+
+# Leads handed to each render worker at a time
+RENDER_CHUNK_SIZE = 200
+# Leads rendered by the CLI when no limit is given (one run's worth)
+DEFAULT_RENDER_LIMIT = 800
+
+
+def _message_name(email: str) -> str:
+    """Stable file name per recipient, so rendering the same lead twice does not queue it twice"""
+    return hashlib.md5(normalize_email(email).encode('utf-8')).hexdigest() + ".msg"
+
+
+class SpooledMessage:
+    """One prepared message: envelope recipient, name and the serialized bytes with a sender placeholder"""
+
+    def __init__(self, path: str, email: str, name: str, variant: str, raw: bytes):
+        self.path = path
+        self.email = email
+        self.name = name
+        self.variant = variant
+        self.raw = raw
+
+    def as_lead(self) -> dict:
+        """Lead-shaped dict for the send loops, carrying the message along"""
+        return {"email": self.email, "full_name": self.name, "spool_message": self}
+
+    def for_sender(self, sender_email: str) -> bytes:
+        # The placeholder only appears in the From header, which comes before the body
+        return self.raw.replace(_SENDER_BYTES, sender_email.encode('utf-8'), 1)
+
+
+class MessageSpool:
+    """
+    Maildir-style spool of rendered messages for one campaign.
+
+    Messages are written to tmp/ and renamed into new/ once complete. The
+    drainer claims them by renaming into cur/, and removes them once sent or
+    moves them to failed/. Each file is one JSON metadata line followed by the
+    message bytes. Everything is a rename within one directory tree, so a
+    renderer and a drainer can run at the same time and either can be
+    restarted; recover() puts messages stuck in cur/ by a crash back in line.
+    """
+
+    def __init__(self, root: str, campaign_name: str):
+        self.root = os.path.join(root, campaign_name)
+        self.dirs = {name: os.path.join(self.root, name) for name in ("tmp", "new", "cur", "failed")}
+        for path in self.dirs.values():
+            os.makedirs(path, exist_ok=True)
+
+    def _path(self, state: str, name: str) -> str:
+        return os.path.join(self.dirs[state], name)
+
+    def contains(self, email: str) -> bool:
+        """True if a message for this address is queued or being sent"""
+        name = _message_name(email)
+        return os.path.exists(self._path("new", name)) or os.path.exists(self._path("cur", name))
+
+    def add(self, email: str, name: str, variant: str, raw: bytes) -> str:
+        """Write a rendered message and publish it in new/"""
+        file_name = _message_name(email)
+        temp_path = self._path("tmp", f"{file_name}.{os.getpid()}")
+        meta = json.dumps({"email": email, "name": name, "variant": variant}).encode('utf-8')
+        with open(temp_path, 'wb') as f:
+            f.write(meta + b"\n" + raw)
+        final_path = self._path("new", file_name)
+        os.replace(temp_path, final_path)
+        return final_path
+
+    def pending_count(self) -> int:
+        return len(os.listdir(self.dirs["new"]))
+
+    def _read(self, path: str) -> Optional[SpooledMessage]:
+        try:
+            with open(path, 'rb') as f:
+                meta_line, raw = f.read().split(b"\n", 1)
+            meta = json.loads(meta_line)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable spool file {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return SpooledMessage(path, meta["email"], meta.get("name", ""), meta.get("variant", ""), raw)
+
+    def claim(self, limit: int, exclude: Container[str] = frozenset()) -> List[SpooledMessage]:
+        """
+        Move up to `limit` messages from new/ to cur/ and return them, oldest first.
+        Messages for addresses in `exclude` (already sent or unsubscribed) are discarded.
+        """
+        entries = sorted(os.scandir(self.dirs["new"]), key=lambda entry: entry.stat().st_mtime)
+        claimed = []
+        for entry in entries:
+            if len(claimed) >= limit:
+                break
+            target = self._path("cur", entry.name)
+            try:
+                os.rename(entry.path, target)
+            except FileNotFoundError:
+                continue    # another drainer took it
+            message = self._read(target)
+            if message is None:
+                continue
+            if normalize_email(message.email) in exclude:
+                os.remove(target)
+                continue
+            claimed.append(message)
+        return claimed
+
+    def complete(self, path: str) -> None:
+        """Message was sent; drop it from the spool"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def fail(self, path: str) -> None:
+        """Message will not be sent; keep it in failed/ for inspection"""
+        try:
+            os.replace(path, self._path("failed", os.path.basename(path)))
+        except FileNotFoundError:
+            pass
+
+    def release(self) -> int:
+        """Put every claimed but unfinished message back in new/ (end of a run that stopped early)"""
+        released = 0
+        for entry in os.scandir(self.dirs["cur"]):
+            try:
+                os.rename(entry.path, self._path("new", entry.name))
+                released += 1
+            except FileNotFoundError:
+                pass
+        return released
+
+    def recover(self, is_sent: Callable[[str], bool]) -> int:
+        """
+        At drainer startup (with no other drainer running): messages left in cur/
+        by a crash are dropped if their recipient is recorded as sent, the rest go
+        back to new/. Returns how many were requeued.
+        """
+        requeued = 0
+        for entry in os.scandir(self.dirs["cur"]):
+            message = self._read(entry.path)
+            if message is None:
+                continue
+            if is_sent(normalize_email(message.email)):
+                self.complete(entry.path)
+            else:
+                os.rename(entry.path, self._path("new", entry.name))
+                requeued += 1
+        return requeued
+
+
+def _render_chunk(campaign_file: str, reply_to: str, spool_root: str, leads: List[Tuple[str, str]]) -> int:
+    """Worker process: render and spool one chunk of (email, name) leads"""
+    campaign = Campaign(campaign_file)
+    factory = MessageFactory(campaign, reply_to)
+    spool = MessageSpool(spool_root, campaign.name)
+    for email, name in leads:
+        variant = campaign.choose_variant(email)
+        spool.add(email, name, variant.name, factory.build(SENDER_PLACEHOLDER, email, name))
+    return len(leads)
+
+
+def render_to_spool(
+    leads: Iterator[Tuple[str, str]],
+    campaign_file: str,
+    reply_to: str,
+    spool_root: str = SPOOL_DIR,
+    workers: int = 1
+) -> int:
+    """
+    Render (email, name) leads into the campaign's spool, skipping any already
+    queued. With more than one worker the chunks are rendered in a process pool.
+    Returns the number of messages added.
+    """
+    campaign = Campaign(campaign_file)
+    spool = MessageSpool(spool_root, campaign.name)
+    todo = [(email, name) for email, name in leads if not spool.contains(email)]
+    if not todo:
+        return 0
+
+    chunks = [todo[i:i + RENDER_CHUNK_SIZE] for i in range(0, len(todo), RENDER_CHUNK_SIZE)]
+    if workers <= 1 or len(chunks) == 1:
+        return sum(_render_chunk(campaign_file, reply_to, spool_root, chunk) for chunk in chunks)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = [executor.submit(_render_chunk, campaign_file, reply_to, spool_root, chunk) for chunk in chunks]
+        return sum(future.result() for future in futures)
+
+
+def main(argv):
+    """python message_spool.py render [leads.csv] [limit] | status"""
+    if not argv or argv[0] not in ("render", "status"):
+        print("Usage: python message_spool.py render [leads.csv] [limit] | status")
+        return 1
+
+    load_dotenv()
+    campaign_file = os.getenv("CAMPAIGN_FILE", "templates/campaign.json")
+    spool_root = os.getenv("SPOOL_DIR", SPOOL_DIR)
+    campaign = Campaign(campaign_file)
+
+    if argv[0] == "status":
+        spool = MessageSpool(spool_root, campaign.name)
+        print(f"{campaign.name}: {spool.pending_count()} queued, "
+              f"{len(os.listdir(spool.dirs['cur']))} in progress, {len(os.listdir(spool.dirs['failed']))} failed")
+        return 0
+
+    leads_file = argv[1] if len(argv) > 1 else "leads_emails.csv"
+    limit = int(argv[2]) if len(argv) > 2 else DEFAULT_RENDER_LIMIT
+    # Same exclusions and address checks as a run, so the spool only holds messages a run would send
+    suppression = SuppressionIndex(os.getenv("SUPPRESSION_DB", "logs/suppression.db"))
+    unsubscribes = UnsubscribeCache(os.getenv("UNSUBSCRIBE_CACHE_FILE", UNSUBSCRIBE_CACHE_FILE))
+    try:
+        selected = select_leads(
+            leads_file,
+            limit,
+            exclude=AnyOf(unsubscribes, suppression),
+            key=priority_key(os.getenv("LEAD_PRIORITY", "file"))
+        )
+    finally:
+        suppression.close()
+
+    valid_leads = clean_leads(
+        [lead for _, lead in selected],
+        on_invalid=lambda lead: print(f"Skipping invalid email: {lead.get('email', '').strip()}")
+    )
+    leads = [(lead["email"], lead.get("full_name", "").strip()) for lead in valid_leads]
+    added = render_to_spool(
+        leads,
+        campaign_file,
+        os.getenv("REPLY_TO_EMAIL"),
+        spool_root,
+        int(os.getenv("SPOOL_RENDER_WORKERS", os.cpu_count() or 1))
+    )
+    print(f"{campaign.name}: {added} messages rendered to {os.path.join(spool_root, campaign.name)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,149 @@
+import os
+import time
+import bisect
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from send_failures import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# How often a long-running process drops sends that left the 24h window
+PRUNE_INTERVAL = HOUR
+
+
+class QuotaLedger:
+    """
+    Persisted record of sends per account over a rolling 24h window.
+
+    Send times of the last 24h are kept in memory per account (sorted lists),
+    so window counts are a binary search; every send is also written to SQLite
+    so the next run starts from the real usage instead of zero. Sends older
+    than 24h are dropped on open and then every PRUNE_INTERVAL while recording,
+    so a daemon's ledger stays at one day of sends.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sends (account TEXT NOT NULL, sent_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sends_sent_at ON sends (sent_at)")
+
+        self._recent: Dict[str, List[float]] = {}
+        self._prune_locked(time.time())
+        for account, sent_at in self._conn.execute("SELECT account, sent_at FROM sends ORDER BY sent_at"):
+            self._recent.setdefault(account, []).append(sent_at)
+
+    def _prune_locked(self, now: float) -> None:
+        cutoff = now - DAY
+        self._conn.execute("DELETE FROM sends WHERE sent_at < ?", (cutoff,))
+        self._conn.commit()
+        for account in list(self._recent):
+            times = self._recent[account]
+            del times[:bisect.bisect_left(times, cutoff)]
+            if not times:
+                # Accounts that stopped sending (or were removed from the accounts file) go too
+                del self._recent[account]
+        self._next_prune = now + PRUNE_INTERVAL
+
+    def record(self, account: str, sent_at: Optional[float] = None) -> None:
+        sent_at = sent_at or time.time()
+        with self._lock:
+            bisect.insort(self._recent.setdefault(account, []), sent_at)
+            self._conn.execute("INSERT INTO sends (account, sent_at) VALUES (?, ?)", (account, sent_at))
+            self._conn.commit()
+            now = time.time()
+            if now >= self._next_prune:
+                self._prune_locked(now)
+
+    def count(self, account: str, window: float) -> int:
+        """Sends from `account` in the last `window` seconds (window <= 24h)"""
+        now = time.time()
+        with self._lock:
+            times = self._recent.get(account)
+            if not times:
+                return 0
+            expired = bisect.bisect_left(times, now - DAY)
+            if expired:
+                del times[:expired]
+            return len(times) - bisect.bisect_left(times, now - window)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class AccountScheduler:
+    """
+    Picks the least-loaded sending account.
+
+    An account's load is the larger of its daily and hourly usage fractions,
+    using DAILY_LIMIT / HOURLY_LIMIT from its email_accounts.json entry (or the
+    defaults). Accounts with a higher limit therefore get proportionally more
+    sends. Accounts that are out of quota or cooling down are skipped.
+    """
+
+    def __init__(
+        self,
+        accounts: List[dict],
+        ledger: QuotaLedger,
+        breaker: Optional[CircuitBreaker] = None,
+        default_daily_limit: int = 500,
+        default_hourly_limit: int = 100
+    ):
+        self.accounts = accounts
+        self.ledger = ledger
+        self.breaker = breaker or CircuitBreaker()
+        self.default_daily_limit = default_daily_limit
+        self.default_hourly_limit = default_hourly_limit
+
+    def limits(self, account: dict):
+        return (
+            int(account.get("DAILY_LIMIT", self.default_daily_limit)),
+            int(account.get("HOURLY_LIMIT", self.default_hourly_limit))
+        )
+
+    def remaining(self, account: dict) -> int:
+        daily_limit, hourly_limit = self.limits(account)
+        user = account['EMAIL_USER']
+        return max(0, min(
+            daily_limit - self.ledger.count(user, DAY),
+            hourly_limit - self.ledger.count(user, HOUR)
+        ))
+
+    def has_quota(self, account: dict) -> bool:
+        return self.remaining(account) > 0
+
+    def load(self, account: dict) -> float:
+        daily_limit, hourly_limit = self.limits(account)
+        user = account['EMAIL_USER']
+        if daily_limit <= 0 or hourly_limit <= 0:
+            return float('inf')
+        return max(self.ledger.count(user, DAY) / daily_limit, self.ledger.count(user, HOUR) / hourly_limit)
+
+    def next_account(self) -> Optional[dict]:
+        """Least-loaded account that has quota and is not cooling down, or None"""
+        candidates = [
+            account for account in self.accounts
+            if self.has_quota(account) and not self.breaker.is_open(account['EMAIL_USER'])
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=self.load)
+
+    def quota_exhausted(self) -> bool:
+        """True once no account can send any more in the current windows"""
+        return not any(self.has_quota(account) for account in self.accounts)
+
+    def record_send(self, user: str, sent_at: Optional[float] = None) -> None:
+        self.ledger.record(user, sent_at)
@@ -0,0 +1,189 @@
+import re
+import time
+import threading
+from collections import defaultdict
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+
+# Addresses are checked this many at a time with one regex pass over the joined batch
+INTAKE_BATCH_SIZE = 5000
+
+# Leads scanned ahead of the current one when its domain has to wait (serial mode)
+DOMAIN_LOOKAHEAD = 100
+
+# local@domain with a dotted domain; anything else on the line leaves the group empty.
+# Applied to "\n".join(batch) with MULTILINE, so findall() returns one entry per address.
+_ATOM = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+"
+_LABEL = r"[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?"
+_ADDRESS_LINES = re.compile(
+    rf"^(?:((?={_ATOM}(?:\.{_ATOM})*@)[^@\n]{{1,64}}@(?:{_LABEL}\.)+[A-Za-z]{{2,63}})|.*)$",
+    re.MULTILINE
+)
+
+
+def domain_of(email: str) -> str:
+    return email.rsplit('@', 1)[-1].lower()
+
+
+def clean_address(raw: str) -> str:
+    """
+    Strip what lead files wrap around addresses: whitespace, <...>, mailto: and
+    a trailing dot; the domain is lowercased and IDNA-encoded
+    """
+    email = (raw or "").strip()
+    if email[:1] == "<" or email[-1:] in (">", ".") or email[:7].lower() == "mailto:":
+        email = email.strip("<>").strip()
+        if email[:7].lower() == "mailto:":
+            email = email[7:]
+        email = email.rstrip(".")
+    # A line break would split the address across two lines of the batch
+    if "\n" in email or "\r" in email:
+        return ""
+    local, at, domain = email.rpartition('@')
+    if not at:
+        return email
+    if not domain.isascii():
+        try:
+            domain = domain.encode('idna').decode('ascii')
+        except UnicodeError:
+            return email
+    return f"{local}@{domain.lower()}"
+
+
+def normalize_addresses(emails: Iterable[str]) -> List[Optional[str]]:
+    """
+    Clean and validate addresses in batches. Returns one entry per input: the
+    address with surrounding noise removed and the domain lowercased (the local
+    part keeps its case), or None if it cannot be sent to.
+    """
+    results = []
+    batch = []
+
+    def check(batch):
+        cleaned = [clean_address(email) for email in batch]
+        matches = _ADDRESS_LINES.findall("\n".join(cleaned))
+        for email, match in zip(cleaned, matches):
+            results.append(email if match else None)
+
+    for email in emails:
+        batch.append(email)
+        if len(batch) >= INTAKE_BATCH_SIZE:
+            check(batch)
+            batch = []
+    if batch:
+        check(batch)
+    return results
+
+
+def interleave_by_domain(leads: List[dict], key: Callable[[dict], str] = lambda lead: lead["email"]) -> List[dict]:
+    """
+    Reorder leads so each recipient domain is spread evenly over the batch
+    instead of arriving in one run. Order within a domain is kept.
+    """
+    counts = defaultdict(int)
+    for lead in leads:
+        counts[domain_of(key(lead))] += 1
+    seen = defaultdict(int)
+    positions = []
+    for index, lead in enumerate(leads):
+        domain = domain_of(key(lead))
+        positions.append(((seen[domain] + 0.5) / counts[domain], index))
+        seen[domain] += 1
+    return [leads[index] for _, index in sorted(positions)]
+
+
+def clean_leads(leads: List[dict], on_invalid: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """
+    The intake every send path uses: drop leads whose address cannot be sent
+    to (passing each to on_invalid), set lead["email"] to the cleaned address
+    on the rest and spread their domains over the batch
+    """
+    valid_leads = []
+    for lead, address in zip(leads, normalize_addresses(lead.get("email", "") for lead in leads)):
+        if address is None:
+            if on_invalid is not None:
+                on_invalid(lead)
+            continue
+        lead["email"] = address
+        valid_leads.append(lead)
+    return interleave_by_domain(valid_leads)
+
+
+def parse_domain_limits(value: str) -> Dict[str, float]:
+    """"gmail.com=120,yahoo.com=30" -> {"gmail.com": 120.0, "yahoo.com": 30.0} (sends per minute)"""
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            domain, rate = item.split("=", 1)
+            limits[domain.strip().lower()] = float(rate)
+    return limits
+
+
+class DomainThrottle:
+    """
+    Token bucket per recipient domain, shared by every sending account.
+
+    Each domain gets `rate_per_minute` sends with bursts of up to `burst`;
+    `overrides` sets a different rate for particular domains. A rate of 0
+    means unlimited. reserve() books the next slot and says how long to wait
+    for it, so concurrent senders queue up behind each other instead of all
+    waking at once.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: int = 1,
+        overrides: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate_per_minute = rate_per_minute
+        self.burst = max(1, int(burst))
+        self.overrides = overrides or {}
+        self.clock = clock
+        self._next_free = {}    # domain -> time the bucket is empty again (GCRA theoretical arrival time)
+        self._lock = threading.Lock()
+
+    def _interval(self, domain: str) -> float:
+        rate = self.overrides.get(domain, self.rate_per_minute)
+        return 60.0 / rate if rate > 0 else 0.0
+
+    def _start(self, domain: str, interval: float, now: float) -> float:
+        tolerance = (self.burst - 1) * interval
+        return max(now, self._next_free.get(domain, now) - tolerance)
+
+    def delay(self, domain: str) -> float:
+        """Seconds until a send to this domain would be allowed, without booking it"""
+        interval = self._interval(domain)
+        if not interval:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            return self._start(domain, interval, now) - now
+
+    def reserve(self, domain: str) -> float:
+        """Book the next send to this domain; returns the seconds to wait before sending"""
+        interval = self._interval(domain)
+        if not interval:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            start = self._start(domain, interval, now)
+            self._next_free[domain] = max(self._next_free.get(domain, now), now) + interval
+            return start - now
+
+    def take_next(self, pending: Deque[dict], key: Callable[[dict], str] = lambda lead: lead["email"]) -> dict:
+        """
+        Remove and return the first lead in the next DOMAIN_LOOKAHEAD whose
+        domain can be sent to now, or the one that will be ready soonest.
+        """
+        best_index, best_delay = 0, None
+        for index in range(min(len(pending), DOMAIN_LOOKAHEAD)):
+            wait = self.delay(domain_of(key(pending[index])))
+            if best_delay is None or wait < best_delay:
+                best_index, best_delay = index, wait
+            if wait <= 0:
+                break
+        pending.rotate(-best_index)
+        lead = pending.popleft()
+        pending.rotate(best_index)
+        return lead
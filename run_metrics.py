@@ -0,0 +1,218 @@
+import os
+import json
+import math
+import time
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "wbl_sender"
+
+# Shared no-op returned by phase() when metrics are off
+_NO_TIMER = nullcontext()
+
+
+def _label_key(labels: dict) -> Tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample(value) -> str:
+    """A sample value in full precision: whole numbers exactly (never 1e+06), other floats by repr"""
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _PhaseStats:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def merge(self, other: dict) -> None:
+        self.count += other["count"]
+        self.total += other["total"]
+        self.max = max(self.max, other["max"])
+        for i, value in enumerate(other["buckets"]):
+            self.buckets[i] += value
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "total": self.total, "max": self.max, "buckets": list(self.buckets)}
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class RunMetrics:
+    """
+    Phase timings and counters for one run.
+
+    phase(name, **labels) times a block, count(name, **labels) bumps a counter.
+    When disabled both return immediately, so hooks can stay on the hot path.
+    Thread-safe; write_reports() dumps a JSON summary and a Prometheus
+    text-format file.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._phases: Dict[Tuple[str, Tuple], _PhaseStats] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._lock = threading.Lock()
+
+    def phase(self, name: str, **labels):
+        if not self.enabled:
+            return _NO_TIMER
+        return _Timer(self, name, labels)
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            stats = self._phases.get(key)
+            if stats is None:
+                stats = self._phases[key] = _PhaseStats()
+            stats.add(seconds)
+
+    def count(self, name: str, amount: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self) -> dict:
+        """Picklable copy of everything recorded, for merging results from worker processes"""
+        with self._lock:
+            return {
+                "phases": [[name, list(labels), stats.to_dict()] for (name, labels), stats in self._phases.items()],
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            }
+
+    def merge(self, snapshot: Optional[dict]) -> None:
+        if not self.enabled or not snapshot:
+            return
+        with self._lock:
+            for name, labels, data in snapshot["phases"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                stats = self._phases.get(key)
+                if stats is None:
+                    stats = self._phases[key] = _PhaseStats()
+                stats.merge(data)
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def summary(self) -> dict:
+        """Per-phase count/total/mean/max seconds and counters, grouped by name"""
+        with self._lock:
+            phases = {}
+            for (name, labels), stats in sorted(self._phases.items()):
+                phases.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "count": stats.count,
+                    "total_seconds": round(stats.total, 6),
+                    "mean_seconds": round(stats.total / stats.count, 6) if stats.count else 0.0,
+                    "max_seconds": round(stats.max, 6)
+                })
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return {
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "phases": phases,
+            "counters": counters
+        }
+
+    def prometheus_text(self) -> str:
+        def render_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), stats in sorted(self._phases.items()):
+                by_name.setdefault(name, []).append((labels, stats))
+            for name, series in by_name.items():
+                metric = f"{METRIC_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, stats in series:
+                    cumulative = 0
+                    for bound, value in zip(BUCKETS + (float("inf"),), stats.buckets):
+                        cumulative += value
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{metric}_bucket{render_labels(labels, [('le', le)])} {cumulative}")
+                    lines.append(f"{metric}_sum{render_labels(labels)} {_sample(stats.total)}")
+                    lines.append(f"{metric}_count{render_labels(labels)} {stats.count}")
+
+            by_name = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                by_name.setdefault(name, []).append((labels, value))
+            for name, series in by_name.items():
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in series:
+                    lines.append(f"{metric}{render_labels(labels)} {_sample(value)}")
+
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_run_timestamp_seconds {_sample(time.time())}")
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, json_path: str, prom_path: str) -> None:
+        """Write the JSON summary and the Prometheus textfile (each replaced atomically)"""
+        if not self.enabled:
+            return
+        for path, content in ((json_path, json.dumps(self.summary(), indent=2)), (prom_path, self.prometheus_text())):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+
+
+# Default for components created without metrics
+NULL_METRICS = RunMetrics(enabled=False)
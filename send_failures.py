@@ -0,0 +1,148 @@
+import heapq
+import random
+import smtplib
+import socket
+import time
+import itertools
+from typing import Any, Dict, Optional, Tuple
+
+# Failure classes
+TRANSIENT = "transient"    # try the same lead again later
+RECIPIENT = "recipient"    # this address will never work, drop the lead
+ACCOUNT = "account"        # the sending account is throttled or locked, take it out of rotation
+
+# Phrases providers use when an account hits a sending limit
+_THROTTLE_HINTS = ("rate limit", "too many", "quota", "limit exceeded", "try again later", "5.4.5", "4.7.0", "4.7.28")
+
+
+def _code_and_text(error: Exception) -> Tuple[Optional[int], str]:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # All recipients refused; use the worst (lowest-class) reply
+        replies = list(error.recipients.values())
+        if not replies:
+            return None, ""
+        code, text = min(replies, key=lambda reply: reply[0])
+        return code, text.decode('utf-8', 'replace') if isinstance(text, bytes) else str(text)
+    code = getattr(error, 'smtp_code', None)
+    text = getattr(error, 'smtp_error', b"")
+    return code, text.decode('utf-8', 'replace') if isinstance(text, bytes) else str(text)
+
+
+def classify_failure(error: Exception) -> str:
+    """Sort a send exception into TRANSIENT, RECIPIENT or ACCOUNT"""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return ACCOUNT
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, socket.timeout, ConnectionError)):
+        return TRANSIENT
+
+    code, text = _code_and_text(error)
+    if code is None:
+        return TRANSIENT if isinstance(error, OSError) else RECIPIENT
+
+    throttled = any(hint in text.lower() for hint in _THROTTLE_HINTS)
+    if isinstance(error, smtplib.SMTPSenderRefused):
+        # MAIL FROM rejected: the problem is the sending account, not the lead
+        return ACCOUNT if code >= 500 or throttled else TRANSIENT
+    if throttled or code in (530, 534, 535):
+        return ACCOUNT
+    if 400 <= code < 500:
+        return TRANSIENT
+    return RECIPIENT
+
+
+def is_rejection(error: Exception) -> bool:
+    """True if the server refused the recipient for good (5xx), as opposed to a temporary or local failure"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # Every refusal has to be permanent; a 4xx one may work on a later attempt
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(code >= 500 for code in codes)
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for transient failures"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 30.0, max_delay: float = 600.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, attempt: int) -> bool:
+        """attempt is the number of attempts already made"""
+        return attempt < self.max_attempts
+
+    def delay(self, attempt: int) -> float:
+        return min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+class RetryQueue:
+    """Leads waiting for another attempt, ordered by when they become due"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, lead: Any, attempt: int, delay: float) -> None:
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), attempt, lead))
+
+    def pop_ready(self) -> Optional[Tuple[Any, int]]:
+        """(lead, attempts made) for the first due lead, or None"""
+        if self._heap and self._heap[0][0] <= time.monotonic():
+            _, _, attempt, lead = heapq.heappop(self._heap)
+            return lead, attempt
+        return None
+
+    def seconds_until_ready(self) -> float:
+        if not self._heap:
+            return 0.0
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def drain(self):
+        while self._heap:
+            _, _, attempt, lead = heapq.heappop(self._heap)
+            yield lead, attempt
+
+
+class CircuitBreaker:
+    """
+    Takes throttled or locked accounts out of rotation.
+
+    Each trip opens the account's circuit for a cool-down that doubles with
+    consecutive trips; after `max_trips` consecutive trips the account is
+    retired for the rest of the run. A successful send resets it.
+    """
+
+    def __init__(self, cooldown: float = 900.0, max_cooldown: float = 4 * 3600.0, max_trips: int = 3):
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_trips = max_trips
+        self._open_until: Dict[str, float] = {}
+        self._trips: Dict[str, int] = {}
+
+    def trip(self, user: str) -> float:
+        """Open the circuit for `user`; returns the cool-down in seconds"""
+        trips = self._trips.get(user, 0) + 1
+        self._trips[user] = trips
+        cooldown = min(self.max_cooldown, self.cooldown * 2 ** (trips - 1))
+        self._open_until[user] = time.monotonic() + cooldown
+        return cooldown
+
+    def record_success(self, user: str) -> None:
+        self._trips.pop(user, None)
+        self._open_until.pop(user, None)
+
+    def reset(self, user: str) -> None:
+        """Put an account back in rotation, e.g. after its credentials were changed"""
+        self.record_success(user)
+
+    def is_retired(self, user: str) -> bool:
+        return self._trips.get(user, 0) >= self.max_trips
+
+    def is_open(self, user: str) -> bool:
+        return self.is_retired(user) or time.monotonic() < self._open_until.get(user, 0.0)
+
+    def remaining(self, user: str) -> float:
+        return max(0.0, self._open_until.get(user, 0.0) - time.monotonic())
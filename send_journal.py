@@ -0,0 +1,80 @@
+import os
+import logging
+import threading
+from typing import Set
+
+from lead_store import normalize_email, write_back_sent
+
+logger = logging.getLogger(__name__)
+
+
+class SendJournal:
+    """
+    Append-only record of successful sends, one normalized address per line.
+
+    Every send is written and flushed immediately; fsync runs every
+    `fsync_every` records (0 disables fsync and leaves durability to the OS).
+    On startup the journal is replayed over the CSV flags, and compact() folds
+    it back into the CSV and truncates it.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 1):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.entries = 0
+        self._unsynced = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def replay(self) -> Set[str]:
+        """Return every address recorded in the journal"""
+        if not os.path.exists(self.path):
+            self.entries = 0
+            return set()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            # A torn last line from a crash simply won't match any lead
+            sent = {line.strip() for line in f if line.strip()}
+        self.entries = len(sent)
+        return sent
+
+    def record(self, email: str) -> None:
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(normalize_email(email) + "\n")
+            self._file.flush()
+            self.entries += 1
+            self._unsynced += 1
+            if self.fsync_every and self._unsynced >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self) -> None:
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def compact(self, csv_path: str) -> int:
+        """Fold the journal into the CSV sent flags, then truncate it. Returns the folded entry count."""
+        self.close()
+        sent = self.replay()
+        if not sent:
+            return 0
+
+        # CSV is replaced atomically first; if we crash before truncating,
+        # replaying the same entries again is harmless
+        write_back_sent(csv_path, sent)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries = 0
+        logger.info(f"Compacted {len(sent)} journal entries into {csv_path}")
+        return len(sent)
@@ -0,0 +1,114 @@
+import os
+import csv
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SENT_LOG_HEADER = ["Sender Email", "Recipient Email", "Name", "Timestamp"]
+
+# "buffered" hands rows to the OS on every flush, "fsync" also forces them to disk
+DURABILITY_LEVELS = ("buffered", "fsync")
+
+
+class SentLogWriter:
+    """
+    Long-lived, thread-safe writer for logs/sent_emails.csv.
+
+    Keeps the file open and buffers rows, flushing after `flush_rows` rows or
+    `flush_interval` seconds (whichever comes first) and on close(). With an
+    `archive` (a SentLogArchive), rows of past days or months are moved out of
+    the file when it is opened and whenever a new period starts.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_rows: int = 50,
+        flush_interval: float = 5.0,
+        durability: str = "buffered",
+        archive=None
+    ):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown sent log durability '{durability}', expected one of {DURABILITY_LEVELS}")
+        self.path = path
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.archive = archive
+        self._period = None
+        self._file = None
+        self._writer = None
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._stamp_second = None
+        self._stamp = ""
+        self._lock = threading.Lock()
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", newline="", buffering=1024 * 1024)
+        self._writer = csv.writer(self._file)
+        if self._file.tell() == 0:
+            self._writer.writerow(SENT_LOG_HEADER)
+
+    def _timestamp(self) -> str:
+        # Rows arrive many per second, so format each second only once
+        now = int(time.time())
+        if now != self._stamp_second:
+            self._stamp_second = now
+            self._stamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        return self._stamp
+
+    def _rotate_locked(self, now: str) -> None:
+        period = self.archive.period_of(now)
+        if period == self._period:
+            return
+        if self._file is not None:
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+            self._writer = None
+        try:
+            self.archive.rotate(self.path, now)
+        except OSError as e:
+            # Rows stay in the live log and are archived on a later rotation
+            logger.warning(f"Sent log rotation failed: {e}")
+        self._period = period
+
+    def write(self, sender_email: str, recipient_email: str, name: str, timestamp: Optional[str] = None) -> None:
+        with self._lock:
+            if self.archive is not None:
+                self._rotate_locked(self._timestamp())
+            if self._file is None:
+                self._open()
+            self._writer.writerow([sender_email, recipient_email, name, timestamp or self._timestamp()])
+            self._pending += 1
+            if self._pending >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        if self.durability == "fsync":
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._flush_locked()
+                self._file.close()
+                self._file = None
+                self._writer = None
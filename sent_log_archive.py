@@ -0,0 +1,310 @@
+import os
+import re
+import csv
+import sys
+import gzip
+import json
+import math
+import base64
+import hashlib
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from lead_store import normalize_email
+
+logger = logging.getLogger(__name__)
+
+SENT_LOG_FILE = "logs/sent_emails.csv"
+SENT_ARCHIVE_DIR = "logs/sent_archive"
+
+# Rotation period -> length of the timestamp prefix ("2024-05-17 09:30:00") that names it
+ROTATE_PERIODS = {"day": 10, "month": 7}
+
+# Membership filters are sized for this false positive rate; hits are confirmed against the segment
+FILTER_ERROR_RATE = 0.01
+
+_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}")
+_SEGMENT_NAME = re.compile(r"sent_(?P<period>[\d-]+|undated)_[0-9a-f]+\.csv\.gz$")
+
+
+class AddressFilter:
+    """Bloom filter over normalized addresses; `email in f` may be a false positive, never a false negative"""
+
+    def __init__(self, capacity: int, error_rate: float = FILTER_ERROR_RATE, bits: Optional[bytearray] = None, hashes: int = 0):
+        size = max(64, int(-max(1, capacity) * math.log(error_rate) / math.log(2) ** 2))
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+        self.size = len(self.bits) * 8
+        self.hashes = hashes or max(1, round(self.size / max(1, capacity) * math.log(2)))
+
+    def _positions(self, email: str) -> Iterator[int]:
+        digest = hashlib.blake2b(normalize_email(email).encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, email: str) -> None:
+        for position in self._positions(email):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, email: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(email))
+
+    def to_dict(self) -> dict:
+        return {"hashes": self.hashes, "bits": base64.b64encode(bytes(self.bits)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AddressFilter":
+        return cls(0, bits=bytearray(base64.b64decode(data["bits"])), hashes=data["hashes"])
+
+
+def _day(timestamp: str) -> str:
+    return timestamp[:10] if _TIMESTAMP.match(timestamp or "") else ""
+
+
+class SentLogArchive:
+    """
+    Closed periods of logs/sent_emails.csv, as gzipped segments with an index.
+
+    rotate() moves rows from before the current day or month out of the live
+    log into `sent_<period>_<id>.csv.gz`. Each segment has a `.idx.json`
+    sidecar with its first/last timestamp, per-sender counts per day and a
+    filter of the recipient addresses, so counts come from the sidecars alone
+    and an address lookup only opens segments whose filter matches.
+    """
+
+    def __init__(self, directory: str = SENT_ARCHIVE_DIR, period: str = "month"):
+        if period not in ROTATE_PERIODS:
+            raise ValueError(f"Unknown sent log rotation '{period}', expected one of {tuple(ROTATE_PERIODS)}")
+        self.directory = directory
+        self.period = period
+
+    def period_of(self, timestamp: str) -> str:
+        """"2024-05-17 09:30:00" -> "2024-05" (monthly); "" when the timestamp is unreadable"""
+        return timestamp[:ROTATE_PERIODS[self.period]] if _TIMESTAMP.match(timestamp or "") else ""
+
+    def rotate(self, live_path: str, now: str) -> int:
+        """
+        Move rows of periods before `now`'s out of the live log (which must not
+        be open for writing). Returns the number of rows archived. Rotating the
+        same rows again, after a crash between writing the segments and
+        rewriting the live log, replaces their segments instead of adding more.
+        """
+        current = self.period_of(now)
+        try:
+            with open(live_path, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                first = next(reader, None)
+        except FileNotFoundError:
+            return 0
+        if header is None or first is None or len(first) < 4 or self.period_of(first[3]) >= current:
+            return 0
+
+        closed: Dict[str, List[List[str]]] = defaultdict(list)
+        temp_file = live_path + ".tmp"
+        try:
+            with open(live_path, 'r', newline='', encoding='utf-8') as src, \
+                    open(temp_file, 'w', newline='', encoding='utf-8') as dst:
+                reader = csv.reader(src)
+                writer = csv.writer(dst)
+                writer.writerow(next(reader))
+                for row in reader:
+                    if not row:
+                        continue
+                    period = self.period_of(row[3] if len(row) > 3 else "")
+                    if period < current:
+                        closed[period].append(row)
+                    else:
+                        writer.writerow(row)
+
+            os.makedirs(self.directory, exist_ok=True)
+            for period, rows in closed.items():
+                self._write_segment(period or "undated", header, rows)
+            os.replace(temp_file, live_path)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        archived = sum(len(rows) for rows in closed.values())
+        logger.info(f"Archived {archived} sent log rows into {len(closed)} segments in {self.directory}")
+        return archived
+
+    def _write_segment(self, period: str, header: List[str], rows: List[List[str]]) -> None:
+        segment_id = hashlib.sha1(",".join(rows[0]).encode('utf-8')).hexdigest()[:10]
+        path = os.path.join(self.directory, f"sent_{period}_{segment_id}.csv.gz")
+
+        senders: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        addresses = AddressFilter(len(rows))
+        timestamps = []
+        with gzip.open(path + ".tmp", 'wt', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for row in rows:
+                writer.writerow(row)
+                timestamp = row[3] if len(row) > 3 else ""
+                day = _day(timestamp)
+                senders[row[0]][day] += 1
+                addresses.add(row[1])
+                if day:
+                    timestamps.append(timestamp)
+        index = {
+            "segment": os.path.basename(path),
+            "rows": len(rows),
+            "first": min(timestamps, default=None),
+            "last": max(timestamps, default=None),
+            "senders": senders,
+            "addresses": addresses.to_dict()
+        }
+        with open(path + ".idx.json.tmp", 'w') as f:
+            json.dump(index, f)
+        # The segment appears last, so any segment that is listed has its index
+        os.replace(path + ".idx.json.tmp", path[:-len(".csv.gz")] + ".idx.json")
+        os.replace(path + ".tmp", path)
+
+    def segments(self, since: Optional[str] = None, until: Optional[str] = None) -> List[dict]:
+        """Indexes of the segments that may hold rows between the two days (inclusive), oldest first"""
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+        indexes = []
+        for name in names:
+            match = _SEGMENT_NAME.match(name)
+            if not match:
+                continue
+            # The period in the file name rules most segments out before their index is read
+            period = match.group("period")
+            if period != "undated" and ((since and period < since[:len(period)]) or (until and period > until[:len(period)])):
+                continue
+            with open(os.path.join(self.directory, name[:-len(".csv.gz")] + ".idx.json"), 'r') as f:
+                index = json.load(f)
+            if index["first"] is not None and ((since and index["last"][:10] < since) or (until and index["first"][:10] > until)):
+                continue
+            indexes.append(index)
+        return indexes
+
+    def rows(self, index: dict) -> Iterator[List[str]]:
+        """Rows of one segment"""
+        with gzip.open(os.path.join(self.directory, index["segment"]), 'rt', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+
+    def records(self, index: dict) -> Iterator[dict]:
+        """Rows of one segment as dicts keyed by the sent log header"""
+        with gzip.open(os.path.join(self.directory, index["segment"]), 'rt', newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+
+def archive_for(log_path: str) -> Optional[SentLogArchive]:
+    """The archive holding older rows of `log_path` when it is the bot's sent log (SENT_LOG_ARCHIVE_DIR), else None"""
+    if os.path.abspath(log_path) != os.path.abspath(SENT_LOG_FILE):
+        return None
+    return SentLogArchive(os.getenv("SENT_LOG_ARCHIVE_DIR", SENT_ARCHIVE_DIR))
+
+
+def sent_log_records(log_path: str, archive: Optional[SentLogArchive] = None) -> Iterator[dict]:
+    """
+    Every row of a sent log as a dict ("Sender Email", "Recipient Email",
+    "Name", "Timestamp"): the archived segments oldest first, then the CSV
+    """
+    if archive is not None:
+        for index in archive.segments():
+            yield from archive.records(index)
+    with open(log_path, 'r', newline='', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
+
+
+def _live_rows(live_path: str) -> Iterator[List[str]]:
+    try:
+        with open(live_path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from (row for row in reader if row)
+    except FileNotFoundError:
+        return
+
+
+def _in_range(day: str, since: Optional[str], until: Optional[str]) -> bool:
+    if not day:
+        # Rows without a readable timestamp only count when no range is asked for
+        return not since and not until
+    return (not since or day >= since) and (not until or day <= until)
+
+
+def send_counts(
+    archive: SentLogArchive,
+    live_path: str = SENT_LOG_FILE,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+) -> Dict[str, Dict[str, int]]:
+    """{sender: {day: sends}} between two YYYY-MM-DD days; archived rows are counted from the indexes only"""
+    counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for index in archive.segments(since, until):
+        for sender, days in index["senders"].items():
+            for day, count in days.items():
+                if _in_range(day, since, until):
+                    counts[sender][day] += count
+    for row in _live_rows(live_path):
+        day = _day(row[3] if len(row) > 3 else "")
+        if _in_range(day, since, until):
+            counts[row[0]][day] += 1
+    return counts
+
+
+def find_sends(
+    archive: SentLogArchive,
+    email: str,
+    live_path: str = SENT_LOG_FILE,
+    since: Optional[str] = None
+) -> List[Tuple[str, str]]:
+    """(timestamp, sender) of every send to `email` since a YYYY-MM-DD day; opens only segments whose filter matches"""
+    email = normalize_email(email)
+    rows = []
+    for index in archive.segments(since):
+        if email not in AddressFilter.from_dict(index["addresses"]):
+            continue
+        rows.extend(row for row in archive.rows(index) if normalize_email(row[1]) == email)
+    rows.extend(row for row in _live_rows(live_path) if len(row) > 1 and normalize_email(row[1]) == email)
+    sends = [(row[3] if len(row) > 3 else "", row[0]) for row in rows]
+    return [(timestamp, sender) for timestamp, sender in sends if _in_range(_day(timestamp), since, None)]
+
+
+def main(argv):
+    """python sent_log_archive.py rotate | counts [since] [until] | mailed <email> [days]"""
+    if not argv or argv[0] not in ("rotate", "counts", "mailed") or (argv[0] == "mailed" and len(argv) < 2):
+        print("Usage: python sent_log_archive.py rotate | counts [YYYY-MM-DD] [YYYY-MM-DD] | mailed <email> [days]")
+        return 1
+
+    load_dotenv()
+    period = os.getenv("SENT_LOG_ROTATE", "month").lower()
+    archive = SentLogArchive(os.getenv("SENT_LOG_ARCHIVE_DIR", SENT_ARCHIVE_DIR), "month" if period == "off" else period)
+
+    if argv[0] == "rotate":
+        print(f"{archive.rotate(SENT_LOG_FILE, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))} rows archived")
+    elif argv[0] == "counts":
+        since = argv[1] if len(argv) > 1 else None
+        until = argv[2] if len(argv) > 2 else None
+        counts = send_counts(archive, SENT_LOG_FILE, since, until)
+        total = 0
+        for sender in sorted(counts):
+            for day in sorted(counts[sender]):
+                print(f"{day or 'undated'}  {sender}  {counts[sender][day]}")
+            total += sum(counts[sender].values())
+        print(f"{total} sends by {len(counts)} senders")
+    else:
+        days = int(argv[2]) if len(argv) > 2 else None
+        since = (date.today() - timedelta(days=days)).isoformat() if days is not None else None
+        sends = find_sends(archive, argv[1], SENT_LOG_FILE, since)
+        for timestamp, sender in sends:
+            print(f"{timestamp}  {sender}")
+        window = f" in the last {days} days" if days is not None else ""
+        print(f"{argv[1]} was mailed {len(sends)} times{window}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
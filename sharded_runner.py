@@ -0,0 +1,168 @@
+import os
+import csv
+import glob
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from async_sender import send_all
+from email_templates import Campaign
+from lead_store import normalize_email
+from message_builder import MessageFactory
+from recipient_domains import DomainThrottle
+from run_metrics import RunMetrics
+from send_failures import CircuitBreaker, RetryPolicy, classify_failure
+from sent_log import SentLogWriter
+from smtp_pool import SMTPConnectionPool
+
+SHARD_LOG_DIR = "logs/shards"
+
+
+def shard_of(email: str, shard_count: int) -> int:
+    """Stable shard number for an address (same address always lands in the same shard)"""
+    digest = hashlib.md5(normalize_email(email).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % shard_count
+
+
+def split_shards(leads: List[dict], accounts: List[dict], shard_count: int) -> List[Tuple[List[dict], List[dict]]]:
+    """Split leads by address hash and give each shard a disjoint slice of the accounts"""
+    shard_count = max(1, min(shard_count, len(accounts)))
+    shards = [([], accounts[i::shard_count]) for i in range(shard_count)]
+    for lead in leads:
+        shards[shard_of(lead["email"], shard_count)][0].append(lead)
+    return [shard for shard in shards if shard[0]]
+
+
+def _shard_throttle(settings: Dict) -> Optional[DomainThrottle]:
+    """This shard's part of the per-domain limits; every shard sends to every domain"""
+    if not settings.get("domain_rate") and not settings.get("domain_limits"):
+        return None
+    shards = settings.get("shard_count", 1)
+    return DomainThrottle(
+        settings.get("domain_rate", 0) / shards,
+        settings.get("domain_burst", 1),
+        {domain: rate / shards for domain, rate in settings.get("domain_limits", {}).items()}
+    )
+
+
+def _run_shard(shard_id: int, leads: List[dict], accounts: List[dict], settings: Dict) -> Tuple[int, Optional[dict]]:
+    """
+    Worker process: send one shard from its own accounts, recording successes in a shard sent log.
+    Returns the number sent and, when settings["metrics_enabled"] is set, a metrics snapshot.
+    """
+    metrics = RunMetrics(enabled=settings.get("metrics_enabled", False))
+    factory = MessageFactory(Campaign(settings["campaign_file"]), settings["reply_to"])
+    pool = SMTPConnectionPool(
+        settings["smtp_host"],
+        settings["smtp_port"],
+        keepalive_interval=settings["smtp_keepalive"],
+        metrics=metrics
+    )
+    # Flushed per row so a crashed parent can still merge everything that was sent
+    shard_log = SentLogWriter(
+        os.path.join(settings["shard_log_dir"], f"sent_{shard_id}_{os.getpid()}.csv"),
+        flush_rows=1
+    )
+
+    # The parent's quota ledger decided how many sends each account has left
+    remaining = dict(settings["quota_remaining"])
+
+    def has_quota(account):
+        return remaining.get(account['EMAIL_USER'], 0) > 0
+
+    def send(lead, account):
+        sender_email = account['EMAIL_USER']
+        with metrics.phase("render"):
+            raw = factory.build(sender_email, lead["email"], lead["full_name"])
+        try:
+            pool.sendmail(account, sender_email, [lead["email"]], raw)
+        except Exception as e:
+            metrics.count("send_errors", account=sender_email, error=classify_failure(e))
+            raise
+        return sender_email
+
+    def on_sent(lead, sender_email):
+        remaining[sender_email] = remaining.get(sender_email, 0) - 1
+        metrics.count("emails_sent", account=sender_email)
+        shard_log.write(sender_email, lead["email"], lead["full_name"])
+        print(f"[shard {shard_id}] Sent to {lead['email']} using {sender_email}")
+
+    def on_failed(lead, error):
+        metrics.count("emails_failed", error=classify_failure(error))
+        print(f"[shard {shard_id}] Failed to send to {lead['email']}: {error}")
+
+    try:
+        sent = asyncio.run(send_all(
+            leads,
+            accounts,
+            send,
+            on_sent,
+            on_failed,
+            settings["delay"],
+            retry_policy=RetryPolicy(settings["retry_max_attempts"], settings["retry_base_delay"]),
+            breaker=CircuitBreaker(settings["account_cooldown"]),
+            has_quota=has_quota,
+            metrics=metrics,
+            throttle=_shard_throttle(settings)
+        ))
+        return sent, metrics.snapshot() if metrics.enabled else None
+    finally:
+        pool.close()
+        shard_log.close()
+
+
+def run_sharded(
+    leads: List[dict],
+    accounts: List[dict],
+    settings: Dict,
+    workers: int,
+    metrics: Optional[RunMetrics] = None
+) -> int:
+    """
+    Send leads from several processes. `leads` are dicts with "email" and
+    "full_name"; `settings` holds smtp_host, smtp_port, smtp_keepalive,
+    campaign_file, reply_to, delay, retry_max_attempts, retry_base_delay,
+    account_cooldown, quota_remaining ({EMAIL_USER: sends left}),
+    shard_log_dir and optionally domain_rate, domain_burst and domain_limits
+    (split evenly between the shards). Returns the number of
+    sends the workers reported; the results themselves are read back with
+    read_shard_logs(). Worker timings and counters are merged into metrics.
+    """
+    shards = split_shards(leads, accounts, workers)
+    if not shards:
+        return 0
+    os.makedirs(settings["shard_log_dir"], exist_ok=True)
+    settings = dict(settings, metrics_enabled=bool(metrics and metrics.enabled), shard_count=len(shards))
+
+    print(f"Running {len(shards)} shard workers...")
+    total = 0
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        futures = [
+            executor.submit(_run_shard, shard_id, shard_leads, shard_accounts, settings)
+            for shard_id, (shard_leads, shard_accounts) in enumerate(shards)
+        ]
+        for shard_id, future in enumerate(futures):
+            try:
+                sent, snapshot = future.result()
+            except Exception as e:
+                # Whatever that shard sent before failing is still in its log
+                print(f"Shard {shard_id} failed: {e}")
+                continue
+            total += sent
+            if metrics is not None:
+                metrics.merge(snapshot)
+    return total
+
+
+def read_shard_logs(shard_log_dir: str) -> Iterator[Tuple[str, str, str, str]]:
+    """Yield (sender, recipient, name, timestamp) from every shard log, including leftovers of crashed runs"""
+    for path in sorted(glob.glob(os.path.join(shard_log_dir, "sent_*.csv"))):
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield row["Sender Email"], row["Recipient Email"], row["Name"], row["Timestamp"]
+
+
+def clear_shard_logs(shard_log_dir: str) -> None:
+    for path in glob.glob(os.path.join(shard_log_dir, "sent_*.csv")):
+        os.remove(path)
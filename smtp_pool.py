@@ -0,0 +1,152 @@
+import smtplib
+import logging
+import threading
+import time
+from typing import List, Optional
+
+from run_metrics import NULL_METRICS, RunMetrics
+
+logger = logging.getLogger(__name__)
+
+# SMTP reply code a server uses when it is closing the transmission channel
+SERVICE_NOT_AVAILABLE = 421
+
+
+def _is_service_closing(error: Exception) -> bool:
+    """Check whether an SMTP error means the server dropped the session (421)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return any(code == SERVICE_NOT_AVAILABLE for code, _ in error.recipients.values())
+    return getattr(error, 'smtp_code', None) == SERVICE_NOT_AVAILABLE
+
+
+class SMTPConnectionPool:
+    """Keeps one authenticated SMTP session per sender account (keyed by EMAIL_USER)"""
+
+    def __init__(self, host: str, port: int, keepalive_interval: float = 30.0, metrics: Optional[RunMetrics] = None):
+        self.host = host
+        self.port = port
+        self.keepalive_interval = keepalive_interval
+        self.metrics = metrics or NULL_METRICS
+        self._sessions = {}    # EMAIL_USER -> smtplib.SMTP
+        self._last_used = {}   # EMAIL_USER -> monotonic timestamp
+        self._locks = {}       # EMAIL_USER -> threading.Lock
+        self._lock = threading.Lock()
+
+    def _account_lock(self, user: str) -> threading.Lock:
+        with self._lock:
+            if user not in self._locks:
+                self._locks[user] = threading.Lock()
+            return self._locks[user]
+
+    def _connect(self, account: dict) -> smtplib.SMTP:
+        """Open a new session: TCP connect, STARTTLS and AUTH"""
+        user = account['EMAIL_USER']
+        with self.metrics.phase("smtp_connect", account=user):
+            server = smtplib.SMTP(self.host, self.port)
+        try:
+            with self.metrics.phase("smtp_starttls", account=user):
+                server.starttls()
+            with self.metrics.phase("smtp_auth", account=user):
+                server.login(user, account['EMAIL_PASS'])
+        except Exception:
+            self._close_quietly(server)
+            raise
+        self.metrics.count("smtp_sessions", account=user)
+        logger.info(f"Opened SMTP session for {user}")
+        return server
+
+    @staticmethod
+    def _close_quietly(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _is_alive(self, server: smtplib.SMTP, user: str) -> bool:
+        """NOOP keepalive probe"""
+        try:
+            with self.metrics.phase("smtp_noop", account=user):
+                code, _ = server.noop()
+            return code == 250
+        except Exception:
+            return False
+
+    def _discard(self, user: str) -> None:
+        server = self._sessions.pop(user, None)
+        self._last_used.pop(user, None)
+        if server is not None:
+            self._close_quietly(server)
+
+    def _get_session(self, account: dict) -> smtplib.SMTP:
+        user = account['EMAIL_USER']
+        server = self._sessions.get(user)
+        if server is not None:
+            idle = time.monotonic() - self._last_used.get(user, 0.0)
+            if idle >= self.keepalive_interval and not self._is_alive(server, user):
+                logger.info(f"SMTP session for {user} went stale, reconnecting")
+                self._discard(user)
+                server = None
+        if server is None:
+            server = self._connect(account)
+            self._sessions[user] = server
+        return server
+
+    def _run(self, account: dict, operation):
+        """Run operation(server) on the account's session, reconnecting once if the server dropped it"""
+        user = account['EMAIL_USER']
+        with self._account_lock(user):
+            for attempt in range(2):
+                server = self._get_session(account)
+                try:
+                    with self.metrics.phase("smtp_data", account=user):
+                        result = operation(server)
+                    self._last_used[user] = time.monotonic()
+                    return result
+                except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                    error = e
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                    if not _is_service_closing(e):
+                        # Session is still usable, the failure is about this message
+                        self._last_used[user] = time.monotonic()
+                        raise
+                    error = e
+                self._discard(user)
+                self.metrics.count("smtp_reconnects", account=user)
+                if attempt == 1:
+                    raise error
+                logger.warning(f"SMTP session for {user} was dropped ({error}), reconnecting")
+
+    def warm(self, account: dict) -> None:
+        """Open (or check) the account's session ahead of its first send"""
+        with self._account_lock(account['EMAIL_USER']):
+            self._get_session(account)
+
+    def send_message(self, account: dict, msg) -> None:
+        """Send an email.message.Message through the account's pooled session"""
+        self._run(account, lambda server: server.send_message(msg))
+
+    def sendmail(self, account: dict, from_addr: str, to_addrs, raw: bytes) -> None:
+        """Send an already serialized message through the account's pooled session"""
+        self._run(account, lambda server: server.sendmail(from_addr, to_addrs, raw))
+
+    def open_users(self) -> List[str]:
+        """Accounts that currently have a session"""
+        with self._lock:
+            return list(self._sessions)
+
+    def close(self, user: Optional[str] = None) -> None:
+        """Close one account's session, or every session when no user is given"""
+        with self._lock:
+            users = [user] if user else list(self._sessions)
+        for name in users:
+            with self._account_lock(name):
+                self._discard(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
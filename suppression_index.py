@@ -0,0 +1,163 @@
+import os
+import csv
+import sys
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+from dotenv import load_dotenv
+
+from lead_store import SENT_COLUMN, UNSUBSCRIBE_COLUMN, normalize_email
+from sent_log_archive import SentLogArchive, archive_for, sent_log_records
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipients (
+    email TEXT PRIMARY KEY,
+    sent_at TEXT,
+    sender TEXT,
+    unsubscribed INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID
+"""
+
+UPSERT_SENT = """
+INSERT INTO recipients (email, sent_at, sender) VALUES (?, ?, ?)
+ON CONFLICT(email) DO UPDATE SET
+    sent_at = COALESCE(recipients.sent_at, excluded.sent_at),
+    sender = COALESCE(recipients.sender, excluded.sender)
+"""
+
+UPSERT_UNSUBSCRIBED = """
+INSERT INTO recipients (email, unsubscribed) VALUES (?, 1)
+ON CONFLICT(email) DO UPDATE SET unsubscribed = 1
+"""
+
+
+class SuppressionIndex:
+    """
+    Persistent index of normalized recipient addresses that were already
+    emailed or have unsubscribed, shared across runs and lead files.
+
+    Supports `email in index` for the per-lead check in run().
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def __contains__(self, email: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM recipients WHERE email = ? AND (sent_at IS NOT NULL OR unsubscribed = 1)",
+                (normalize_email(email),)
+            ).fetchone()
+        return row is not None
+
+    def is_unsubscribed(self, email: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM recipients WHERE email = ? AND unsubscribed = 1",
+                (normalize_email(email),)
+            ).fetchone()
+        return row is not None
+
+    def mark_sent(self, email: str, sender: Optional[str] = None, sent_at: Optional[str] = None) -> None:
+        sent_at = sent_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._conn.execute(UPSERT_SENT, (normalize_email(email), sent_at, sender))
+            self._conn.commit()
+
+    def mark_sent_many(self, records: Iterable[Tuple[str, Optional[str], Optional[str]]]) -> int:
+        """Bulk upsert (email, sender, sent_at) records in one transaction"""
+        default_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [
+            (normalize_email(email), sent_at or default_time, sender)
+            for email, sender, sent_at in records
+            if normalize_email(email)
+        ]
+        with self._lock:
+            self._conn.executemany(UPSERT_SENT, rows)
+            self._conn.commit()
+        return len(rows)
+
+    def mark_unsubscribed_many(self, emails: Iterable[str]) -> int:
+        rows = [(normalize_email(email),) for email in emails if normalize_email(email)]
+        with self._lock:
+            self._conn.executemany(UPSERT_UNSUBSCRIBED, rows)
+            self._conn.commit()
+        return len(rows)
+
+    def import_sent_log(self, log_path: str, chunk_size: int = 10000, archive: Optional[SentLogArchive] = None) -> int:
+        """Import sender/recipient/timestamp history from logs/sent_emails.csv and, if given, its archived segments"""
+        imported = 0
+        chunk = []
+        for row in sent_log_records(log_path, archive):
+            chunk.append((row.get("Recipient Email", ""), row.get("Sender Email"), row.get("Timestamp")))
+            if len(chunk) >= chunk_size:
+                imported += self.mark_sent_many(chunk)
+                chunk = []
+        if chunk:
+            imported += self.mark_sent_many(chunk)
+        logger.info(f"Imported {imported} sent records from {log_path}" + (f" and {archive.directory}" if archive else ""))
+        return imported
+
+    def import_lead_flags(self, leads_path: str, chunk_size: int = 10000) -> Tuple[int, int]:
+        """Import massemail_email_sent / massemail_unsubscribe flags from a lead file"""
+        sent, unsubscribed = [], []
+        sent_total = unsubscribed_total = 0
+        with open(leads_path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                email = row.get("email", "")
+                if row.get(SENT_COLUMN) == "1":
+                    sent.append((email, None, None))
+                if row.get(UNSUBSCRIBE_COLUMN) == "1":
+                    unsubscribed.append(email)
+                if len(sent) >= chunk_size:
+                    sent_total += self.mark_sent_many(sent)
+                    sent = []
+                if len(unsubscribed) >= chunk_size:
+                    unsubscribed_total += self.mark_unsubscribed_many(unsubscribed)
+                    unsubscribed = []
+        sent_total += self.mark_sent_many(sent)
+        unsubscribed_total += self.mark_unsubscribed_many(unsubscribed)
+        logger.info(f"Imported {sent_total} sent and {unsubscribed_total} unsubscribed flags from {leads_path}")
+        return sent_total, unsubscribed_total
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv):
+    """python suppression_index.py import-sent logs/sent_emails.csv | import-leads other_leads.csv"""
+    if len(argv) < 2 or argv[0] not in ("import-sent", "import-leads"):
+        print("Usage: python suppression_index.py import-sent <sent_log.csv> | import-leads <leads.csv> [...]")
+        return 1
+
+    load_dotenv()
+    index = SuppressionIndex(os.getenv("SUPPRESSION_DB", "logs/suppression.db"))
+    try:
+        for path in argv[1:]:
+            if argv[0] == "import-sent":
+                # Rows already rotated out of the bot's sent log are imported from the archive
+                print(f"{path}: {index.import_sent_log(path, archive=archive_for(path))} sent records imported")
+            else:
+                sent, unsubscribed = index.import_lead_flags(path)
+                print(f"{path}: {sent} sent and {unsubscribed} unsubscribed flags imported")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Callable, Optional
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_FILE = 'logs/wbl_token.json'
+
+
+def decode_expiry(token: str) -> Optional[float]:
+    """Read the exp claim without verifying the signature. Returns 0 when the token can't be decoded."""
+    try:
+        payload = jwt.decode(token, options={"verify_signature": False})
+    except Exception as e:
+        logger.warning(f"Could not decode token to check expiry: {e}")
+        return 0.0
+    exp = payload.get('exp')
+    return float(exp) if exp else None
+
+
+class TokenManager:
+    """
+    Holds the WBL API token and refreshes it before it expires.
+
+    The decoded expiry is cached with the token, refreshes happen
+    `refresh_margin` seconds ahead of expiry, and tokens are stored atomically
+    in a dedicated cache file (not .env). Concurrent callers share one refresh:
+    the first one logs in, the others wait and reuse its token.
+    """
+
+    def __init__(
+        self,
+        login: Callable[[], Optional[str]],
+        initial_token: str = '',
+        cache_file: str = TOKEN_CACHE_FILE,
+        refresh_margin: float = 300.0
+    ):
+        self._login = login
+        self.cache_file = cache_file
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._token = ''
+        self._expires_at: Optional[float] = 0.0
+
+        cached = self._read_cache()
+        if cached and not self._expiring(cached[1]):
+            self._token, self._expires_at = cached
+        elif initial_token:
+            self._set(initial_token, persist=False)
+
+    @property
+    def token(self) -> str:
+        """Current token without refreshing"""
+        return self._token
+
+    def _expiring(self, expires_at: Optional[float]) -> bool:
+        # None means the token carries no exp claim and never expires
+        if expires_at is None:
+            return False
+        return time.time() >= expires_at - self.refresh_margin
+
+    def is_expired(self) -> bool:
+        if not self._token:
+            return True
+        return self._expires_at is not None and time.time() > self._expires_at
+
+    def needs_refresh(self) -> bool:
+        return not self._token or self._expiring(self._expires_at)
+
+    def get_token(self) -> str:
+        """Valid token, refreshed first if it is missing or close to expiry"""
+        if self.needs_refresh():
+            self.refresh()
+        return self._token
+
+    def refresh(self, stale_token: Optional[str] = None) -> bool:
+        """
+        Log in again unless someone else already replaced the token.
+
+        Pass the token a request was rejected with as `stale_token`; if the
+        current token differs, another caller has refreshed it already.
+        """
+        with self._lock:
+            if stale_token is not None and self._token and self._token != stale_token and not self.is_expired():
+                return True
+            if stale_token is None and self._token and not self._expiring(self._expires_at):
+                return True
+
+            # Another process may have refreshed the shared cache file meanwhile
+            cached = self._read_cache()
+            if cached and cached[0] != stale_token and not self._expiring(cached[1]):
+                self._token, self._expires_at = cached
+                return True
+
+            token = self._login()
+            if not token:
+                return False
+            self._set(token)
+            return True
+
+    def _set(self, token: str, persist: bool = True) -> None:
+        self._token = token
+        self._expires_at = decode_expiry(token)
+        if persist:
+            self._write_cache()
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            return data['access_token'], data.get('expires_at')
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_cache(self) -> None:
+        directory = os.path.dirname(self.cache_file)
+        temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"access_token": self._token, "expires_at": self._expires_at}, f)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            logger.error(f"Failed to save token cache: {e}")
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+from array import array
+from typing import Iterable, Optional
+from dotenv import load_dotenv
+
+from lead_store import normalize_email
+
+logger = logging.getLogger(__name__)
+
+UNSUBSCRIBE_CACHE_FILE = "logs/unsubscribes.bin"
+
+
+def _fingerprint(email: str) -> int:
+    """64-bit hash of the normalized address; 8 bytes on disk instead of the address itself"""
+    return int.from_bytes(hashlib.blake2b(normalize_email(email).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class UnsubscribeCache:
+    """
+    Local copy of the addresses that unsubscribed on the WBL site.
+
+    Addresses are kept as 64-bit fingerprints: an append-only file of packed
+    integers plus a JSON sidecar with the sync cursor and ETag, so each sync
+    only fetches what changed since the last one. `email in cache` is a set
+    lookup.
+    """
+
+    def __init__(self, path: str = UNSUBSCRIBE_CACHE_FILE):
+        self.path = path
+        self.state_path = os.path.splitext(path)[0] + ".json"
+        self.cursor: Optional[str] = None
+        self.etag: Optional[str] = None
+        self.synced_at: Optional[float] = None
+        self._fingerprints = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        values = array('Q')
+        # A crash mid-append can leave a partial record at the end
+        values.frombytes(data[:len(data) - len(data) % values.itemsize])
+        self._fingerprints = set(values)
+
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        self.cursor = state.get("cursor")
+        self.etag = state.get("etag")
+        self.synced_at = state.get("synced_at")
+
+    def __contains__(self, email: str) -> bool:
+        return _fingerprint(email) in self._fingerprints
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def add(self, emails: Iterable[str]) -> int:
+        """Add addresses; returns how many were new"""
+        with self._lock:
+            new = array('Q')
+            for email in emails:
+                if not normalize_email(email):
+                    continue
+                fingerprint = _fingerprint(email)
+                if fingerprint not in self._fingerprints:
+                    self._fingerprints.add(fingerprint)
+                    new.append(fingerprint)
+            if new:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, 'ab') as f:
+                    new.tofile(f)
+            return len(new)
+
+    def save_state(self, cursor: Optional[str], etag: Optional[str]) -> None:
+        """Record where the last sync stopped (call after the addresses are added)"""
+        with self._lock:
+            self.cursor, self.etag, self.synced_at = cursor, etag, time.time()
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_file = self.state_path + ".tmp"
+            with open(temp_file, 'w') as f:
+                json.dump({"cursor": cursor, "etag": etag, "synced_at": self.synced_at, "count": len(self._fingerprints)}, f)
+            os.replace(temp_file, self.state_path)
+
+    def reset(self) -> None:
+        """Forget everything, for a full resync when the server no longer knows our cursor"""
+        with self._lock:
+            self._fingerprints = set()
+            self.cursor = self.etag = self.synced_at = None
+            for path in (self.path, self.state_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def main(argv):
+    """python unsubscribe_cache.py sync | status"""
+    if not argv or argv[0] not in ("sync", "status"):
+        print("Usage: python unsubscribe_cache.py sync | status")
+        return 1
+
+    load_dotenv()
+    cache = UnsubscribeCache(os.getenv("UNSUBSCRIBE_CACHE_FILE", UNSUBSCRIBE_CACHE_FILE))
+    if argv[0] == "sync":
+        from job_activity_logger import JobActivityLogger
+        api_logger = JobActivityLogger()
+        try:
+            added = api_logger.sync_unsubscribes(cache)
+        finally:
+            api_logger.close()
+        if added is None:
+            print("Unsubscribe sync failed")
+            return 1
+        print(f"{added} new unsubscribes")
+
+    synced = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cache.synced_at)) if cache.synced_at else "never"
+    print(f"{len(cache)} unsubscribed addresses, last synced {synced}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))